@@ -0,0 +1,108 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import MySQLdb as mdb
+
+from bulk_insert import bulk_insert
+
+# Compare ways to insert many rows into a table like writers:
+#   row:         one cur.execute() per row, like create_table.py.
+#   executemany: cur.executemany(), multi-row statements of 64 KB.
+#   bulk:        bulk_insert(), statements up to max_allowed_packet.
+# Each commits every --commit-rows rows.
+#
+# Usage, against a local MySQL or MariaDB:
+#   python bench_bulk_insert.py --rows 100000 1000000
+
+_now = getattr(time, 'perf_counter', time.time)
+
+
+def make_rows(count):
+    for i in range(count):
+        yield ('Writer {}'.format(i), i % 100)
+
+
+def create_table(con):
+    cur = con.cursor()
+    cur.execute('drop table if exists bench_writers')
+    cur.execute('create table bench_writers(id int primary key \
+            auto_increment, name varchar(25), age int) engine=innodb \
+            default charset utf8')
+    cur.close()
+
+
+def insert_row(con, count, commit_rows):
+    cur = con.cursor()
+    for i, row in enumerate(make_rows(count), 1):
+        cur.execute('insert into bench_writers(name, age) values(%s, %s)',
+                    row)
+        if i % commit_rows == 0:
+            con.commit()
+    con.commit()
+    cur.close()
+
+
+def insert_executemany(con, count, commit_rows):
+    cur = con.cursor()
+    rows = make_rows(count)
+    while True:
+        batch = [row for _, row in zip(range(commit_rows), rows)]
+        if not batch:
+            break
+        cur.executemany(
+            'insert into bench_writers(name, age) values(%s, %s)', batch)
+        con.commit()
+    cur.close()
+
+
+def insert_bulk(con, count, commit_rows):
+    bulk_insert(con, 'bench_writers', ['name', 'age'], make_rows(count),
+                commit_rows=commit_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark multi-row inserts.')
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[100000, 1000000])
+    parser.add_argument('--commit-rows', type=int, default=10000)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--passwd', default='chopin')
+    parser.add_argument('--db', default='test')
+    args = parser.parse_args()
+
+    con = mdb.connect(args.host, args.user, args.passwd, args.db,
+                      charset='utf8')
+    cur = con.cursor()
+    cur.execute('select @@max_allowed_packet')
+    print('max_allowed_packet: {} bytes'.format(cur.fetchone()[0]))
+    cur.close()
+
+    print('{:<12} {:>9} {:>10} {:>12} {:>9}'.format(
+        'case', 'rows', 'seconds', 'rows/s', 'speedup'))
+    for count in args.rows:
+        base = None
+        for name, insert in (('row', insert_row),
+                             ('executemany', insert_executemany),
+                             ('bulk', insert_bulk)):
+            create_table(con)
+            start = _now()
+            insert(con, count, args.commit_rows)
+            elapsed = _now() - start
+            if base is None:
+                base = elapsed
+            print('{:<12} {:>9} {:>10.2f} {:>12.0f} {:>9.1f}'.format(
+                name, count, elapsed, count / elapsed, base / elapsed))
+
+    cur = con.cursor()
+    cur.execute('drop table bench_writers')
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
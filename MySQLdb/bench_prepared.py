@@ -0,0 +1,104 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import MySQLdb as mdb
+
+from server_prepared import PreparedStatements
+
+# Compare ways to execute one query many times with different args:
+#   text:     cur.execute(), the args escaped into the query, one round trip.
+#   prepared: PreparedStatements.execute(), prepare once, then set and
+#             execute, two round trips.
+# For a select by primary key and an update by primary key, on a table of
+# --rows rows.
+#
+# Usage, against a local MySQL or MariaDB:
+#   python bench_prepared.py --executions 10000
+
+_now = getattr(time, 'perf_counter', time.time)
+
+SELECT = 'select name, age from bench_writers where id = %s'
+UPDATE = 'update bench_writers set age = %s where id = %s'
+
+
+def create_table(con, rows):
+    cur = con.cursor()
+    cur.execute('drop table if exists bench_writers')
+    cur.execute('create table bench_writers(id int primary key \
+            auto_increment, name varchar(25), age int) engine=innodb \
+            default charset utf8')
+    cur.executemany('insert into bench_writers(name, age) values(%s, %s)',
+                    [('Writer {}'.format(i), i % 100) for i in range(rows)])
+    con.commit()
+    cur.close()
+
+
+def make_args(query, count, rows):
+    for i in range(count):
+        if query == SELECT:
+            yield (i % rows + 1,)
+        else:
+            yield (i % 100, i % rows + 1)
+
+
+def run_text(con, query, count, rows):
+    cur = con.cursor()
+    for args in make_args(query, count, rows):
+        cur.execute(query, args)
+        cur.fetchall()
+    con.commit()
+    cur.close()
+
+
+def run_prepared(con, query, count, rows):
+    statements = PreparedStatements(con)
+    cur = con.cursor()
+    for args in make_args(query, count, rows):
+        statements.execute(query, args, cur)
+        cur.fetchall()
+    con.commit()
+    cur.close()
+    statements.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark server side prepared statements.')
+    parser.add_argument('--executions', type=int, default=10000)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--passwd', default='chopin')
+    parser.add_argument('--db', default='test')
+    args = parser.parse_args()
+
+    con = mdb.connect(args.host, args.user, args.passwd, args.db,
+                      charset='utf8')
+    create_table(con, args.rows)
+
+    print('{:<8} {:<10} {:>10} {:>10} {:>12} {:>9}'.format(
+        'query', 'case', 'executions', 'seconds', 'executions/s',
+        'speedup'))
+    for query_name, query in (('select', SELECT), ('update', UPDATE)):
+        base = None
+        for name, run in (('text', run_text), ('prepared', run_prepared)):
+            start = _now()
+            run(con, query, args.executions, args.rows)
+            elapsed = _now() - start
+            if base is None:
+                base = elapsed
+            print('{:<8} {:<10} {:>10} {:>10.2f} {:>12.0f} {:>9.2f}'.format(
+                query_name, name, args.executions, elapsed,
+                args.executions / elapsed, base / elapsed))
+
+    cur = con.cursor()
+    cur.execute('drop table bench_writers')
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import MySQLdb as mdb
+
+# Insert many rows with multi-row statements:
+#   insert into writers(name) values ("Jack London"),("Emile Zola"),...
+# instead of one statement, one round trip, per row. Each statement is made
+# as large as max_allowed_packet allows, and the transaction is committed
+# every commit_rows rows, so the undo log and the locks don't grow with the
+# number of rows.
+#
+#   with BulkInserter(con, 'writers', ['name']) as inserter:
+#       for name in names:
+#           inserter.add((name,))
+#
+#   bulk_insert(con, 'writers', ['name'], ((name,) for name in names))
+#
+# cursor.executemany() also makes multi-row statements of an insert, but
+# they are limited to 64 KB and all the rows are in one transaction.
+
+# Room left in a packet for its header and the command byte.
+_PACKET_MARGIN = 1024
+
+
+class BulkInserter(object):
+    """Insert rows into a table in multi-row statements.
+
+    con: A MySQLdb connection, autocommit off.
+    table: Name of the table.
+    columns: Names of the columns given in each row.
+    commit_rows: Number of rows per transaction.
+    max_packet: Max size of a statement in bytes, max_allowed_packet of the
+    server by default.
+
+    The rows are buffered until a statement is full. On an error, the rows
+    since the last commit are rolled back, the ones committed before stay.
+    """
+
+    def __init__(self, con, table, columns, commit_rows=10000,
+                 max_packet=None):
+        self._con = con
+        self._cur = con.cursor()
+        if max_packet is None:
+            self._cur.execute('select @@max_allowed_packet')
+            max_packet = int(self._cur.fetchone()[0])
+        self._max_size = max_packet - _PACKET_MARGIN
+        self._commit_rows = commit_rows
+
+        self._prefix = ('insert into {} ({}) values '.format(
+            table, ','.join(columns))).encode('utf-8')
+        self._values = []  # Literals of the buffered rows.
+        self._size = len(self._prefix)  # Size of the statement so far.
+        self._uncommitted = 0  # Rows sent since the last commit.
+
+        self.rows = 0  # Rows committed.
+        self.statements = 0
+        self.commits = 0
+
+    def add(self, row):
+        value = self._literal(row)
+        # One more byte for the comma.
+        if self._values and self._size + 1 + len(value) > self._max_size:
+            self._execute()
+        self._values.append(value)
+        self._size += 1 + len(value)
+        if self._uncommitted + len(self._values) >= self._commit_rows:
+            self._execute()
+            self.commit()
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        # Send the buffered rows and commit.
+        if self._values:
+            self._execute()
+        if self._uncommitted:
+            self.commit()
+
+    def commit(self):
+        self._con.commit()
+        self.rows += self._uncommitted
+        self._uncommitted = 0
+        self.commits += 1
+
+    def rollback(self):
+        self._values = []
+        self._size = len(self._prefix)
+        self._uncommitted = 0
+        self._con.rollback()
+
+    def close(self):
+        self._cur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None:
+                self.flush()
+            else:
+                self.rollback()
+        except BaseException:
+            if exc_type is None:
+                self.rollback()
+            raise
+        finally:
+            self.close()
+
+    def _literal(self, row):
+        # "(v1,v2,...)", the values escaped by the connection.
+        return b'(' + b','.join(self._con.literal(v) for v in row) + b')'
+
+    def _execute(self):
+        query = self._prefix + b','.join(self._values)
+        try:
+            self._cur.execute(query)
+        except mdb.Error:
+            self.rollback()
+            raise
+        self._uncommitted += len(self._values)
+        self._values = []
+        self._size = len(self._prefix)
+        self.statements += 1
+
+
+def bulk_insert(con, table, columns, rows, commit_rows=10000,
+                max_packet=None):
+    """Insert an iterable of rows, return the number of rows inserted."""
+
+    with BulkInserter(con, table, columns, commit_rows,
+                      max_packet) as inserter:
+        inserter.extend(rows)
+    return inserter.rows
+
+
+if __name__ == '__main__':
+    con = mdb.connect('localhost', 'root', 'chopin', 'test',
+                      charset='utf8')
+    cur = con.cursor()
+    cur.execute('drop table if exists writers')
+    cur.execute('create table writers(id int primary key auto_increment,\
+            name varchar(25)) engine=innodb default charset utf8')
+
+    names = ['Jack London', 'Honore de Balzac', 'Lion Feuchtwanger',
+             'Emile Zola', 'Truman Capote', u'曹雪芹']
+    count = bulk_insert(con, 'writers', ['name'],
+                        ((names[i % len(names)],) for i in range(10000)),
+                        commit_rows=4000)
+    print('Rows inserted:', count)
+    con.close()
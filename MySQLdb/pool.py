@@ -0,0 +1,320 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import collections
+import functools
+import threading
+import time
+
+import MySQLdb as mdb
+
+# A pool of MySQLdb connections shared by threads. Opening a connection
+# costs a TCP handshake and an authentication, more than a short query.
+#
+#   pool = ConnectionPool(functools.partial(
+#       mdb.connect, 'localhost', 'root', 'chopin', 'test'))
+#
+#   with pool.connection() as con:
+#       cur = con.cursor()
+#       cur.execute('insert into writers(name) values("Jack London")')
+#   # Committed (or rolled back on exception) and given back to the pool.
+
+_now = getattr(time, 'monotonic', time.time)
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class _Entry(object):
+    __slots__ = ('con', 'created', 'used', 'clean')
+
+    def __init__(self, con):
+        self.con = con
+        self.created = self.used = _now()
+        self.clean = True  # No transaction open.
+
+
+class PooledConnection(object):
+    """A connection borrowed from the pool.
+
+    Used like a MySQLdb connection. close() gives it back to the pool, any
+    transaction left open is rolled back. As a context manager, the
+    transaction is committed, or rolled back on exception, like `with con:`,
+    then the connection is given back.
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def close(self):
+        if self._entry is not None:
+            entry, self._entry = self._entry, None
+            self._pool._release(entry)
+
+    def __getattr__(self, name):
+        if self._entry is None:
+            raise PoolError('The connection has been given back to the pool.')
+        return getattr(self._entry.con, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self._entry is None:
+            return
+        try:
+            if exc_type is None:
+                self._entry.con.commit()
+            else:
+                self._entry.con.rollback()
+            # Nothing to roll back any more.
+            self._entry.clean = True
+        finally:
+            self.close()
+
+    def __del__(self):
+        # Not given back, e.g. an exception before close(). The garbage
+        # collector may run this in a thread holding the lock of the pool,
+        # the lock is reentrant for that.
+        self.close()
+
+
+class ConnectionPool(object):
+    """Pool of connections, thread-safe.
+
+    connect: Function returning a new connection, e.g. a partial of
+    mdb.connect().
+    min_size: Connections opened at once and kept open. One closed because
+    it failed a ping or reached max_lifetime is replaced right away.
+    max_size: Max number of connections, in use and idle.
+    timeout: Seconds connection() waits for a connection when max_size are
+    in use, PoolTimeout is raised then. None to wait forever.
+    max_lifetime: Seconds after which a connection is closed and replaced,
+    e.g. to pick up server side settings or to balance between servers.
+    None for no limit.
+    ping_interval: A connection idle for longer than this is checked with a
+    ping before being handed out, 0 to always check it.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30.0,
+                 max_lifetime=3600.0, ping_interval=0.0):
+        if min_size > max_size:
+            raise ValueError('min_size is larger than max_size.')
+
+        self._connect = connect
+        self._min_size = min_size
+        self._max_size = max_size
+        self._timeout = timeout
+        self._max_lifetime = max_lifetime
+        self._ping_interval = ping_interval
+
+        # Reentrant, see PooledConnection.__del__().
+        self._cond = threading.Condition(threading.RLock())
+        # _Entry of the idle connections, the most recently used at right.
+        self._idle = collections.deque()
+        self._size = 0  # Connections open or being opened.
+        self._closed = False
+
+        self._stats = collections.Counter()
+        self._wait_time = 0.0
+
+        for _ in range(min_size):
+            with self._cond:
+                self._size += 1
+            self._idle.append(self._open())
+
+    def connection(self, timeout=-1):
+        """Borrow a connection, return a PooledConnection.
+
+        timeout: Overrides the timeout of the pool if not -1.
+        """
+
+        if timeout == -1:
+            timeout = self._timeout
+
+        while True:
+            entry = self._acquire(timeout)
+            if entry is None:
+                # A slot is reserved for a new connection.
+                try:
+                    entry = self._open()
+                except BaseException:
+                    self._forget()
+                    raise
+            elif not self._validate(entry):
+                self._discard(entry)
+                continue
+
+            self._count('borrowed')
+            # Statements may be run until it's given back, a new connection
+            # included.
+            entry.clean = False
+            return PooledConnection(self, entry)
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'wait_time': self._wait_time,
+            }
+            for name in ('created', 'closed', 'borrowed', 'waits',
+                         'timeouts', 'ping_failures', 'recycled',
+                         'rollback_failures'):
+                stats[name] = self._stats[name]
+        return stats
+
+    def close(self):
+        # Close the idle connections, the ones in use are closed when they
+        # are given back.
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _acquire(self, timeout):
+        # Return an idle connection, or None if a new one may be opened.
+        deadline = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError('The pool is closed.')
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self._max_size:
+                    self._size += 1
+                    return None
+
+                if deadline is None:
+                    self._stats['waits'] += 1
+                    start = _now()
+                    if timeout is not None:
+                        deadline = start + timeout
+                remaining = None
+                if timeout is not None:
+                    remaining = deadline - _now()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        self._wait_time += _now() - start
+                        raise PoolTimeout(
+                            'No connection available in {} seconds.'.format(
+                                timeout))
+                self._cond.wait(remaining)
+                self._wait_time += _now() - start
+                start = _now()
+
+    def _open(self):
+        entry = _Entry(self._connect())
+        self._count('created')
+        return entry
+
+    def _validate(self, entry):
+        now = _now()
+        if (self._max_lifetime is not None and
+                now - entry.created > self._max_lifetime):
+            self._count('recycled')
+            return False
+        if now - entry.used >= self._ping_interval:
+            try:
+                entry.con.ping()
+            except mdb.Error:
+                self._count('ping_failures')
+                return False
+        return True
+
+    def _release(self, entry):
+        entry.used = _now()
+        if not entry.clean:
+            # End the transaction left open, its locks and snapshot would
+            # leak to the next borrower.
+            try:
+                entry.con.rollback()
+            except mdb.Error:
+                self._count('rollback_failures')
+                self._discard(entry)
+                return
+            entry.clean = True
+
+        with self._cond:
+            if not self._closed:
+                self._idle.append(entry)
+                self._cond.notify()
+                return
+        self._discard(entry)
+
+    def _discard(self, entry):
+        try:
+            entry.con.close()
+        except mdb.Error:
+            pass
+        self._count('closed')
+        self._forget()
+        self._fill()
+
+    def _fill(self):
+        # Open connections again up to min_size. If it fails, they are
+        # opened on demand by connection().
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self._min_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._open()
+            except mdb.Error:
+                self._forget()
+                return
+            with self._cond:
+                if not self._closed:
+                    self._idle.appendleft(entry)
+                    self._cond.notify()
+                    continue
+            self._discard(entry)
+            return
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _forget(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+
+if __name__ == '__main__':
+    pool = ConnectionPool(functools.partial(
+        mdb.connect, 'localhost', 'root', 'chopin', 'test'),
+        min_size=2, max_size=4, timeout=5.0)
+
+    def work(i):
+        with pool.connection() as con:
+            cur = con.cursor()
+            cur.execute('select * from writers where id = %s', (i % 6 + 1,))
+            cur.fetchone()
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(pool.stats())
+    pool.close()
@@ -0,0 +1,193 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import collections
+import re
+
+import MySQLdb as mdb
+
+# Statements prepared on the server.
+# cur.execute(query, args) in prepared_statements.py puts the escaped args
+# into the query on the client, the server parses and plans each query
+# again. Here a query is prepared once per connection and executed with
+# its args:
+#   prepare _stmt_1 from 'update writers set name = ? where id = ?'
+#   set @_p1 = 'Guy de Maupasant', @_p2 = '4'
+#   execute _stmt_1 using @_p1, @_p2
+#
+#   statements = PreparedStatements(con)
+#   cur = statements.execute('update writers set name = %s where id = %s',
+#                            ('Guy de Maupasant', '4'))
+#
+# MySQLdb has no API for the binary protocol (mysql_stmt_prepare), the SQL
+# statements above do the same on the server. The args are still sent as
+# text, and set and execute are two round trips per execution, against one
+# for cur.execute(): it only pays off when parsing and planning the query
+# costs more than a round trip. Measure with bench_prepared.py. For the
+# binary protocol, one round trip per execution, see Connection.prepare() in
+# asyncio_study/mysql_client.py.
+
+# Unknown prepared statement handler, e.g. after a reconnect.
+ER_UNKNOWN_STMT_HANDLER = 1243
+
+# %s, or %% for a literal %.
+_PLACEHOLDER_RE = re.compile(r'%[s%]')
+
+
+class PreparedStatements(object):
+    """Cache of the statements prepared on a connection, by query.
+
+    con: A MySQLdb connection, the statements belong to it.
+    max_statements: Max number of statements kept prepared, the least
+    recently used one is deallocated to prepare a new one. The server
+    limits them with max_prepared_stmt_count.
+
+    The queries use %s placeholders, like cur.execute().
+    """
+
+    def __init__(self, con, max_statements=64):
+        self._con = con
+        self._max_statements = max_statements
+        # Query -> (name, number of params), the most recently used last.
+        self._statements = collections.OrderedDict()
+        self._next_id = 1
+
+        self.hits = 0
+        self.prepares = 0
+        self.reprepares = 0  # Prepared again after the server lost them.
+        self.evictions = 0
+
+    def execute(self, query, args=(), cursor=None):
+        """Execute a query with args, return the cursor.
+
+        cursor: Cursor to execute it with, e.g. to fetch the rows of a
+        select, a new one by default.
+        """
+
+        if cursor is None:
+            cursor = self._con.cursor()
+        name, count = self._prepare(query)
+        try:
+            self._execute(cursor, name, count, args)
+        except mdb.Error as e:
+            if e.args[0] != ER_UNKNOWN_STMT_HANDLER:
+                raise
+            del self._statements[query]
+            self.reprepares += 1
+            name, count = self._prepare(query)
+            self._execute(cursor, name, count, args)
+        return cursor
+
+    def executemany(self, query, seq_args):
+        """Execute a query once per args, return the number of rows
+        affected.
+        """
+
+        cursor = self._con.cursor()
+        rowcount = 0
+        try:
+            for args in seq_args:
+                self.execute(query, args, cursor)
+                rowcount += cursor.rowcount
+        finally:
+            cursor.close()
+        return rowcount
+
+    def stats(self):
+        return {
+            'statements': len(self._statements),
+            'hits': self.hits,
+            'prepares': self.prepares,
+            'reprepares': self.reprepares,
+            'evictions': self.evictions,
+        }
+
+    def close(self):
+        # Deallocate the statements, to free them on the server while the
+        # connection stays open.
+        cursor = self._con.cursor()
+        try:
+            for name, _ in self._statements.values():
+                try:
+                    cursor.execute('deallocate prepare ' + name)
+                except mdb.Error:
+                    pass
+        finally:
+            self._statements.clear()
+            cursor.close()
+
+    def _prepare(self, query):
+        statement = self._statements.get(query)
+        if statement is not None:
+            self._statements[query] = self._statements.pop(query)
+            self.hits += 1
+            return statement
+
+        cursor = self._con.cursor()
+        try:
+            if len(self._statements) >= self._max_statements:
+                _, (old_name, _) = self._statements.popitem(last=False)
+                self.evictions += 1
+                try:
+                    cursor.execute('deallocate prepare ' + old_name)
+                except mdb.Error as e:
+                    if e.args[0] != ER_UNKNOWN_STMT_HANDLER:
+                        raise
+
+            count = [0]
+
+            def replace(match):
+                if match.group() == '%%':
+                    return '%'
+                count[0] += 1
+                return '?'
+
+            text = _PLACEHOLDER_RE.sub(replace, query)
+            name = '_stmt_{}'.format(self._next_id)
+            self._next_id += 1
+            cursor.execute('prepare {} from %s'.format(name), (text,))
+        finally:
+            cursor.close()
+
+        self.prepares += 1
+        statement = self._statements[query] = (name, count[0])
+        return statement
+
+    def _execute(self, cursor, name, count, args):
+        if len(args) != count:
+            raise mdb.ProgrammingError(
+                'The statement has {} parameters, {} given.'.format(
+                    count, len(args)))
+        if not count:
+            cursor.execute('execute ' + name)
+            return
+
+        params = ['@_p{}'.format(i) for i in range(1, count + 1)]
+        cursor.execute('set ' + ', '.join(p + ' = %s' for p in params),
+                       tuple(args))
+        cursor.execute('execute {} using {}'.format(name, ', '.join(params)))
+
+
+if __name__ == '__main__':
+    con = mdb.connect('localhost', 'root', 'chopin', 'test')
+    statements = PreparedStatements(con)
+
+    with con:
+        cur = statements.execute(
+            'update writers set name = %s where id = %s',
+            ('Guy de Maupasant', '4'))
+        print('Number of rows updated:', cur.rowcount)
+
+        count = statements.executemany(
+            'update writers set name = %s where id = %s',
+            [('Emile Zola', '4'), ('Truman Capote', '5')])
+        print('Number of rows updated:', count)
+
+        cur = statements.execute('select name from writers where id = %s',
+                                 (4,))
+        print(cur.fetchone()[0])
+
+    print(statements.stats())
+    statements.close()
+    con.close()
@@ -0,0 +1,97 @@
+# coding: utf-8
+
+from __future__ import print_function
+
+import MySQLdb as mdb
+import MySQLdb.cursors
+
+# Iterate over a large result set with bounded memory.
+# cur.fetchall(), and cur.fetchone() with the default cursor, read the whole
+# result into the client first (mysql_store_result). A server side cursor
+# (SSCursor, mysql_use_result) reads the rows from the connection as they
+# are fetched, batch_size rows at a time here.
+#
+#   for row in stream_rows(con, 'select * from writers'):
+#       print(row)
+#
+# The connection can't run another query before the whole result is read.
+# When the iteration stops early (break, exception, generator closed), the
+# rest of the rows are read and dropped, or the query is killed first if a
+# connection for it is given. Wrap the generator with contextlib.closing()
+# to release the connection as soon as the loop is left, instead of when the
+# generator is garbage collected.
+
+
+def stream_rows(con, query, args=None, batch_size=1000, dict_rows=False,
+                kill_connect=None):
+    """Execute a query and yield its rows.
+
+    batch_size: Number of rows fetched at once.
+    dict_rows: Yield dicts, like DictCursor, instead of tuples.
+    kill_connect: Function returning a new connection, used to kill the
+    query if the iteration stops early, instead of reading all the rows
+    left. E.g. a partial of mdb.connect().
+    """
+
+    if dict_rows:
+        cur = con.cursor(MySQLdb.cursors.SSDictCursor)
+    else:
+        cur = con.cursor(MySQLdb.cursors.SSCursor)
+
+    done = False
+    try:
+        cur.execute(query, args)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+        done = True
+    finally:
+        if not done:
+            _abandon(con, cur, batch_size, kill_connect)
+        cur.close()
+
+
+def _abandon(con, cur, batch_size, kill_connect):
+    if kill_connect is not None:
+        try:
+            other = kill_connect()
+            try:
+                other.cursor().execute('kill query %s', (con.thread_id(),))
+            finally:
+                other.close()
+        except mdb.Error:
+            # Read the rows then.
+            pass
+
+    try:
+        while cur.fetchmany(batch_size):
+            pass
+    except mdb.Error:
+        # The query was killed, or the connection failed already.
+        pass
+
+
+if __name__ == '__main__':
+    import contextlib
+
+    con = mdb.connect('localhost', 'root', 'chopin', 'test')
+
+    for row in stream_rows(con, 'select * from writers', batch_size=2):
+        print(row)
+
+    # Leave the loop early, the connection is usable again right after.
+    with contextlib.closing(stream_rows(con, 'select * from writers',
+                                        batch_size=2,
+                                        dict_rows=True)) as rows:
+        for row in rows:
+            print(row['id'], row['name'])
+            if row['id'] == 3:
+                break
+
+    cur = con.cursor()
+    cur.execute('select count(*) from writers')
+    print('Number of writers:', cur.fetchone()[0])
+    con.close()
@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import glob
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Benchmark the HTTP clients against the local server of http_server.py.
+# Each case, a client at a concurrency level and a body size, runs in its
+# own process, so the CPU time and the peak RSS are its own. Report the
+# requests per second, the latency percentiles, the CPU time and the peak
+# RSS, and optionally write them as JSON to compare between versions.
+#
+# http_client_v8_pool.py and later are imported and their ClientSession is
+# used with `concurrency` coroutines sending requests in a loop.
+# http_client_v1.py ... http_client_v6_streams.py run a request when they are
+# imported, to localhost:8000, and read the response until the connection is
+# closed. They are run as scripts, `concurrency` processes at a time, against
+# a server closing the connections on port 8000. Their latency includes the
+# start of the interpreter. http_client_v7_request.py is skipped, it
+# requests en.cppreference.com.
+#
+# A client that can't run here, e.g. v6 on Python 3.10+ which removed the loop
+# argument of asyncio.open_connection(), is reported as failed with the
+# error, instead of 0 requests per second.
+#
+# Usage:
+#   python benchmark/bench_http_client.py --clients v8 v13 v20 \
+#       --concurrency 1 10 100 --size 1024 65536 --json results.json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CLIENT_DIR = os.path.join(HERE, os.pardir)
+
+SCRIPT_PORT = 8000  # Hard coded in the script clients.
+SKIPPED = {
+    'v7': 'requests en.cppreference.com:80',
+}
+
+MB = 1024 * 1024
+
+
+def find_clients():
+    # {'v1': 'http_client_v1', 'v8': 'http_client_v8_pool', ...}
+    clients = {}
+    for path in glob.glob(os.path.join(CLIENT_DIR, 'http_client_v*.py')):
+        module = os.path.splitext(os.path.basename(path))[0]
+        version = module[len('http_client_'):].split('_')[0]
+        clients[version] = module
+    return dict(sorted(clients.items(), key=lambda item: int(item[0][1:])))
+
+
+def is_script(version):
+    return int(version[1:]) <= 7
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def peak_rss(who):
+    # Bytes, None if unknown.
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def cpu_time(who):
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def summarize(latencies, errors, elapsed, cpu, rss):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed': elapsed,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'p999': percentile(latencies, 99.9),
+        'max': latencies[-1] if latencies else 0.0,
+        'cpu_time': cpu,
+        'peak_rss': rss,
+    }
+
+
+# Cases, run in a child process.
+
+class CaseError(Exception):
+    # The client can't run, the message tells why.
+    pass
+
+
+def describe(exc):
+    return '{}: {}'.format(type(exc).__name__, exc)
+
+
+async def run_workers(concurrency, requests, request):
+    # Call request() `requests` times from `concurrency` coroutines.
+    # Raise CaseError if they all fail.
+    latencies = []
+    errors = 0
+    last_error = None
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors, last_error
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                await request()
+            except Exception as exc:
+                errors += 1
+                last_error = exc
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    if errors and not latencies:
+        raise CaseError('all {} requests failed, {}'.format(
+            errors, describe(last_error)))
+    return latencies, errors
+
+
+def run_module_case(module_name, concurrency, requests, size, port):
+    sys.path.insert(0, CLIENT_DIR)
+    try:
+        module = importlib.import_module(module_name)
+    except Exception as exc:
+        raise CaseError('import failed, ' + describe(exc))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    session = module.ClientSession(loop)
+    url = '/?size={}'.format(size)
+
+    async def request():
+        # v8 returns the body, the later versions a response.
+        resp = await session.get(url, '127.0.0.1', port)
+        if hasattr(resp, 'read'):
+            await resp.read()
+
+    # Check that the client works and open the connections first.
+    try:
+        loop.run_until_complete(request())
+    except Exception as exc:
+        raise CaseError(describe(exc))
+    loop.run_until_complete(run_workers(concurrency, concurrency, request))
+
+    cpu = cpu_time(resource.RUSAGE_SELF if resource else None)
+    start = time.perf_counter()
+    latencies, errors = loop.run_until_complete(
+        run_workers(concurrency, requests, request))
+    elapsed = time.perf_counter() - start
+    cpu = cpu_time(resource.RUSAGE_SELF if resource else None) - cpu
+
+    session.close()
+    loop.close()
+    return summarize(latencies, errors, elapsed, cpu,
+                     peak_rss(resource.RUSAGE_SELF if resource else None))
+
+
+def run_script_case(module_name, concurrency, requests, timeout=10.0):
+    path = os.path.join(CLIENT_DIR, module_name + '.py')
+
+    # Run it once to check that it works here, with its error if not.
+    try:
+        probe = subprocess.run([sys.executable, path], cwd=CLIENT_DIR,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise CaseError('timed out after {} s'.format(timeout))
+    if probe.returncode != 0:
+        raise CaseError('exited with {}, {}'.format(
+            probe.returncode, last_line(probe.stderr)))
+
+    async def request():
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, path, cwd=CLIENT_DIR,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            code = await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise
+        if code != 0:
+            raise RuntimeError('{} exited with {}'.format(module_name, code))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    cpu = cpu_time(resource.RUSAGE_CHILDREN if resource else None)
+    start = time.perf_counter()
+    latencies, errors = loop.run_until_complete(
+        run_workers(concurrency, requests, request))
+    elapsed = time.perf_counter() - start
+    cpu = cpu_time(resource.RUSAGE_CHILDREN if resource else None) - cpu
+    loop.close()
+    # The peak RSS of the largest client process.
+    return summarize(latencies, errors, elapsed, cpu,
+                     peak_rss(resource.RUSAGE_CHILDREN if resource else None))
+
+
+def run_case(args):
+    clients = find_clients()
+    version, concurrency, size = args.case
+    concurrency, size = int(concurrency), int(size)
+    try:
+        if is_script(version):
+            result = run_script_case(clients[version], concurrency,
+                                     args.script_requests)
+        else:
+            result = run_module_case(clients[version], concurrency,
+                                     args.requests, size, args.port)
+    except CaseError as exc:
+        result = {'failed': str(exc)}
+    print(json.dumps(result))
+
+
+def last_line(output):
+    # Last line of the output of a process, e.g. the exception of a
+    # traceback.
+    lines = output.decode(errors='replace').strip().splitlines()
+    return lines[-1] if lines else 'no output'
+
+
+# Driver, run in the parent process.
+
+def start_server(port, size, delay, close=False):
+    command = [sys.executable, os.path.join(HERE, 'http_server.py'),
+               '--port', str(port), '--size', str(size),
+               '--delay', str(delay)]
+    if close:
+        command.append('--close')
+    server = subprocess.Popen(command, stdout=subprocess.PIPE)
+    # Wait until it's listening.
+    if not server.stdout.readline().startswith(b'Serving on'):
+        server.kill()
+        raise RuntimeError('The server on port {} failed to start.'.format(
+            port))
+    return server
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait()
+
+
+def spawn_case(args, version, concurrency, size):
+    command = [sys.executable, os.path.abspath(__file__),
+               '--case', version, str(concurrency), str(size),
+               '--requests', str(args.requests),
+               '--script-requests', str(args.script_requests),
+               '--port', str(args.port)]
+    output = subprocess.run(command, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    if output.returncode != 0:
+        return {'failed': 'case exited with {}, {}'.format(
+            output.returncode, last_line(output.stderr))}
+    return json.loads(output.stdout)
+
+
+def print_row(result):
+    if 'skipped' in result:
+        print('{:<6} {}'.format(result['client'], 'skipped, ' +
+                                result['skipped']))
+        return
+    if 'failed' in result:
+        print('{:<6} {:>5} {:>8} failed, {}'.format(
+            result['client'], result['concurrency'], result['size'],
+            result['failed']), flush=True)
+        return
+
+    rss = result['peak_rss']
+    print('{:<6} {:>5} {:>8} {:>10.1f} {:>9.3f} {:>9.3f} {:>9.3f} {:>7.2f} '
+          '{:>7} {:>6}'.format(
+              result['client'], result['concurrency'], result['size'],
+              result['rps'], result['p50'] * 1000, result['p99'] * 1000,
+              result['p999'] * 1000, result['cpu_time'],
+              '-' if rss is None else '{:.1f}'.format(rss / MB),
+              result['errors']), flush=True)
+
+
+def run_all(args):
+    clients = find_clients()
+    versions = args.clients or list(clients)
+    for version in versions:
+        if version not in clients:
+            raise SystemExit('Unknown client {}, one of {}.'.format(
+                version, ', '.join(clients)))
+
+    results = []
+    print('{:<6} {:>5} {:>8} {:>10} {:>9} {:>9} {:>9} {:>7} {:>7} '
+          '{:>6}'.format('client', 'conc', 'size', 'req/s', 'p50 ms',
+                         'p99 ms', 'p999 ms', 'cpu s', 'rss MB', 'errors'))
+
+    for version in versions:
+        if version in SKIPPED:
+            result = {'client': version, 'skipped': SKIPPED[version]}
+            results.append(result)
+            print_row(result)
+
+    server = start_server(args.port, args.size[0], args.delay)
+    try:
+        for size in args.size:
+            script_server = None
+            if any(is_script(v) and v not in SKIPPED for v in versions):
+                # The script clients always request '/', the size is the
+                # default of the server.
+                script_server = start_server(SCRIPT_PORT, size, args.delay,
+                                             close=True)
+            try:
+                for version in versions:
+                    if version in SKIPPED:
+                        continue
+                    for concurrency in args.concurrency:
+                        result = {
+                            'client': version,
+                            'module': clients[version],
+                            'concurrency': concurrency,
+                            'size': size,
+                            'delay': args.delay,
+                        }
+                        result.update(spawn_case(args, version, concurrency,
+                                                 size))
+                        results.append(result)
+                        print_row(result)
+            finally:
+                if script_server is not None:
+                    stop_server(script_server)
+    finally:
+        stop_server(server)
+
+    if args.json:
+        report = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests': args.requests,
+            'script_requests': args.script_requests,
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the HTTP clients against a local server.')
+    parser.add_argument('--clients', nargs='+',
+                        help='Versions to run, e.g. v1 v8 v20. All by '
+                             'default.')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 10, 100])
+    parser.add_argument('--size', type=int, nargs='+', default=[1024],
+                        help='Response body sizes in bytes.')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='Server delay before each response in ms.')
+    parser.add_argument('--requests', type=int, default=5000,
+                        help='Requests per case of the imported clients.')
+    parser.add_argument('--script-requests', type=int, default=100,
+                        help='Requests (processes) per case of the script '
+                             'clients.')
+    parser.add_argument('--port', type=int, default=8080,
+                        help='Port of the keep-alive server.')
+    parser.add_argument('--json', help='File to write the results to.')
+    parser.add_argument('--case', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(args)
+    else:
+        run_all(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+
+# Compare running CPU-bound functions inline on the loop with offloading
+# them to the process pool of process_offload.py, with and without batching,
+# for an increasing number of workers. Then compare passing large buffers
+# through shared memory with pickling them.
+#
+# Usage:
+#   python benchmark/bench_offload.py --calls 20000 --work 1000 \
+#       --workers 1 2 4 8
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from process_offload import ProcessOffload  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def transform(document, work):
+    # Parse a payload and transform it, the CPU-bound part of a handler.
+    data = json.loads(document)
+    total = 0
+    for i in range(work):
+        total += (i * data['id']) % 7
+    return total
+
+
+def digest(buffer):
+    return hashlib.sha256(buffer).hexdigest()
+
+
+async def run_inline(loop, calls, work):
+    document = json.dumps({'id': 3, 'name': 'x' * 64})
+    # Each call holds the loop, no other coroutine could run meanwhile.
+    return [transform(document, work) for _ in range(calls)]
+
+
+async def run_offload(offload, calls, work):
+    document = json.dumps({'id': 3, 'name': 'x' * 64})
+    return await asyncio.gather(*[offload.run(transform, document, work)
+                                  for _ in range(calls)])
+
+
+async def run_buffers(offload, buffers):
+    return await asyncio.gather(*[offload.run(digest, buffer)
+                                  for buffer in buffers])
+
+
+def measure(loop, coro):
+    start = time.perf_counter()
+    loop.run_until_complete(coro)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the process pool offload.')
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--work', type=int, default=1000,
+                        help='Loop iterations per call.')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--buffers', type=int, default=16,
+                        help='Number of large buffers to hash.')
+    parser.add_argument('--buffer-size', type=int, default=8,
+                        help='Size of the large buffers in MB.')
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    print('{} cores, {} calls of {} iterations'.format(
+        os.cpu_count(), args.calls, args.work))
+    print('{:<34} {:>8} {:>12} {:>9}'.format(
+        'case', 'workers', 'calls/s', 'speedup'))
+
+    inline = measure(loop, run_inline(loop, args.calls, args.work))
+    print('{:<34} {:>8} {:>12.0f} {:>9.2f}'.format(
+        'inline on the loop', '-', args.calls / inline, 1.0))
+
+    for workers in args.workers:
+        for name, batch_size in (('offload, batched', args.batch_size),
+                                 ('offload, one call per round trip', 1)):
+            offload = ProcessOffload(loop, workers, batch_size=batch_size)
+            # Start the processes first.
+            measure(loop, run_offload(offload, workers, 1))
+            elapsed = measure(loop, run_offload(offload, args.calls,
+                                                args.work))
+            offload.close()
+            print('{:<34} {:>8} {:>12.0f} {:>9.2f}'.format(
+                name, workers, args.calls / elapsed, inline / elapsed))
+
+    print()
+    print('{} buffers of {} MB'.format(args.buffers, args.buffer_size))
+    print('{:<34} {:>8} {:>12}'.format('case', 'workers', 'MB/s'))
+    # Different buffers, pickle would send the same one only once per batch.
+    base = os.urandom(args.buffer_size * MB)
+    buffers = [base[i:] + base[:i] for i in range(args.buffers)]
+    workers = max(args.workers)
+    for name, threshold in (('shared memory', MB),
+                            ('pickled', float('inf'))):
+        offload = ProcessOffload(loop, workers, shm_threshold=threshold)
+        measure(loop, run_offload(offload, workers, 1))
+        elapsed = measure(loop, run_buffers(offload, buffers))
+        offload.close()
+        print('{:<34} {:>8} {:>12.0f}'.format(
+            name, workers, args.buffers * args.buffer_size / elapsed))
+
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+# Compare the bytearray Reader of http_client_v9_parser.py with the chunk
+# deque Reader of http_client_v10_buffer.py.
+# A producer feeds the body in socket sized chunks, one chunk per loop
+# iteration, while the consumer reads it. Report throughput and the peak
+# memory allocated during the read.
+#
+# Usage:
+#   python benchmark/bench_reader.py --size 100 300 --chunk 65536
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+import http_client_v9_parser  # noqa: E402
+import http_client_v10_buffer  # noqa: E402
+
+MB = 1024 * 1024
+
+
+async def produce(reader, total, chunk):
+    # A new bytes object per chunk, as returned by a socket read.
+    source = bytearray(os.urandom(chunk))
+    sent = 0
+    while sent < total:
+        size = min(chunk, total - sent)
+        reader.feed(bytes(source[:size]) if size < chunk else bytes(source))
+        sent += size
+        # Let the consumer wake up as it would with a real socket.
+        await asyncio.sleep(0)
+    reader.feed_eof()
+
+
+async def consume_read(reader, total, chunk):
+    data = await reader.read()
+    assert len(data) == total
+
+
+async def consume_readexactly(reader, total, chunk):
+    # Read fixed size records, e.g. frames of a protocol.
+    received = 0
+    while received < total:
+        data = await reader.readexactly(min(chunk, total - received))
+        received += len(data)
+
+
+async def consume_readinto(reader, total, chunk):
+    # Read into a preallocated buffer, the way a download to disk would.
+    buffer = bytearray(chunk)
+    received = 0
+    while True:
+        n = await reader.readinto(buffer)
+        if not n:
+            break
+        received += n
+    assert received == total
+
+
+async def run_once(loop, reader_class, consume, total, chunk):
+    reader = reader_class(loop)
+    await asyncio.gather(produce(reader, total, chunk),
+                         consume(reader, total, chunk))
+
+
+def measure(loop, reader_class, consume, total, chunk):
+    start = time.perf_counter()
+    loop.run_until_complete(run_once(loop, reader_class, consume, total,
+                                     chunk))
+    elapsed = time.perf_counter() - start
+
+    # Measure the memory in a separate run, tracemalloc slows it down.
+    tracemalloc.start()
+    loop.run_until_complete(run_once(loop, reader_class, consume, total,
+                                     chunk))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the Reader buffering.')
+    parser.add_argument('--size', type=int, nargs='+', default=[100, 300],
+                        help='Body sizes in MB.')
+    parser.add_argument('--chunk', type=int, default=65536,
+                        help='Bytes fed per loop iteration.')
+    args = parser.parse_args()
+
+    cases = [
+        ('v9 bytearray read()', http_client_v9_parser.Reader, consume_read),
+        ('v9 bytearray readexactly()', http_client_v9_parser.Reader,
+         consume_readexactly),
+        ('v10 deque read()', http_client_v10_buffer.Reader, consume_read),
+        ('v10 deque readexactly()', http_client_v10_buffer.Reader,
+         consume_readexactly),
+        ('v10 deque readinto()', http_client_v10_buffer.Reader,
+         consume_readinto),
+    ]
+
+    loop = asyncio.new_event_loop()
+
+    print('{:<28} {:>8} {:>10} {:>12} {:>8}'.format(
+        'reader', 'size MB', 'MB/s', 'peak MB', 'peak/size'))
+    for size in args.size:
+        total = size * MB
+        for name, reader_class, consume in cases:
+            elapsed, peak = measure(loop, reader_class, consume, total,
+                                    args.chunk)
+            print('{:<28} {:>8} {:>10.1f} {:>12.1f} {:>8.2f}'.format(
+                name, size, size / elapsed, peak / MB, peak / total))
+
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Compare loop.call_later() with the TimingWheel of timing_wheel.py for a
+# large number of timers: schedule them, reset them a few times (cancel and
+# schedule again, like an idle timeout on each request), cancel them, and
+# fire them. Report the time of each step and the memory of the timers.
+#
+# Usage:
+#   python benchmark/bench_timing_wheel.py --timers 100000 1000000
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from timing_wheel import TimingWheel  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def noop():
+    pass
+
+
+def schedule(call_later, delays):
+    return [call_later(delay, noop) for delay in delays]
+
+
+def reset(call_later, handles, delays):
+    for i, handle in enumerate(handles):
+        handle.cancel()
+        handles[i] = call_later(delays[i], noop)
+
+
+def cancel(handles):
+    for handle in handles:
+        handle.cancel()
+
+
+def loop_turns(loop, turns=100):
+    # Time of a loop iteration with the timers scheduled.
+    start = time.perf_counter()
+    for _ in range(turns):
+        loop.run_until_complete(asyncio.sleep(0))
+    return (time.perf_counter() - start) / turns
+
+
+def fire(loop, call_later, count, span):
+    # Schedule timers due within span seconds and run the loop until all
+    # have fired, return the CPU time.
+    fired = 0
+    done = loop.create_future()
+
+    def callback():
+        nonlocal fired
+        fired += 1
+        if fired == count:
+            done.set_result(None)
+
+    start = time.process_time()
+    for _ in range(count):
+        call_later(random.uniform(0, span), callback)
+    loop.run_until_complete(done)
+    return time.process_time() - start
+
+
+def measure(loop, name, call_later, count, resets):
+    random.seed(0)
+    delays = [random.uniform(10, 60) for _ in range(count)]
+    result = {'name': name}
+
+    start = time.perf_counter()
+    handles = schedule(call_later, delays)
+    result['schedule'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(resets):
+        reset(call_later, handles, delays)
+    result['reset'] = time.perf_counter() - start
+    result['turn'] = loop_turns(loop)
+
+    start = time.perf_counter()
+    cancel(handles)
+    result['cancel'] = time.perf_counter() - start
+    loop_turns(loop, 1)
+
+    result['fire_cpu'] = fire(loop, call_later, count, 1.0)
+
+    # Memory in a separate run, tracemalloc slows it down.
+    tracemalloc.start()
+    handles = schedule(call_later, delays)
+    for _ in range(resets):
+        reset(call_later, handles, delays)
+    result['memory'] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    cancel(handles)
+    loop_turns(loop, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the timing wheel against call_later().')
+    parser.add_argument('--timers', type=int, nargs='+',
+                        default=[100000, 1000000])
+    parser.add_argument('--resets', type=int, default=3,
+                        help='Times each timer is cancelled and scheduled '
+                             'again.')
+    parser.add_argument('--resolution', type=float, default=0.01,
+                        help='Resolution of the wheel in seconds.')
+    args = parser.parse_args()
+
+    print('{:<12} {:>8} {:>11} {:>11} {:>11} {:>10} {:>11} {:>10}'.format(
+        'timers', 'count', 'schedule s', 'reset s', 'cancel s', 'turn ms',
+        'fire cpu s', 'memory MB'))
+    for count in args.timers:
+        loop = asyncio.new_event_loop()
+        wheel = TimingWheel(loop, args.resolution)
+        for name, call_later in (('call_later', loop.call_later),
+                                 ('wheel', wheel.call_later)):
+            result = measure(loop, name, call_later, count, args.resets)
+            print('{:<12} {:>8} {:>11.3f} {:>11.3f} {:>11.3f} {:>10.3f} '
+                  '{:>11.3f} {:>10.1f}'.format(
+                      name, count, result['schedule'], result['reset'],
+                      result['cancel'], result['turn'] * 1000,
+                      result['fire_cpu'], result['memory'] / MB))
+        wheel.close()
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+
+# Check the decompression of the bodies by http_client_v18_compress.py and
+# later against the local server of http_server.py, run in the same loop:
+# gzip bodies with Content-Length, and chunked in small chunks written at
+# once, many chunks per read then. Each body is read at once, and by a slow
+# consumer, so the decoder pauses with input left (backpressure).
+#
+# Usage:
+#   python benchmark/check_compress.py --clients v18 v19 v20
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+import http_server  # noqa: E402
+
+CLIENTS = {
+    'v18': 'http_client_v18_compress',
+    'v19': 'http_client_v19_cache',
+    'v20': 'http_client_v20_trace',
+}
+
+# (size, gzip, chunk size)
+CASES = [
+    (300, True, 7),
+    (3000000, True, 0),
+    (3000000, True, 200),
+    (3000000, False, 1000),
+]
+
+
+def expected_body(size, gzip):
+    # As sent by http_server.py.
+    if gzip:
+        return b''.join(b'%07d\n' % i for i in range(size // 8 + 1))[:size]
+    return b'x' * size
+
+
+async def check(loop, module, port):
+    session = module.ClientSession(loop, module.Connector(loop))
+    failures = 0
+    try:
+        for size, gzip, chunk in CASES:
+            path = '/?size={}&gzip={}&chunk={}'.format(size, int(gzip),
+                                                       chunk)
+            expected = expected_body(size, gzip)
+
+            resp = await session.get(path, '127.0.0.1', port)
+            fast = await resp.read()
+
+            resp = await session.get(path, '127.0.0.1', port)
+            pieces = []
+            async for piece in resp.iter_chunked(2 ** 16):
+                pieces.append(piece)
+                await asyncio.sleep(0.001)
+            slow = b''.join(pieces)
+
+            for name, body in (('read', fast), ('slow', slow)):
+                ok = body == expected
+                failures += not ok
+                print('{:<4} {:<40} {}'.format(
+                    name, path,
+                    'ok' if ok else 'FAIL, {} bytes'.format(len(body))))
+    finally:
+        session.close()
+    return failures
+
+
+async def main(loop, clients, port):
+    server = await http_server.serve(loop, '127.0.0.1', port)
+    failures = 0
+    try:
+        for version in clients:
+            print(CLIENTS[version])
+            module = importlib.import_module(CLIENTS[version])
+            try:
+                failures += await check(loop, module, port)
+            except Exception as exc:
+                print('FAIL {}: {}'.format(type(exc).__name__, exc))
+                failures += 1
+    finally:
+        server.close()
+        await server.wait_closed()
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check the decompression of the HTTP clients.')
+    parser.add_argument('--clients', nargs='+', choices=sorted(CLIENTS),
+                        default=sorted(CLIENTS))
+    parser.add_argument('--port', type=int, default=8090)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    try:
+        failures = loop.run_until_complete(main(loop, args.clients,
+                                                args.port))
+    finally:
+        loop.close()
+    sys.exit(1 if failures else 0)
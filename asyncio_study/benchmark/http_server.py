@@ -0,0 +1,194 @@
+import argparse
+import asyncio
+import collections
+import urllib.parse
+import zlib
+
+# Local HTTP/1.1 server to benchmark the clients against.
+# Keep-alive and pipelining are supported. The body size and the delay
+# before the response can be given per request in the query string, e.g.
+# GET /?size=65536&delay=5 (delay in milliseconds), otherwise the defaults
+# of the command line are used. Request bodies with Content-Length are read
+# and discarded. GET /?gzip=1 gzips the body, numbered lines then, and
+# GET /?chunk=200 sends it with chunked transfer encoding, in chunks of 200
+# bytes written at once.
+#
+# Usage:
+#   python benchmark/http_server.py --port 8080 --size 1024 --delay 0
+#   python benchmark/http_server.py --port 8000 --close
+
+MAX_HEAD_SIZE = 2 ** 16
+
+
+class ServerProtocol(asyncio.Protocol):
+    def __init__(self, loop, bodies, default_size, default_delay,
+                 close=False):
+        self._loop = loop
+        self._bodies = bodies  # Shared cache of bodies per size.
+        self._default_size = default_size
+        self._default_delay = default_delay
+        self._close = close  # Close the connection after each response.
+        self._transport = None
+        self._buffer = bytearray()
+        self._discard = 0  # Bytes of a request body still to skip.
+        # Responses delayed, (loop time to send, data, close) in the order
+        # of the requests.
+        self._delayed = collections.deque()
+        self._timer = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def data_received(self, data):
+        if self._discard:
+            skipped = min(self._discard, len(data))
+            self._discard -= skipped
+            data = data[skipped:]
+        self._buffer.extend(data)
+
+        while not self._discard:
+            end = self._buffer.find(b'\r\n\r\n')
+            if end == -1:
+                if len(self._buffer) > MAX_HEAD_SIZE:
+                    self._transport.close()
+                break
+            head = bytes(self._buffer[:end])
+            del self._buffer[:end + 4]
+            self._handle(head)
+
+            if self._discard:
+                skipped = min(self._discard, len(self._buffer))
+                self._discard -= skipped
+                del self._buffer[:skipped]
+
+    def connection_lost(self, exc):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _handle(self, head):
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            self._transport.close()
+            return
+
+        connection = ''
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                self._discard = int(value)
+            elif name == 'connection':
+                connection = value.strip().lower()
+
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(target).query)
+        size = int(query.get('size', [self._default_size])[0])
+        delay = float(query.get('delay', [self._default_delay])[0]) / 1000
+        gzip = query.get('gzip', ['0'])[0] == '1'
+        chunk = int(query.get('chunk', ['0'])[0])
+
+        close = self._close or connection == 'close' or (
+            version == 'HTTP/1.0' and connection != 'keep-alive')
+        data = self._response(method, size, close, gzip, chunk)
+
+        if delay <= 0 and not self._delayed:
+            self._send(data, close)
+            return
+
+        # Keep the order of the responses for pipelined requests.
+        when = self._loop.time() + max(delay, 0)
+        if self._delayed:
+            when = max(when, self._delayed[-1][0])
+        self._delayed.append((when, data, close))
+        if self._timer is None:
+            self._timer = self._loop.call_at(when, self._send_delayed)
+
+    def _response(self, method, size, close, gzip=False, chunk=0):
+        body = self._bodies.get((size, gzip))
+        if body is None:
+            body = b'x' * size
+            if gzip:
+                # Numbered lines, b'x' * size is beyond the max compression
+                # ratio of the clients.
+                body = b''.join(b'%07d\n' % i
+                                for i in range(size // 8 + 1))[:size]
+                compressobj = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+                body = compressobj.compress(body) + compressobj.flush()
+            self._bodies[size, gzip] = body
+        head = ['HTTP/1.1 200 OK\r\n'
+                'Content-Type: application/octet-stream\r\n']
+        if gzip:
+            head.append('Content-Encoding: gzip\r\n')
+        if chunk > 0:
+            head.append('Transfer-Encoding: chunked\r\n')
+        else:
+            head.append('Content-Length: {}\r\n'.format(len(body)))
+        head.append('Connection: {}\r\n\r\n'.format(
+            'close' if close else 'keep-alive'))
+        head = ''.join(head).encode()
+        if method == 'HEAD':
+            return head
+        if chunk > 0:
+            body = b''.join(
+                b'%x\r\n%s\r\n' % (len(body[i:i + chunk]),
+                                     body[i:i + chunk])
+                for i in range(0, len(body), chunk)) + b'0\r\n\r\n'
+        return head + body
+
+    def _send(self, data, close):
+        if self._transport.is_closing():
+            return
+        self._transport.write(data)
+        if close:
+            self._transport.close()
+
+    def _send_delayed(self):
+        self._timer = None
+        now = self._loop.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, data, close = self._delayed.popleft()
+            self._send(data, close)
+        if self._delayed:
+            self._timer = self._loop.call_at(self._delayed[0][0],
+                                             self._send_delayed)
+
+
+async def serve(loop, host, port, size=1024, delay=0.0, close=False):
+    bodies = {}
+    return await loop.create_server(
+        lambda: ServerProtocol(loop, bodies, size, delay, close),
+        host, port, reuse_address=True, backlog=1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Local HTTP server for the client benchmarks.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--size', type=int, default=1024,
+                        help='Default body size in bytes.')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='Default delay before a response in ms.')
+    parser.add_argument('--close', action='store_true',
+                        help='Close the connection after each response.')
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(serve(
+        loop, args.host, args.port, args.size, args.delay, args.close))
+    print('Serving on {}'.format(server.sockets[0].getsockname()),
+          flush=True)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
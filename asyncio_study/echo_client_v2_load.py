@@ -0,0 +1,314 @@
+import argparse
+import array
+import asyncio
+import collections
+import json
+import multiprocessing
+import struct
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Load generator for echo_server_v2_framed.py.
+# Open many connections, keep a number of length-prefixed messages in flight
+# on each one, and measure the round trip time of every message. Run for a
+# duration or a number of messages, then report the throughput and the
+# latency percentiles.
+# Based on echo_client.py.
+#
+# Usage:
+#   python echo_client_v2_load.py --connections 2000 --depth 4 --size 128 \
+#       --duration 10 --processes 2
+
+HEADER = struct.Struct('!I')
+
+
+class EchoClientProtocol(asyncio.Protocol):
+    def __init__(self, loop, load, payload, depth):
+        self.loop = loop
+        self.transport = None
+        self._load = load
+        self._frame = HEADER.pack(len(payload)) + payload
+        self._depth = depth
+        self._sent = collections.deque()  # Send times of the messages.
+        self._buffer = bytearray()
+        self._closed = loop.create_future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        for _ in range(self._depth):
+            if not self._send():
+                break
+        if not self._sent:
+            # Nothing left to send.
+            transport.close()
+
+    def data_received(self, data):
+        self._buffer.extend(data)
+        size = len(self._frame)
+        count = len(self._buffer) // size
+        if not count:
+            return
+
+        now = time.perf_counter()
+        for i in range(count):
+            # The server echoes the frames in order.
+            if self._buffer[i * size:(i + 1) * size] != self._frame:
+                self._load.errors += 1
+            self._load.record(now - self._sent.popleft())
+        del self._buffer[:count * size]
+
+        for _ in range(count):
+            if not self._send():
+                break
+        if not self._sent:
+            # Done, every message sent has been echoed.
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        if self._sent:
+            # Messages lost with the connection.
+            self._load.errors += len(self._sent)
+            self._sent.clear()
+        if not self._closed.done():
+            self._closed.set_result(None)
+
+    async def wait_closed(self):
+        await self._closed
+
+    def _send(self):
+        if not self._load.take():
+            return False
+        self._sent.append(time.perf_counter())
+        self.transport.write(self._frame)
+        return True
+
+
+class Load:
+    """Shared state of the connections of a process."""
+
+    def __init__(self, messages=0, deadline=None):
+        self._remaining = messages  # Messages left to send, 0 for no limit.
+        self._limited = messages > 0
+        self.deadline = deadline  # perf_counter() to stop sending at.
+        self.latencies = array.array('d')
+        self.errors = 0
+
+    def take(self):
+        # Return True if another message may be sent.
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return False
+        if self._limited:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+        return True
+
+    def stop(self):
+        self.deadline = time.perf_counter()
+
+    def record(self, latency):
+        self.latencies.append(latency)
+
+
+async def run(loop, args, messages):
+    deadline = None
+    if args.duration:
+        deadline = time.perf_counter() + args.duration
+    load = Load(messages, deadline)
+    payload = b'x' * args.size
+
+    # Open the connections, a bounded number at a time so the listen
+    # backlog of the server doesn't overflow.
+    protocols = []
+    failed = 0
+    connecting = asyncio.Semaphore(args.connect_concurrency)
+
+    async def connect():
+        nonlocal failed
+        async with connecting:
+            try:
+                _, protocol = await loop.create_connection(
+                    lambda: EchoClientProtocol(loop, load, payload,
+                                               args.depth),
+                    args.host, args.port)
+            except OSError:
+                failed += 1
+                return
+        protocols.append(protocol)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[connect() for _ in range(args.connections)])
+
+    # Stop sending at the deadline, then wait for the messages in flight.
+    # asyncio.wait() doesn't cancel what's still pending on a timeout.
+    closing = {loop.create_task(p.wait_closed()) for p in protocols}
+    timeout = None
+    if args.duration:
+        timeout = args.duration + args.drain_timeout
+    if closing:
+        _, closing = await asyncio.wait(closing, timeout=timeout)
+    if closing:
+        load.stop()
+        _, closing = await asyncio.wait(closing, timeout=args.drain_timeout)
+    # The connections still not drained are errors, their messages in
+    # flight too.
+    timeouts = len(closing)
+    if closing:
+        for protocol in protocols:
+            protocol.transport.abort()
+        await asyncio.gather(*closing, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'connections': len(protocols),
+        'connect_errors': failed,
+        'drain_timeouts': timeouts,
+        'errors': load.errors + timeouts,
+        'elapsed': elapsed,
+        'latencies': load.latencies.tobytes(),
+    }
+
+
+def run_process(args, messages, results):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        result = loop.run_until_complete(run(loop, args, messages))
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            result['cpu_time'] = usage.ru_utime + usage.ru_stime
+    finally:
+        loop.close()
+    results.put(result)
+
+
+def raise_open_files_limit(needed):
+    # Each connection is a file descriptor.
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        if hard != resource.RLIM_INFINITY:
+            needed = min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(args, results):
+    latencies = array.array('d')
+    for result in results:
+        latencies.frombytes(result['latencies'])
+    latencies = sorted(latencies)
+    # The processes run at the same time.
+    elapsed = max(result['elapsed'] for result in results)
+    count = len(latencies)
+
+    return {
+        'connections': sum(result['connections'] for result in results),
+        'connect_errors': sum(result['connect_errors'] for result in results),
+        'drain_timeouts': sum(result['drain_timeouts'] for result in results),
+        'errors': sum(result['errors'] for result in results),
+        'messages': count,
+        'size': args.size,
+        'depth': args.depth,
+        'elapsed': elapsed,
+        'messages_per_second': count / elapsed if elapsed else 0.0,
+        # Both directions.
+        'mb_per_second': (count * 2 * (args.size + HEADER.size) / elapsed /
+                          1e6 if elapsed else 0.0),
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'p999': percentile(latencies, 99.9),
+        'max': latencies[-1] if latencies else 0.0,
+        'cpu_time': sum(result.get('cpu_time', 0.0) for result in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load generator for the framed echo server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--connections', type=int, default=100,
+                        help='Connections in total.')
+    parser.add_argument('--depth', type=int, default=1,
+                        help='Messages in flight per connection.')
+    parser.add_argument('--size', type=int, default=64,
+                        help='Message payload size in bytes.')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='Seconds to run, 0 to run until --messages '
+                             'are echoed.')
+    parser.add_argument('--messages', type=int, default=0,
+                        help='Messages to send in total, 0 for no limit.')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Processes sharing the connections.')
+    parser.add_argument('--connect-concurrency', type=int, default=100,
+                        help='Connections opened at the same time per '
+                             'process.')
+    parser.add_argument('--drain-timeout', type=float, default=5.0,
+                        help='Seconds to wait for the messages in flight '
+                             'at the end.')
+    parser.add_argument('--json', help='File to write the results to.')
+    args = parser.parse_args()
+
+    if not args.duration and not args.messages:
+        parser.error('Give --duration or --messages.')
+
+    raise_open_files_limit(args.connections // args.processes + 64)
+
+    # Split the connections and the messages between the processes.
+    process_args = []
+    for i in range(args.processes):
+        share = argparse.Namespace(**vars(args))
+        share.connections = (args.connections // args.processes +
+                             (i < args.connections % args.processes))
+        messages = 0
+        if args.messages:
+            messages = (args.messages // args.processes +
+                        (i < args.messages % args.processes))
+        process_args.append((share, messages))
+
+    results = multiprocessing.Queue()
+    if args.processes == 1:
+        run_process(*process_args[0], results)
+        collected = [results.get()]
+    else:
+        processes = [multiprocessing.Process(target=run_process,
+                                             args=(share, messages, results))
+                     for share, messages in process_args]
+        for process in processes:
+            process.start()
+        # Read the results before joining, see echo_server_v2_framed.py.
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    summary = summarize(args, collected)
+    print('{connections} connections ({connect_errors} failed), '
+          '{messages} messages of {size} bytes, depth {depth}, '
+          '{errors} errors ({drain_timeouts} connections not drained)'.format(
+              **summary))
+    print('{messages_per_second:.0f} messages/s, {mb_per_second:.1f} MB/s '
+          'in {elapsed:.2f} s, cpu {cpu_time:.2f} s'.format(**summary))
+    print('latency ms: p50 {:.3f}, p90 {:.3f}, p99 {:.3f}, p99.9 {:.3f}, '
+          'max {:.3f}'.format(*[summary[name] * 1000 for name in
+                                ('p50', 'p90', 'p99', 'p999', 'max')]))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import struct
+import time
+
+# Echo server keeping the connections open and echoing length-prefixed
+# frames, a 4 bytes big-endian length followed by the payload.
+# Frames split or merged by TCP are reassembled, reading is paused while the
+# write buffer is full, several worker processes share the port with
+# SO_REUSEPORT and each one counts its throughput.
+# Based on echo_server.py.
+#
+# Usage:
+#   python echo_server_v2_framed.py --workers 4 --port 8888
+# Stop it with Ctrl+C or SIGTERM, the connections are given --grace seconds
+# to finish.
+
+HEADER = struct.Struct('!I')
+
+# Seconds given to flush the write buffers of the connections closed on
+# shutdown, the ones still open then are aborted.
+FLUSH_TIMEOUT = 1.0
+
+
+class WorkerStats:
+    def __init__(self):
+        self.connections = 0  # Accepted so far.
+        self.frames = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def snapshot(self):
+        return {
+            'connections': self.connections,
+            'frames': self.frames,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+        }
+
+
+class EchoFrameProtocol(asyncio.Protocol):
+    def __init__(self, stats, transports, max_frame_size=2 ** 24,
+                 write_high_water=2 ** 18):
+        self.transport = None
+        self._stats = stats
+        self._transports = transports  # Open transports of the worker.
+        self._max_frame_size = max_frame_size
+        self._write_high_water = write_high_water
+        self._buffer = bytearray()  # Incomplete frame.
+        self._need = HEADER.size  # Bytes needed to complete the next frame.
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=self._write_high_water)
+        self._transports.add(transport)
+        self._stats.connections += 1
+
+    def data_received(self, data):
+        self._stats.bytes_in += len(data)
+
+        if self._buffer:
+            self._buffer.extend(data)
+            if len(self._buffer) < self._need:
+                # Still in the middle of a frame.
+                return
+            data = self._buffer
+
+        end = self._scan(data)
+        if end < 0:
+            # Frame too large, the stream can't be trusted any more.
+            self.transport.abort()
+            return
+
+        if end:
+            # The complete frames are echoed as they are, in one write.
+            if data is self._buffer:
+                out = bytes(data[:end])
+                del self._buffer[:end]
+            else:
+                out = data if end == len(data) else data[:end]
+                self._buffer.extend(data[end:])
+            self.transport.write(out)
+            self._stats.bytes_out += len(out)
+        elif data is not self._buffer:
+            self._buffer.extend(data)
+
+    def pause_writing(self):
+        # The peer doesn't read fast enough, stop reading its frames until
+        # the write buffer is drained.
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.transport.resume_reading()
+
+    def connection_lost(self, exc):
+        self._transports.discard(self.transport)
+
+    def _scan(self, data):
+        # Return the end of the last complete frame in data, -1 if a frame
+        # is too large. Set the bytes needed to complete the next one.
+        end = 0
+        size = len(data)
+        while size - end >= HEADER.size:
+            length = HEADER.unpack_from(data, end)[0]
+            if length > self._max_frame_size:
+                return -1
+            if size - end - HEADER.size < length:
+                self._need = HEADER.size + length
+                return end
+            end += HEADER.size + length
+            self._stats.frames += 1
+
+        self._need = HEADER.size
+        return end
+
+
+async def report(stats, worker_id, interval):
+    # Print the throughput of the worker every interval seconds.
+    last = stats.snapshot()
+    last_time = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        current = stats.snapshot()
+        rates = {name: (current[name] - last[name]) / (now - last_time)
+                 for name in current}
+        print('worker {} (pid {}): {:.0f} frames/s, {:.1f} MB/s in, '
+              '{:.1f} MB/s out'.format(
+                  worker_id, os.getpid(), rates['frames'],
+                  rates['bytes_in'] / 1e6, rates['bytes_out'] / 1e6),
+              flush=True)
+        last, last_time = current, now
+
+
+async def serve(loop, args, worker_id, stop):
+    # Serve until the future stop is done.
+    stats = WorkerStats()
+    transports = set()
+
+    server = await loop.create_server(
+        lambda: EchoFrameProtocol(stats, transports, args.max_frame_size,
+                                  args.write_high_water),
+        args.host, args.port, reuse_port=args.workers > 1, backlog=1024)
+    print('Worker {} (pid {}) serving on {}'.format(
+        worker_id, os.getpid(), server.sockets[0].getsockname()), flush=True)
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, lambda: stop.done() or
+                                    stop.set_result(None))
+        except NotImplementedError:
+            # Windows, Ctrl+C raises KeyboardInterrupt in run_worker().
+            break
+
+    reporter = None
+    if args.stats_interval > 0:
+        reporter = loop.create_task(report(stats, worker_id,
+                                           args.stats_interval))
+
+    start = time.monotonic()
+    await stop
+
+    # Graceful shutdown: stop accepting, let the clients finish and close
+    # their connections, then close the rest.
+    server.close()
+    deadline = loop.time() + args.grace
+    while transports and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+    for transport in list(transports):
+        # Flush what's been echoed already, the transport is closed then.
+        transport.close()
+    deadline = loop.time() + FLUSH_TIMEOUT
+    while transports and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+    for transport in list(transports):
+        # The client doesn't read.
+        transport.abort()
+    await server.wait_closed()
+
+    if reporter is not None:
+        reporter.cancel()
+
+    result = stats.snapshot()
+    result['elapsed'] = time.monotonic() - start
+    return result
+
+
+def run_worker(args, worker_id, results):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stop = loop.create_future()
+    task = loop.create_task(serve(loop, args, worker_id, stop))
+    try:
+        while True:
+            try:
+                result = loop.run_until_complete(task)
+                break
+            except KeyboardInterrupt:
+                # No signal handlers, shut down gracefully all the same.
+                if task.done():
+                    raise
+                if not stop.done():
+                    stop.set_result(None)
+    finally:
+        loop.close()
+    results.put((worker_id, os.getpid(), result))
+
+
+def print_summary(results):
+    total = {'connections': 0, 'frames': 0, 'bytes_in': 0, 'bytes_out': 0}
+    for worker_id, pid, result in sorted(results):
+        print('worker {} (pid {}): {connections} connections, {frames} '
+              'frames, {bytes_in} bytes in, {bytes_out} bytes out, '
+              '{rate:.0f} frames/s'.format(
+                  worker_id, pid,
+                  rate=result['frames'] / max(result['elapsed'], 1e-9),
+                  **result))
+        for name in total:
+            total[name] += result[name]
+    print('total: {connections} connections, {frames} frames, {bytes_in} '
+          'bytes in, {bytes_out} bytes out'.format(**total))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Echo server of length-prefixed frames.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes sharing the port with '
+                             'SO_REUSEPORT, e.g. the number of CPUs.')
+    parser.add_argument('--max-frame-size', type=int, default=2 ** 24)
+    parser.add_argument('--write-high-water', type=int, default=2 ** 18,
+                        help='Write buffer size above which reading is '
+                             'paused.')
+    parser.add_argument('--grace', type=float, default=5.0,
+                        help='Seconds given to the clients to close their '
+                             'connections on shutdown.')
+    parser.add_argument('--stats-interval', type=float, default=5.0,
+                        help='Seconds between throughput reports, 0 for '
+                             'none.')
+    args = parser.parse_args()
+
+    if args.workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error('SO_REUSEPORT is not supported, use --workers 1.')
+
+    results = multiprocessing.Queue()
+    if args.workers == 1:
+        run_worker(args, 0, results)
+        print_summary([results.get()])
+        return
+
+    workers = [multiprocessing.Process(target=run_worker,
+                                       args=(args, i, results))
+               for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
+    # Ctrl+C is delivered to the workers too, SIGTERM is passed on.
+    def stop(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Read the results before joining, a process putting to a queue doesn't
+    # exit until the data is consumed.
+    collected = []
+    while len(collected) < len(workers):
+        try:
+            collected.append(results.get(timeout=0.5))
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                break
+    for worker in workers:
+        worker.join()
+    print_summary(collected)
+
+
+if __name__ == '__main__':
+    main()
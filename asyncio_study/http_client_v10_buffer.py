@@ -0,0 +1,826 @@
+import asyncio
+import collections
+import functools
+import re
+
+# HTTP client sending GET requests over keep-alive connections.
+# Reader buffers the data as a deque of chunks instead of a bytearray, add
+# readexactly(), readuntil() and readinto() which copy the data at most once.
+# Based on http_client_v9_parser.py.
+
+
+class Writer:
+    def __init__(self, transport):
+        self._transport = transport
+
+    def write(self, data):
+        self._transport.write(data)
+
+    def close(self):
+        self._transport.close()
+
+    def is_closing(self):
+        return self._transport.is_closing()
+
+
+class Reader:
+    """Buffer of the received data.
+
+    The data is kept as a deque of chunks, as it's fed, and handed out with
+    memoryview slicing, so each byte is copied at most once. The data fed
+    must not be modified afterwards.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._chunks = collections.deque()  # bytes or memoryview
+        self._size = 0  # Total bytes in the chunks.
+        self._eof = False  # EOF received or not.
+        self._exception = None
+        self._waiter = None  # A future used to wait for data.
+
+    def set_exception(self, exc):
+        self._exception = exc
+        waiter = self._waiter
+        if waiter:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_exception(exc)
+
+    def feed(self, data):
+        if not data:
+            return
+        if isinstance(data, memoryview) and isinstance(data.obj, bytes) \
+                and data.nbytes == len(data.obj):
+            # A view of the whole bytes object, keep the object itself so
+            # that it could be returned as it is.
+            data = data.obj
+        self._chunks.append(data)
+        self._size += len(data)
+        self._wakeup_waiter()
+
+    def feed_eof(self):
+        self._eof = True
+        self._wakeup_waiter()
+
+    def at_eof(self):
+        return self._eof and not self._size
+
+    async def read(self, n=-1):
+        # -1 means read until EOF, otherwise read at most n bytes.
+        if n < 0:
+            while not self._eof:
+                await self._wait_for_data()
+            return self._take(self._size)
+
+        if not self._size and not self._eof:
+            await self._wait_for_data()
+        return self._take(min(n, self._size))
+
+    async def readexactly(self, n):
+        while self._size < n:
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._take(self._size), n)
+            await self._wait_for_data()
+
+        return self._take(n)
+
+    async def readuntil(self, separator=b'\n'):
+        # Read until the separator is found, the separator is included.
+        start = 0
+        while True:
+            index = self._find(separator, start)
+            if index != -1:
+                return self._take(index + len(separator))
+
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._take(self._size), None)
+
+            # Don't search the bytes already checked again.
+            start = max(0, self._size - len(separator) + 1)
+            await self._wait_for_data()
+
+    async def readinto(self, buffer):
+        # Copy the data into the given writable buffer, return the number of
+        # bytes copied, 0 means EOF.
+        if not self._size and not self._eof:
+            await self._wait_for_data()
+
+        dest = memoryview(buffer).cast('B')
+        copied = 0
+        while self._chunks and copied < len(dest):
+            chunk = self._chunks[0]
+            size = min(len(chunk), len(dest) - copied)
+            dest[copied:copied + size] = memoryview(chunk)[:size]
+            copied += size
+            self._consume(size)
+        return copied
+
+    def _find(self, separator, start):
+        # Search the separator across the chunks from position start.
+        # Return the index of the separator or -1.
+        seplen = len(separator)
+        pos = 0  # Position of the current chunk.
+        tail = b''  # Last (seplen - 1) bytes of the previous chunk.
+        for chunk in self._chunks:
+            size = len(chunk)
+            if pos + size > start:
+                if seplen > 1 and tail:
+                    # The separator may span the chunk boundary.
+                    window = tail + bytes(chunk[:seplen - 1])
+                    index = window.find(separator)
+                    if index != -1 and pos - len(tail) + index >= start:
+                        return pos - len(tail) + index
+
+                # memoryview has no find(), a compiled pattern could search
+                # the view without copying it.
+                match = _search_pattern(separator).search(
+                    chunk, max(0, start - pos))
+                if match:
+                    return pos + match.start()
+
+            if seplen > 1:
+                tail = (tail + bytes(chunk[-(seplen - 1):]))[-(seplen - 1):]
+            pos += size
+        return -1
+
+    def _take(self, n):
+        # Remove n bytes from the chunks and return them as bytes.
+        chunks = self._chunks
+        if not n:
+            return b''
+
+        first = chunks[0]
+        if len(first) == n and isinstance(first, bytes):
+            # No copy at all.
+            self._consume(n)
+            return first
+        if len(first) >= n:
+            data = bytes(memoryview(first)[:n])
+            self._consume(n)
+            return data
+
+        parts = []
+        left = n
+        while left:
+            chunk = chunks[0]
+            size = min(len(chunk), left)
+            parts.append(memoryview(chunk)[:size])
+            self._consume(size)
+            left -= size
+        return b''.join(parts)
+
+    def _consume(self, n):
+        # Remove n bytes from the first chunk, n <= length of the chunk.
+        chunk = self._chunks[0]
+        if n == len(chunk):
+            self._chunks.popleft()
+        else:
+            self._chunks[0] = memoryview(chunk)[n:]
+        self._size -= n
+
+    async def _wait_for_data(self):
+        if self._exception is not None:
+            raise self._exception
+
+        assert not self._eof
+        assert not self._waiter
+
+        self._waiter = self._loop.create_future()
+        await self._waiter
+        self._waiter = None
+
+    def _wakeup_waiter(self):
+        waiter = self._waiter
+        if waiter:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+@functools.lru_cache(maxsize=16)
+def _search_pattern(separator):
+    return re.compile(re.escape(separator))
+
+
+class HttpParserError(Exception):
+    pass
+
+
+class ResponseMessage:
+    def __init__(self, version, status, reason, headers):
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers  # Lower case names.
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            self.keep_alive = connection == 'keep-alive'
+        else:
+            self.keep_alive = connection != 'close'
+
+        self.chunked = 'chunked' in headers.get(
+            'transfer-encoding', '').lower()
+
+
+class ResponseParser:
+    """Incremental HTTP/1.1 response parser.
+
+    Data is fed as it's received, the handler is notified with
+    on_headers(message) as soon as the status line and headers are complete,
+    then on_body(data) for each piece of the body and finally
+    on_message_complete(). Data already parsed is never scanned again.
+    """
+
+    # States
+    HEAD = 0
+    BODY_LENGTH = 1
+    BODY_EOF = 2
+    CHUNK_SIZE = 3
+    CHUNK_DATA = 4
+    CHUNK_DATA_END = 5
+    CHUNK_TRAILERS = 6
+
+    def __init__(self, handler, max_head_size=65536):
+        self._handler = handler
+        self._max_head_size = max_head_size
+        self._buffer = bytearray()  # Incomplete head or chunk lines.
+        self._scanned = 0  # Bytes of the buffer already searched.
+        self._state = self.HEAD
+        self._remaining = 0  # Body or chunk bytes not received yet.
+        self._no_body = False
+
+    def reset(self, no_body=False):
+        # no_body: The response of a HEAD request has no body.
+        self._buffer.clear()
+        self._scanned = 0
+        self._state = self.HEAD
+        self._remaining = 0
+        self._no_body = no_body
+
+    def is_idle(self):
+        return self._state == self.HEAD and not self._buffer
+
+    def feed_data(self, data):
+        data = memoryview(data)
+        while data:
+            state = self._state
+            if state == self.HEAD:
+                data = self._parse_head(data)
+            elif state == self.BODY_LENGTH or state == self.CHUNK_DATA:
+                data = self._parse_body(data)
+            elif state == self.BODY_EOF:
+                self._handler.on_body(data)
+                data = None
+            elif state == self.CHUNK_TRAILERS:
+                data = self._parse_trailers(data)
+            else:
+                data = self._parse_chunk_line(data)
+
+    def feed_eof(self):
+        if self._state == self.BODY_EOF:
+            self._state = self.HEAD
+            self._handler.on_message_complete()
+        elif not self.is_idle():
+            raise HttpParserError('Connection closed in the middle of '
+                                  'a response.')
+
+    def _find_line(self, data, separator):
+        # Buffer the data and search the separator from where the last
+        # search stopped. Return the line and the data left, or None and an
+        # empty memoryview if the line is not complete yet.
+        buffer = self._buffer
+        start = max(0, self._scanned - len(separator) + 1)
+        buffer.extend(data)
+
+        index = buffer.find(separator, start)
+        if index == -1:
+            if len(buffer) > self._max_head_size:
+                raise HttpParserError('Line or header too long.')
+            self._scanned = len(buffer)
+            return None, memoryview(b'')
+
+        end = index + len(separator)
+        line = bytes(buffer[:index])
+        # The bytes after the separator are not part of the line.
+        rest = len(buffer) - end
+        data = data[len(data) - rest:] if rest else memoryview(b'')
+
+        buffer.clear()
+        self._scanned = 0
+        return line, data
+
+    def _parse_head(self, data):
+        head, data = self._find_line(data, b'\r\n\r\n')
+        if head is None:
+            return data
+
+        lines = head.decode('latin-1').split('\r\n')
+
+        try:
+            version, status, reason = (lines[0].split(' ', 2) + [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise HttpParserError('Bad status line: {!r}'.format(lines[0]))
+        if not version.startswith('HTTP/'):
+            raise HttpParserError('Bad status line: {!r}'.format(lines[0]))
+
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise HttpParserError('Bad header: {!r}'.format(line))
+            name = name.strip().lower()
+            value = value.strip()
+            if name in headers:
+                headers[name] += ', ' + value
+            else:
+                headers[name] = value
+
+        message = ResponseMessage(version, status, reason, headers)
+
+        if 100 <= status < 200:
+            # Informational response, the final one follows.
+            return data
+
+        self._handler.on_headers(message)
+
+        if (self._no_body or status in (204, 304)):
+            self._message_complete()
+        elif message.chunked:
+            self._state = self.CHUNK_SIZE
+        elif 'content-length' in headers:
+            length = headers['content-length']
+            # Digits only, int() takes a sign and spaces too.
+            if not (length.isascii() and length.isdigit()):
+                raise HttpParserError('Bad Content-Length.')
+            self._remaining = int(length)
+            if self._remaining:
+                self._state = self.BODY_LENGTH
+            else:
+                self._message_complete()
+        else:
+            # No framing, the body ends when the connection is closed.
+            message.keep_alive = False
+            self._state = self.BODY_EOF
+
+        return data
+
+    def _parse_body(self, data):
+        size = min(self._remaining, len(data))
+        self._handler.on_body(data[:size])
+        self._remaining -= size
+
+        if not self._remaining:
+            if self._state == self.CHUNK_DATA:
+                self._state = self.CHUNK_DATA_END
+            else:
+                self._message_complete()
+
+        return data[size:]
+
+    def _parse_chunk_line(self, data):
+        line, data = self._find_line(data, b'\r\n')
+        if line is None:
+            return data
+
+        if self._state == self.CHUNK_DATA_END:
+            if line:
+                raise HttpParserError('Bad chunk end.')
+            self._state = self.CHUNK_SIZE
+            return data
+
+        # Ignore chunk extensions.
+        size = line.split(b';', 1)[0].strip()
+        try:
+            self._remaining = int(size, 16)
+        except ValueError:
+            raise HttpParserError('Bad chunk size: {!r}'.format(size))
+
+        if self._remaining:
+            self._state = self.CHUNK_DATA
+        else:
+            self._state = self.CHUNK_TRAILERS
+        return data
+
+    def _parse_trailers(self, data):
+        # Trailers are not used, skip them until an empty line.
+        line, data = self._find_line(data, b'\r\n')
+        if line is not None and not line:
+            self._message_complete()
+        return data
+
+    def _message_complete(self):
+        self._state = self.HEAD
+        self._remaining = 0
+        self._handler.on_message_complete()
+
+
+class ClientProtocol(asyncio.Protocol):
+    def __init__(self, loop):
+        self.loop = loop
+        self.transport = None
+        self.closed = False
+        self._parser = ResponseParser(self)
+        self._waiter = None  # A future used to wait for the headers.
+        self._payload = None  # Reader of the body of the current response.
+        self._unexpected_data = False
+
+    def start_response(self, method='GET'):
+        # Must be called before the request is sent.
+        assert self._payload is None
+        self._parser.reset(no_body=method == 'HEAD')
+        self._waiter = self.loop.create_future()
+        self._payload = Reader(self.loop)
+
+    async def read_headers(self):
+        # Return the response message and the Reader of its body.
+        return await self._waiter
+
+    def is_idle(self):
+        return (self._payload is None and not self._unexpected_data and
+                self._parser.is_idle())
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        if self._payload is None:
+            # Nothing is expected, the connection can't be reused.
+            self._unexpected_data = True
+            return
+
+        try:
+            self._parser.feed_data(data)
+        except HttpParserError as exc:
+            self._set_exception(exc)
+            self.transport.close()
+
+    def eof_received(self):
+        self._feed_eof()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._feed_eof(exc)
+
+    # Handler methods called by the parser.
+
+    def on_headers(self, message):
+        if self._payload is None:
+            raise HttpParserError('Unexpected response.')
+        if not self._waiter.done():
+            self._waiter.set_result((message, self._payload))
+
+    def on_body(self, data):
+        self._payload.feed(data)
+
+    def on_message_complete(self):
+        payload = self._payload
+        self._payload = None
+        if payload is None:
+            raise HttpParserError('Unexpected response.')
+        payload.feed_eof()
+
+    def _feed_eof(self, exc=None):
+        if self._payload is None:
+            return
+
+        # Complete the response if its body ends with the connection.
+        try:
+            self._parser.feed_eof()
+        except HttpParserError as err:
+            exc = exc or err
+
+        if self._payload is not None:
+            self._set_exception(exc or ConnectionResetError(
+                'Connection closed before the response is complete.'))
+
+    def _set_exception(self, exc):
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_exception(exc)
+        if self._payload is not None:
+            self._payload.set_exception(exc)
+            self._payload = None
+
+
+class Connection:
+    def __init__(self, key, protocol, writer):
+        self.key = key  # (host, port)
+        self.protocol = protocol
+        self.writer = writer
+        self.last_used = None  # Loop time when released to the pool.
+
+    def is_stale(self):
+        # The server may close an idle connection at any time. A closed
+        # transport, an EOF or any unexpected data received while idle
+        # means the connection can't be used for another request.
+        return (self.protocol.closed or
+                self.writer.is_closing() or
+                not self.protocol.is_idle())
+
+    def close(self):
+        self.writer.close()
+
+
+class Connector:
+    """Pool of idle HTTP/1.1 keep-alive connections per (host, port).
+
+    limit: Max number of open connections, in use and idle. 0 for no limit.
+    limit_per_host: Max number of open connections per (host, port).
+    keepalive_timeout: Seconds an idle connection is kept in the pool.
+    """
+
+    def __init__(self, loop, limit=100, limit_per_host=0,
+                 keepalive_timeout=15.0):
+        self._loop = loop
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+
+        # Idle connections per key, the most recently used one at the right.
+        self._idle = collections.defaultdict(collections.deque)
+        self._idle_count = 0
+        # Open connections (in use or idle, or being connected) per key.
+        self._opened = collections.Counter()
+        self._opened_count = 0
+        self._in_use = 0
+
+        # Futures of the coroutines waiting for a free slot.
+        self._waiters = collections.deque()
+        self._cleanup_handle = None
+        self._closed = False
+
+        self._hits = 0
+        self._misses = 0
+
+    async def acquire(self, host, port):
+        if self._closed:
+            raise RuntimeError('Connector is closed.')
+
+        key = (host, port)
+
+        while True:
+            conn = self._get_idle(key)
+            if conn is not None:
+                self._hits += 1
+                self._in_use += 1
+                return conn
+
+            if self._has_capacity(key):
+                break
+
+            # Make room by closing an idle connection of another host.
+            if self._has_host_capacity(key) and self._close_oldest_idle():
+                break
+
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # Woken but cancelled, pass the wakeup on.
+                    self._wakeup_waiter()
+                raise
+
+        self._misses += 1
+
+        # Reserve the slot before connecting so that concurrent acquires
+        # don't exceed the limits.
+        self._opened[key] += 1
+        self._opened_count += 1
+        try:
+            conn = await self._create_connection(key)
+        except BaseException:
+            self._forget(key)
+            raise
+
+        self._in_use += 1
+        return conn
+
+    def release(self, conn, keep_alive=True):
+        self._in_use -= 1
+
+        if keep_alive and not self._closed and not conn.is_stale():
+            conn.last_used = self._loop.time()
+            self._idle[conn.key].append(conn)
+            self._idle_count += 1
+            self._schedule_cleanup()
+            self._wakeup_waiter()
+        else:
+            conn.close()
+            self._forget(conn.key)
+
+    def stats(self):
+        total = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'in_use': self._in_use,
+            'idle': self._idle_count,
+            'reuse_rate': self._hits / total if total else 0.0,
+        }
+
+    def close(self):
+        self._closed = True
+
+        if self._cleanup_handle:
+            self._cleanup_handle.cancel()
+            self._cleanup_handle = None
+
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.close()
+        self._idle.clear()
+        self._idle_count = 0
+
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_exception(RuntimeError('Connector is closed.'))
+        self._waiters.clear()
+
+    async def _create_connection(self, key):
+        host, port = key
+        protocol = ClientProtocol(self._loop)
+        transport, _ = await self._loop.create_connection(
+            lambda: protocol, host, port)
+        writer = Writer(transport)
+        return Connection(key, protocol, writer)
+
+    def _get_idle(self, key):
+        conns = self._idle.get(key)
+        if not conns:
+            return None
+
+        now = self._loop.time()
+        while conns:
+            conn = conns.pop()
+            self._idle_count -= 1
+            if (now - conn.last_used < self._keepalive_timeout and
+                    not conn.is_stale()):
+                return conn
+            conn.close()
+            self._forget(key)
+
+        return None
+
+    def _has_host_capacity(self, key):
+        return (not self._limit_per_host or
+                self._opened[key] < self._limit_per_host)
+
+    def _has_capacity(self, key):
+        if self._limit and self._opened_count >= self._limit:
+            return False
+        return self._has_host_capacity(key)
+
+    def _close_oldest_idle(self):
+        oldest = None
+        for conns in self._idle.values():
+            if conns and (oldest is None or
+                          conns[0].last_used < oldest.last_used):
+                oldest = conns[0]
+
+        if oldest is None:
+            return False
+
+        self._idle[oldest.key].popleft()
+        self._idle_count -= 1
+        oldest.close()
+        self._forget(oldest.key)
+        return True
+
+    def _forget(self, key):
+        self._opened[key] -= 1
+        if not self._opened[key]:
+            del self._opened[key]
+        self._opened_count -= 1
+        self._wakeup_waiter()
+
+    def _wakeup_waiter(self):
+        # The woken coroutine checks the limits again by itself.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def _schedule_cleanup(self):
+        if self._cleanup_handle is None and self._keepalive_timeout:
+            self._cleanup_handle = self._loop.call_later(
+                self._keepalive_timeout, self._cleanup)
+
+    def _cleanup(self):
+        # Close the connections which have been idle for too long.
+        self._cleanup_handle = None
+
+        deadline = self._loop.time() - self._keepalive_timeout
+        for key, conns in list(self._idle.items()):
+            while conns and (conns[0].last_used <= deadline or
+                             conns[0].is_stale()):
+                conn = conns.popleft()
+                self._idle_count -= 1
+                conn.close()
+                self._forget(key)
+            if not conns:
+                del self._idle[key]
+
+        if self._idle_count:
+            self._schedule_cleanup()
+
+
+class ClientRequest:
+    def __init__(self, method, url, host):
+        self.method = method.upper()
+        self.url = url
+        self.host = host
+
+    def send(self, writer):
+        crlf = '\r\n'
+
+        # Start line
+        request = '{} {} HTTP/1.1'.format(self.method, self.url)
+        request += crlf
+
+        # Header fields
+        request += 'Host: {}'.format(self.host)
+        request += crlf
+        request += 'Connection: keep-alive'
+        request += crlf
+
+        request += crlf  # End of Headers
+
+        writer.write(request.encode())
+
+
+class ClientResponse:
+    def __init__(self, message, content):
+        self.version = message.version
+        self.status = message.status
+        self.reason = message.reason
+        self.headers = message.headers
+        self.content = content  # Reader of the body.
+        self._body = None
+
+    async def read(self):
+        if self._body is None:
+            self._body = await self.content.read()
+        return self._body
+
+
+class ClientSession:
+    def __init__(self, loop, connector=None):
+        self._loop = loop
+        self._connector = connector or Connector(loop)
+
+    @property
+    def connector(self):
+        return self._connector
+
+    async def get(self, url, host, port):
+        conn = await self._connector.acquire(host, port)
+
+        keep_alive = False
+        try:
+            req = ClientRequest('GET', url, host)
+            conn.protocol.start_response(req.method)
+            req.send(conn.writer)
+
+            message, content = await conn.protocol.read_headers()
+            resp = ClientResponse(message, content)
+            await resp.read()
+            keep_alive = message.keep_alive
+        finally:
+            # Put the connection back to the pool only if the response has
+            # been completely read.
+            self._connector.release(conn, keep_alive)
+
+        return resp
+
+    def close(self):
+        self._connector.close()
+
+
+async def main(loop):
+    connector = Connector(loop, limit=10, limit_per_host=4)
+    session = ClientSession(loop, connector)
+
+    # The first requests open connections, the rest reuse them.
+    for _ in range(3):
+        responses = await asyncio.gather(
+            *[session.get('/', 'localhost', 8000) for _ in range(8)])
+
+    resp = responses[0]
+    print(resp.status, resp.reason)
+    print(resp.headers)
+    print((await resp.read()).decode())
+    print(connector.stats())
+
+    session.close()
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(loop))
@@ -0,0 +1,1732 @@
+import asyncio
+import collections
+import functools
+import os
+import re
+import socket
+import zlib
+
+# HTTP client asking for compressed responses.
+# Send Accept-Encoding, add class ContentDecoder to decompress gzip or deflate
+# bodies incrementally as they are received.
+# Based on http_client_v17_response.py.
+
+
+class Writer:
+    def __init__(self, transport, protocol):
+        self._transport = transport
+        self._protocol = protocol
+
+    @property
+    def transport(self):
+        return self._transport
+
+    def write(self, data):
+        self._transport.write(data)
+
+    def writelines(self, data):
+        # Send a sequence of buffers, e.g. the headers and the body, without
+        # concatenating them first. Since Python 3.12 the selector transport
+        # sends them with a single sendmsg() call.
+        self._transport.writelines(data)
+
+    async def drain(self):
+        # Wait until the write buffer of the transport is drained to the low
+        # water mark. Call it after each big write.
+        await self._protocol.drain()
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        self._transport.set_write_buffer_limits(high, low)
+
+    def get_write_buffer_size(self):
+        return self._transport.get_write_buffer_size()
+
+    def close(self):
+        self._transport.close()
+
+    def is_closing(self):
+        return self._transport.is_closing()
+
+
+class Reader:
+    """Buffer of the received data.
+
+    The data is kept as a deque of chunks, as it's fed, and handed out with
+    memoryview slicing, so each byte is copied at most once. The data fed
+    must not be modified afterwards.
+
+    If a protocol is given, reading is paused once more than high_water
+    bytes are buffered, and resumed once they are drained to low_water.
+    """
+
+    def __init__(self, loop, protocol=None, high_water=2 ** 18,
+                 low_water=None):
+        if low_water is None:
+            low_water = high_water // 4
+        if not 0 <= low_water <= high_water:
+            raise ValueError('high_water ({}) must be >= low_water ({}) '
+                             '>= 0'.format(high_water, low_water))
+
+        self._loop = loop
+        self._protocol = protocol
+        self._high_water = high_water
+        self._low_water = low_water
+        self._paused = False
+        self._chunks = collections.deque()  # bytes or memoryview
+        self._size = 0  # Total bytes in the chunks.
+        self._eof = False  # EOF received or not.
+        self._exception = None
+        self._waiter = None  # A future used to wait for data.
+
+    def set_protocol(self, protocol):
+        # Pause and resume another object, e.g. a ContentDecoder between
+        # the Reader and the protocol.
+        self._protocol = protocol
+
+    def set_exception(self, exc):
+        self._exception = exc
+        waiter = self._waiter
+        if waiter:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_exception(exc)
+
+    def feed(self, data):
+        if not data:
+            return
+        if isinstance(data, memoryview) and isinstance(data.obj, bytes) \
+                and data.nbytes == len(data.obj):
+            # A view of the whole bytes object, keep the object itself so
+            # that it could be returned as it is.
+            data = data.obj
+        self._chunks.append(data)
+        self._size += len(data)
+        self._wakeup_waiter()
+
+        if (self._protocol is not None and not self._paused and
+                self._size > self._high_water):
+            self._paused = True
+            self._protocol.pause_reading()
+
+    def feed_eof(self):
+        self._eof = True
+        self._wakeup_waiter()
+
+    def at_eof(self):
+        return self._eof and not self._size
+
+    async def read(self, n=-1):
+        # -1 means read until EOF, otherwise read at most n bytes.
+        if n < 0:
+            # Move the chunks out as they come, or the reading would be
+            # paused forever before EOF.
+            parts = []
+            while True:
+                while self._size:
+                    parts.extend(self._chunks)
+                    self._chunks.clear()
+                    self._size = 0
+                    # A ContentDecoder feeds more data right away when
+                    # resumed.
+                    self._maybe_resume()
+                if self._eof:
+                    break
+                await self._wait_for_data()
+
+            if len(parts) == 1 and isinstance(parts[0], bytes):
+                return parts[0]
+            return b''.join(parts)
+
+        if not self._size and not self._eof:
+            await self._wait_for_data()
+        return self._take(min(n, self._size))
+
+    async def readexactly(self, n):
+        while self._size < n:
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._take(self._size), n)
+            await self._wait_for_data()
+
+        return self._take(n)
+
+    async def readuntil(self, separator=b'\n'):
+        # Read until the separator is found, the separator is included.
+        start = 0
+        while True:
+            index = self._find(separator, start)
+            if index != -1:
+                return self._take(index + len(separator))
+
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._take(self._size), None)
+
+            # Don't search the bytes already checked again.
+            start = max(0, self._size - len(separator) + 1)
+            await self._wait_for_data()
+
+    async def readinto(self, buffer):
+        # Copy the data into the given writable buffer, return the number of
+        # bytes copied, 0 means EOF.
+        if not self._size and not self._eof:
+            await self._wait_for_data()
+
+        dest = memoryview(buffer).cast('B')
+        copied = 0
+        while self._chunks and copied < len(dest):
+            chunk = self._chunks[0]
+            size = min(len(chunk), len(dest) - copied)
+            dest[copied:copied + size] = memoryview(chunk)[:size]
+            copied += size
+            self._consume(size)
+        return copied
+
+    def _find(self, separator, start):
+        # Search the separator across the chunks from position start.
+        # Return the index of the separator or -1.
+        seplen = len(separator)
+        pos = 0  # Position of the current chunk.
+        tail = b''  # Last (seplen - 1) bytes of the previous chunk.
+        for chunk in self._chunks:
+            size = len(chunk)
+            if pos + size > start:
+                if seplen > 1 and tail:
+                    # The separator may span the chunk boundary.
+                    window = tail + bytes(chunk[:seplen - 1])
+                    index = window.find(separator)
+                    if index != -1 and pos - len(tail) + index >= start:
+                        return pos - len(tail) + index
+
+                # memoryview has no find(), a compiled pattern could search
+                # the view without copying it.
+                match = _search_pattern(separator).search(
+                    chunk, max(0, start - pos))
+                if match:
+                    return pos + match.start()
+
+            if seplen > 1:
+                tail = (tail + bytes(chunk[-(seplen - 1):]))[-(seplen - 1):]
+            pos += size
+        return -1
+
+    def _take(self, n):
+        # Remove n bytes from the chunks and return them as bytes.
+        chunks = self._chunks
+        if not n:
+            return b''
+
+        first = chunks[0]
+        if len(first) == n and isinstance(first, bytes):
+            # No copy at all.
+            self._consume(n)
+            return first
+        if len(first) >= n:
+            data = bytes(memoryview(first)[:n])
+            self._consume(n)
+            return data
+
+        parts = []
+        left = n
+        while left:
+            chunk = chunks[0]
+            size = min(len(chunk), left)
+            parts.append(memoryview(chunk)[:size])
+            self._consume(size)
+            left -= size
+        return b''.join(parts)
+
+    def _consume(self, n):
+        # Remove n bytes from the first chunk, n <= length of the chunk.
+        chunk = self._chunks[0]
+        if n == len(chunk):
+            self._chunks.popleft()
+        else:
+            self._chunks[0] = memoryview(chunk)[n:]
+        self._size -= n
+        self._maybe_resume()
+
+    def _maybe_resume(self):
+        if self._paused and self._size <= self._low_water:
+            self._paused = False
+            self._protocol.resume_reading()
+
+    async def _wait_for_data(self):
+        if self._exception is not None:
+            raise self._exception
+
+        assert not self._eof
+        assert not self._waiter
+
+        self._waiter = self._loop.create_future()
+        await self._waiter
+        self._waiter = None
+
+    def _wakeup_waiter(self):
+        waiter = self._waiter
+        if waiter:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+@functools.lru_cache(maxsize=16)
+def _search_pattern(separator):
+    return re.compile(re.escape(separator))
+
+
+class HttpParserError(Exception):
+    pass
+
+
+class PipelineError(ConnectionResetError):
+    """The connection closed in the middle of a pipeline, and the requests
+    not answered can't be sent again automatically.
+    """
+
+    def __init__(self, message, responses, requests):
+        super().__init__(message)
+        self.responses = responses  # Received, in the order of the requests.
+        self.requests = requests  # Not answered.
+
+
+class ResponseMessage:
+    def __init__(self, version, status, reason, headers):
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers  # Lower case names.
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            self.keep_alive = connection == 'keep-alive'
+        else:
+            self.keep_alive = connection != 'close'
+
+        self.chunked = 'chunked' in headers.get(
+            'transfer-encoding', '').lower()
+        # The body is decompressed, Content-Length doesn't match it.
+        self.content_decoded = False
+
+
+class ResponseParser:
+    """Incremental HTTP/1.1 response parser.
+
+    Data is fed as it's received, the handler is notified with
+    on_headers(message) as soon as the status line and headers are complete,
+    then on_body(data) for each piece of the body and finally
+    on_message_complete(). Data already parsed is never scanned again.
+    """
+
+    # States
+    HEAD = 0
+    BODY_LENGTH = 1
+    BODY_EOF = 2
+    CHUNK_SIZE = 3
+    CHUNK_DATA = 4
+    CHUNK_DATA_END = 5
+    CHUNK_TRAILERS = 6
+
+    def __init__(self, handler, max_head_size=65536):
+        self._handler = handler
+        self._max_head_size = max_head_size
+        self._buffer = bytearray()  # Incomplete head or chunk lines.
+        self._scanned = 0  # Bytes of the buffer already searched.
+        self._state = self.HEAD
+        self._remaining = 0  # Body or chunk bytes not received yet.
+        self._no_body = False
+
+    def reset(self, no_body=False):
+        # no_body: The response of a HEAD request has no body.
+        self._buffer.clear()
+        self._scanned = 0
+        self._state = self.HEAD
+        self._remaining = 0
+        self._no_body = no_body
+
+    def expect(self, no_body=False):
+        # Set whether the next response has a body, for pipelined requests.
+        self._no_body = no_body
+
+    def is_idle(self):
+        return self._state == self.HEAD and not self._buffer
+
+    def feed_data(self, data):
+        data = memoryview(data)
+        while data:
+            state = self._state
+            if state == self.HEAD:
+                data = self._parse_head(data)
+            elif state == self.BODY_LENGTH or state == self.CHUNK_DATA:
+                data = self._parse_body(data)
+            elif state == self.BODY_EOF:
+                self._handler.on_body(data)
+                data = None
+            elif state == self.CHUNK_TRAILERS:
+                data = self._parse_trailers(data)
+            else:
+                data = self._parse_chunk_line(data)
+
+    def feed_eof(self):
+        if self._state == self.BODY_EOF:
+            self._state = self.HEAD
+            self._handler.on_message_complete()
+        elif not self.is_idle():
+            raise HttpParserError('Connection closed in the middle of '
+                                  'a response.')
+
+    def _find_line(self, data, separator):
+        # Buffer the data and search the separator from where the last
+        # search stopped. Return the line and the data left, or None and an
+        # empty memoryview if the line is not complete yet.
+        buffer = self._buffer
+        start = max(0, self._scanned - len(separator) + 1)
+        buffer.extend(data)
+
+        index = buffer.find(separator, start)
+        if index == -1:
+            if len(buffer) > self._max_head_size:
+                raise HttpParserError('Line or header too long.')
+            self._scanned = len(buffer)
+            return None, memoryview(b'')
+
+        end = index + len(separator)
+        line = bytes(buffer[:index])
+        # The bytes after the separator are not part of the line.
+        rest = len(buffer) - end
+        data = data[len(data) - rest:] if rest else memoryview(b'')
+
+        buffer.clear()
+        self._scanned = 0
+        return line, data
+
+    def _parse_head(self, data):
+        head, data = self._find_line(data, b'\r\n\r\n')
+        if head is None:
+            return data
+
+        lines = head.decode('latin-1').split('\r\n')
+
+        try:
+            version, status, reason = (lines[0].split(' ', 2) + [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise HttpParserError('Bad status line: {!r}'.format(lines[0]))
+        if not version.startswith('HTTP/'):
+            raise HttpParserError('Bad status line: {!r}'.format(lines[0]))
+
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise HttpParserError('Bad header: {!r}'.format(line))
+            name = name.strip().lower()
+            value = value.strip()
+            if name in headers:
+                headers[name] += ', ' + value
+            else:
+                headers[name] = value
+
+        message = ResponseMessage(version, status, reason, headers)
+
+        if 100 <= status < 200:
+            # Informational response, the final one follows.
+            return data
+
+        self._handler.on_headers(message)
+
+        if (self._no_body or status in (204, 304)):
+            self._message_complete()
+        elif message.chunked:
+            self._state = self.CHUNK_SIZE
+        elif 'content-length' in headers:
+            length = headers['content-length']
+            # Digits only, int() takes a sign and spaces too.
+            if not (length.isascii() and length.isdigit()):
+                raise HttpParserError('Bad Content-Length.')
+            self._remaining = int(length)
+            if self._remaining:
+                self._state = self.BODY_LENGTH
+            else:
+                self._message_complete()
+        else:
+            # No framing, the body ends when the connection is closed.
+            message.keep_alive = False
+            self._state = self.BODY_EOF
+
+        return data
+
+    def _parse_body(self, data):
+        size = min(self._remaining, len(data))
+        self._handler.on_body(data[:size])
+        self._remaining -= size
+
+        if not self._remaining:
+            if self._state == self.CHUNK_DATA:
+                self._state = self.CHUNK_DATA_END
+            else:
+                self._message_complete()
+
+        return data[size:]
+
+    def _parse_chunk_line(self, data):
+        line, data = self._find_line(data, b'\r\n')
+        if line is None:
+            return data
+
+        if self._state == self.CHUNK_DATA_END:
+            if line:
+                raise HttpParserError('Bad chunk end.')
+            self._state = self.CHUNK_SIZE
+            return data
+
+        # Ignore chunk extensions.
+        size = line.split(b';', 1)[0].strip()
+        try:
+            self._remaining = int(size, 16)
+        except ValueError:
+            raise HttpParserError('Bad chunk size: {!r}'.format(size))
+
+        if self._remaining:
+            self._state = self.CHUNK_DATA
+        else:
+            self._state = self.CHUNK_TRAILERS
+        return data
+
+    def _parse_trailers(self, data):
+        # Trailers are not used, skip them until an empty line.
+        line, data = self._find_line(data, b'\r\n')
+        if line is not None and not line:
+            self._message_complete()
+        return data
+
+    def _message_complete(self):
+        self._state = self.HEAD
+        self._remaining = 0
+        self._handler.on_message_complete()
+
+
+class ContentDecodingError(HttpParserError):
+    pass
+
+
+class ContentDecoder:
+    """Incremental gzip/deflate decoder of the body.
+
+    The data is decompressed as it's received and fed to the Reader. The
+    output of each input is produced in bounded pieces and checked against
+    max_size and max_ratio, to stop decompression bombs before they are
+    expanded in memory.
+
+    The decoder sits between the Reader and the protocol for the flow
+    control: while the Reader is full, the input left is kept compressed
+    and the protocol is paused, decompression goes on when the Reader is
+    read down to its low water mark.
+    """
+
+    PIECE_SIZE = 65536
+
+    def __init__(self, encoding, reader, protocol, max_size=2 ** 30,
+                 max_ratio=1000):
+        self._encoding = encoding
+        self._reader = reader
+        self._protocol = protocol
+        self._max_size = max_size
+        self._max_ratio = max_ratio
+        self._compressed = 0
+        self._decompressed = 0
+        self._paused = False  # The Reader is full.
+        self._tail = b''  # Input not decompressed yet.
+        self._complete = False  # The whole body is received.
+        reader.set_protocol(self)
+
+        if encoding in ('gzip', 'x-gzip'):
+            self._decompressobj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompressobj = zlib.decompressobj(zlib.MAX_WBITS)
+        self._raw_deflate_tried = encoding in ('gzip', 'x-gzip')
+
+    def feed(self, data):
+        self._compressed += len(data)
+        if self._tail:
+            # Paused, keep the order of the input.
+            self._tail += data
+            return
+        try:
+            self._decompress(data)
+        except zlib.error as exc:
+            # Some servers send raw deflate data without the zlib header,
+            # that's found out with the first data.
+            if self._raw_deflate_tried or self._compressed != len(data):
+                raise self._error(exc)
+            self._raw_deflate_tried = True
+            self._decompressobj = zlib.decompressobj(-zlib.MAX_WBITS)
+            self._compressed = 0
+            self.feed(data)
+
+    def flush(self):
+        # Called when the body is complete. The Reader gets EOF once the
+        # input kept while paused is decompressed.
+        self._complete = True
+        if not self._tail:
+            self._finish()
+
+    def pause_reading(self):
+        # Called by the Reader.
+        self._paused = True
+        self._protocol.pause_reading()
+
+    def resume_reading(self):
+        # Called by the Reader.
+        self._paused = False
+        try:
+            if self._tail:
+                self._decompress(self._tail)
+            if self._complete and not self._tail:
+                self._finish()
+        except (zlib.error, ContentDecodingError) as exc:
+            # The response may be complete already, fail its body only.
+            if isinstance(exc, zlib.error):
+                exc = self._error(exc)
+            self._reader.set_exception(exc)
+            self._protocol.transport.close()
+            return
+        if not self._paused:
+            self._protocol.resume_reading()
+
+    def _finish(self):
+        self._complete = False
+        # The stream ends by itself, a body without its end is truncated.
+        if not self._decompressobj.eof:
+            raise ContentDecodingError(
+                'Truncated {} body.'.format(self._encoding))
+        self._feed_reader(self._decompressobj.flush())
+        self._reader.feed_eof()
+
+    def _error(self, exc):
+        return ContentDecodingError(
+            'Can not decode {}: {}'.format(self._encoding, exc))
+
+    def _decompress(self, data):
+        # Stop when the Reader is full, the rest is kept in _tail.
+        decompressobj = self._decompressobj
+        while data and not self._paused:
+            piece = decompressobj.decompress(data, self.PIECE_SIZE)
+            data = decompressobj.unconsumed_tail
+            self._feed_reader(piece)
+        # bytes, data may be a memoryview of the parser, valid during the
+        # call only.
+        self._tail = bytes(data)
+
+    def _feed_reader(self, piece):
+        if not piece:
+            return
+
+        self._decompressed += len(piece)
+        if self._max_size and self._decompressed > self._max_size:
+            raise ContentDecodingError(
+                'Decompressed body exceeds {} bytes.'.format(self._max_size))
+        # The ratio of small bodies doesn't matter.
+        if (self._max_ratio and self._decompressed > 2 ** 20 and
+                self._decompressed > self._compressed * self._max_ratio):
+            raise ContentDecodingError(
+                'Compression ratio exceeds {}.'.format(self._max_ratio))
+
+        self._reader.feed(piece)
+
+
+class ClientProtocol(asyncio.Protocol):
+    def __init__(self, loop):
+        self.loop = loop
+        self.transport = None
+        self.closed = False
+        self._parser = ResponseParser(self)
+        # Responses expected, in the order of the requests sent, each is
+        # (method, waiter, payload, decompress). The waiter is a future of
+        # the response message, the payload is the Reader of the body.
+        self._pending = collections.deque()
+        self._decoder = None  # ContentDecoder of the current response.
+        self._unexpected_data = False
+        self._reading_paused = False
+        self._writing_paused = False
+        self._drain_waiters = collections.deque()
+
+    def start_response(self, method='GET', high_water=2 ** 18,
+                       low_water=None, decompress=None):
+        # Must be called before the request is sent. Could be called again
+        # before the previous response is received, to pipeline requests.
+        # Return a future of (message, payload).
+        # decompress: (max_size, max_ratio) of ContentDecoder to decode a
+        # compressed body, None to keep it as it is.
+        if not self._pending:
+            self._parser.reset(no_body=method == 'HEAD')
+            self._decoder = None
+
+        waiter = self.loop.create_future()
+        payload = Reader(self.loop, self, high_water, low_water)
+        self._pending.append((method, waiter, payload, decompress))
+        return waiter
+
+    def pause_reading(self):
+        if not self._reading_paused and not self.closed:
+            self._reading_paused = True
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        if self._reading_paused and not self.closed:
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    def is_idle(self):
+        return (not self._pending and not self._unexpected_data and
+                self._parser.is_idle())
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        if not self._pending:
+            # Nothing is expected, the connection can't be reused.
+            self._unexpected_data = True
+            return
+
+        try:
+            self._parser.feed_data(data)
+        except HttpParserError as exc:
+            self._set_exception(exc)
+            self.transport.close()
+
+    def eof_received(self):
+        self._feed_eof()
+
+    def pause_writing(self):
+        # Called by the transport when its buffer is above the high water
+        # mark.
+        self._writing_paused = True
+
+    def resume_writing(self):
+        # Called by the transport when its buffer is drained to the low water
+        # mark.
+        self._writing_paused = False
+        self._wakeup_drain_waiters(None)
+
+    async def drain(self):
+        if self.closed:
+            raise ConnectionResetError('Connection lost.')
+        if not self._writing_paused:
+            return
+
+        waiter = self.loop.create_future()
+        self._drain_waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            if waiter in self._drain_waiters:
+                self._drain_waiters.remove(waiter)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._wakeup_drain_waiters(exc or ConnectionResetError(
+            'Connection lost.'))
+        self._feed_eof(exc)
+
+    # Handler methods called by the parser.
+
+    def on_headers(self, message):
+        if not self._pending:
+            raise HttpParserError('Unexpected response.')
+        _, waiter, payload, decompress = self._pending[0]
+
+        encoding = message.headers.get('content-encoding', '').lower()
+        if decompress and encoding in ('gzip', 'x-gzip', 'deflate'):
+            self._decoder = ContentDecoder(encoding, payload, self,
+                                           *decompress)
+            message.content_decoded = True
+
+        if not waiter.done():
+            waiter.set_result((message, payload))
+
+    def on_body(self, data):
+        if self._decoder is not None:
+            self._decoder.feed(data)
+        else:
+            self._pending[0][2].feed(data)
+
+    def on_message_complete(self):
+        if not self._pending:
+            raise HttpParserError('Unexpected response.')
+        _, _, payload, _ = self._pending[0]
+        if self._decoder is not None:
+            # Feeds EOF to the payload, later if the input isn't all
+            # decompressed yet. Raises before the response is removed if
+            # the body is truncated.
+            self._decoder.flush()
+            self._decoder = None
+        else:
+            payload.feed_eof()
+        self._pending.popleft()
+
+        if self._pending:
+            # Parse the next pipelined response.
+            self._parser.expect(no_body=self._pending[0][0] == 'HEAD')
+
+        # Nothing more to buffer for this response, the rest of the body
+        # is in the Reader already, or kept compressed by its decoder.
+        self.resume_reading()
+
+    def _wakeup_drain_waiters(self, exc):
+        while self._drain_waiters:
+            waiter = self._drain_waiters.popleft()
+            if waiter.done():
+                continue
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+    def _feed_eof(self, exc=None):
+        if not self._pending:
+            return
+
+        # Complete the response if its body ends with the connection.
+        try:
+            self._parser.feed_eof()
+        except HttpParserError as err:
+            exc = exc or err
+
+        if self._pending:
+            self._set_exception(exc or ConnectionResetError(
+                'Connection closed before the response is complete.'))
+
+    def _set_exception(self, exc):
+        # Fail all the responses expected.
+        self._decoder = None
+        while self._pending:
+            _, waiter, payload, _ = self._pending.popleft()
+            if not waiter.done():
+                waiter.set_exception(exc)
+            payload.set_exception(exc)
+
+
+class Connection:
+    def __init__(self, key, protocol, writer):
+        self.key = key  # (host, port)
+        self.protocol = protocol
+        self.writer = writer
+        self.last_used = None  # Loop time when released to the pool.
+
+    def is_stale(self):
+        # The server may close an idle connection at any time. A closed
+        # transport, an EOF or any unexpected data received while idle
+        # means the connection can't be used for another request.
+        return (self.protocol.closed or
+                self.writer.is_closing() or
+                not self.protocol.is_idle())
+
+    def close(self):
+        self.writer.close()
+
+
+class Resolver:
+    """Cache of host name resolution results.
+
+    ttl: Seconds a result is cached. getaddrinfo() doesn't tell the TTL of
+    the DNS records, so it's the same for all hosts.
+    resolve: Coroutine function (host, port) returning a list of
+    getaddrinfo() like tuples (family, type, proto, canonname, sockaddr).
+    loop.getaddrinfo() by default, which runs in the default executor. Give
+    a fake one to test without network.
+
+    Concurrent lookups of the same (host, port) share one resolution.
+    """
+
+    def __init__(self, loop, ttl=60.0, resolve=None):
+        self._loop = loop
+        self._ttl = ttl
+        self._resolve = resolve or self._getaddrinfo
+        self._cache = {}  # (host, port) -> (expire time, infos)
+        self._lookups = {}  # (host, port) -> future of the lookup running
+
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+    async def resolve(self, host, port):
+        key = (host, port)
+
+        entry = self._cache.get(key)
+        if entry is not None:
+            expire, infos = entry
+            if self._loop.time() < expire:
+                self._hits += 1
+                return infos
+            del self._cache[key]
+
+        lookup = self._lookups.get(key)
+        if lookup is not None:
+            # Another coroutine is resolving the same host, wait for it.
+            self._coalesced += 1
+        else:
+            self._misses += 1
+            lookup = self._loop.create_task(self._lookup(key))
+            self._lookups[key] = lookup
+
+        # Shield the lookup, the other coroutines waiting for it shouldn't be
+        # cancelled with this one.
+        return await asyncio.shield(lookup)
+
+    def invalidate(self, host, port):
+        # E.g. when none of the addresses could be connected.
+        self._cache.pop((host, port), None)
+
+    def stats(self):
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'coalesced': self._coalesced,
+            'entries': len(self._cache),
+        }
+
+    async def _lookup(self, key):
+        try:
+            infos = await self._resolve(*key)
+            if not infos:
+                raise OSError('getaddrinfo() returned empty list')
+            self._cache[key] = (self._loop.time() + self._ttl, infos)
+            return infos
+        finally:
+            del self._lookups[key]
+
+    async def _getaddrinfo(self, host, port):
+        return await self._loop.getaddrinfo(host, port,
+                                            type=socket.SOCK_STREAM)
+
+
+def _interleave_families(infos):
+    # Alternate the address families, IPv6 first if it's first, so that a
+    # broken family doesn't delay the other one by all its addresses.
+    by_family = collections.OrderedDict()
+    for info in infos:
+        by_family.setdefault(info[0], []).append(info)
+    groups = list(by_family.values())
+
+    interleaved = []
+    for i in range(max(len(group) for group in groups)):
+        for group in groups:
+            if i < len(group):
+                interleaved.append(group[i])
+    return interleaved
+
+
+class Connector:
+    """Pool of idle HTTP/1.1 keep-alive connections per (host, port).
+
+    limit: Max number of open connections, in use and idle. 0 for no limit.
+    limit_per_host: Max number of open connections per (host, port).
+    keepalive_timeout: Seconds an idle connection is kept in the pool.
+    resolver: Resolver of the host names, a new one by default.
+    happy_eyeballs_delay: Seconds to wait for a connection attempt before
+    starting the next one to another address of the host.
+    """
+
+    def __init__(self, loop, limit=100, limit_per_host=0,
+                 keepalive_timeout=15.0, resolver=None,
+                 happy_eyeballs_delay=0.25):
+        self._loop = loop
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._resolver = resolver or Resolver(loop)
+        self._happy_eyeballs_delay = happy_eyeballs_delay
+
+        # Idle connections per key, the most recently used one at the right.
+        self._idle = collections.defaultdict(collections.deque)
+        self._idle_count = 0
+        # Open connections (in use or idle, or being connected) per key.
+        self._opened = collections.Counter()
+        self._opened_count = 0
+        self._in_use = 0
+
+        # Futures of the coroutines waiting for a free slot.
+        self._waiters = collections.deque()
+        self._cleanup_handle = None
+        self._closed = False
+
+        self._hits = 0
+        self._misses = 0
+
+    async def acquire(self, host, port):
+        if self._closed:
+            raise RuntimeError('Connector is closed.')
+
+        key = (host, port)
+
+        while True:
+            conn = self._get_idle(key)
+            if conn is not None:
+                self._hits += 1
+                self._in_use += 1
+                return conn
+
+            if self._has_capacity(key):
+                break
+
+            # Make room by closing an idle connection of another host.
+            if self._has_host_capacity(key) and self._close_oldest_idle():
+                break
+
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # Woken but cancelled, pass the wakeup on.
+                    self._wakeup_waiter()
+                raise
+
+        self._misses += 1
+
+        # Reserve the slot before connecting so that concurrent acquires
+        # don't exceed the limits.
+        self._opened[key] += 1
+        self._opened_count += 1
+        try:
+            conn = await self._create_connection(key)
+        except BaseException:
+            self._forget(key)
+            raise
+
+        self._in_use += 1
+        return conn
+
+    def release(self, conn, keep_alive=True):
+        self._in_use -= 1
+
+        if keep_alive and not self._closed and not conn.is_stale():
+            conn.last_used = self._loop.time()
+            self._idle[conn.key].append(conn)
+            self._idle_count += 1
+            self._schedule_cleanup()
+            self._wakeup_waiter()
+        else:
+            conn.close()
+            self._forget(conn.key)
+
+    def stats(self):
+        total = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'in_use': self._in_use,
+            'idle': self._idle_count,
+            'reuse_rate': self._hits / total if total else 0.0,
+        }
+
+    def close(self):
+        self._closed = True
+
+        if self._cleanup_handle:
+            self._cleanup_handle.cancel()
+            self._cleanup_handle = None
+
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.close()
+        self._idle.clear()
+        self._idle_count = 0
+
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_exception(RuntimeError('Connector is closed.'))
+        self._waiters.clear()
+
+    @property
+    def resolver(self):
+        return self._resolver
+
+    async def _create_connection(self, key):
+        host, port = key
+        infos = await self._resolver.resolve(host, port)
+        try:
+            transport, protocol = await self._connect_staggered(
+                _interleave_families(infos))
+        except OSError:
+            # The addresses may be outdated.
+            self._resolver.invalidate(host, port)
+            raise
+
+        writer = Writer(transport, protocol)
+        return Connection(key, protocol, writer)
+
+    async def _connect_staggered(self, infos):
+        # Start a connection attempt to each address in turn, the next one
+        # starts when the previous one fails or is not done in
+        # happy_eyeballs_delay seconds. The first one connected wins.
+        def connect(info):
+            return self._loop.create_task(self._connect(info))
+
+        infos = iter(infos)
+        attempts = set()
+        errors = []
+        winner = None
+        try:
+            while winner is None:
+                info = next(infos, None)
+                if info is not None:
+                    attempts.add(connect(info))
+                if not attempts:
+                    break
+
+                timeout = self._happy_eyeballs_delay if info else None
+                done, attempts = await asyncio.wait(
+                    attempts, timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED)
+
+                for attempt in done:
+                    if attempt.exception() is not None:
+                        errors.append(attempt.exception())
+                    elif winner is None:
+                        winner = attempt.result()
+                    else:
+                        attempt.result()[0].close()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+            if attempts:
+                await asyncio.wait(attempts)
+            # Close the connections made while cancelling.
+            for attempt in attempts:
+                if not attempt.cancelled() and attempt.exception() is None:
+                    attempt.result()[0].close()
+
+        if winner is None:
+            if len(errors) == 1:
+                raise errors[0]
+            raise OSError('Multiple exceptions: {}'.format(
+                ', '.join(str(exc) for exc in errors)))
+        return winner
+
+    async def _connect(self, info):
+        # Connect to the whole sockaddr, an IPv6 one has the flow info and
+        # the scope id of a link-local address after the host and the port.
+        # The address is numeric, no getaddrinfo() in the executor.
+        family, type_, proto, _, sockaddr = info
+        sock = socket.socket(family, type_, proto)
+        try:
+            sock.setblocking(False)
+            await self._loop.sock_connect(sock, sockaddr)
+            return await self._loop.create_connection(
+                lambda: ClientProtocol(self._loop), sock=sock)
+        except BaseException:
+            sock.close()
+            raise
+
+    def _get_idle(self, key):
+        conns = self._idle.get(key)
+        if not conns:
+            return None
+
+        now = self._loop.time()
+        while conns:
+            conn = conns.pop()
+            self._idle_count -= 1
+            if (now - conn.last_used < self._keepalive_timeout and
+                    not conn.is_stale()):
+                return conn
+            conn.close()
+            self._forget(key)
+
+        return None
+
+    def _has_host_capacity(self, key):
+        return (not self._limit_per_host or
+                self._opened[key] < self._limit_per_host)
+
+    def _has_capacity(self, key):
+        if self._limit and self._opened_count >= self._limit:
+            return False
+        return self._has_host_capacity(key)
+
+    def _close_oldest_idle(self):
+        oldest = None
+        for conns in self._idle.values():
+            if conns and (oldest is None or
+                          conns[0].last_used < oldest.last_used):
+                oldest = conns[0]
+
+        if oldest is None:
+            return False
+
+        self._idle[oldest.key].popleft()
+        self._idle_count -= 1
+        oldest.close()
+        self._forget(oldest.key)
+        return True
+
+    def _forget(self, key):
+        self._opened[key] -= 1
+        if not self._opened[key]:
+            del self._opened[key]
+        self._opened_count -= 1
+        self._wakeup_waiter()
+
+    def _wakeup_waiter(self):
+        # The woken coroutine checks the limits again by itself.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def _schedule_cleanup(self):
+        if self._cleanup_handle is None and self._keepalive_timeout:
+            self._cleanup_handle = self._loop.call_later(
+                self._keepalive_timeout, self._cleanup)
+
+    def _cleanup(self):
+        # Close the connections which have been idle for too long.
+        self._cleanup_handle = None
+
+        deadline = self._loop.time() - self._keepalive_timeout
+        for key, conns in list(self._idle.items()):
+            while conns and (conns[0].last_used <= deadline or
+                             conns[0].is_stale()):
+                conn = conns.popleft()
+                self._idle_count -= 1
+                conn.close()
+                self._forget(key)
+            if not conns:
+                del self._idle[key]
+
+        if self._idle_count:
+            self._schedule_cleanup()
+
+
+class ClientRequest:
+    """HTTP request.
+
+    body could be:
+    - None
+    - bytes, bytearray or memoryview, sent with Content-Length.
+    - An async iterable of bytes chunks, sent with chunked transfer-encoding.
+    - A file opened in binary mode, sent from its current position with
+      loop.sendfile(), i.e., os.sendfile() if the platform supports it.
+    """
+
+    def __init__(self, method, url, host, headers=None, body=None):
+        self.method = method.upper()
+        self.url = url
+        self.host = host
+        self.headers = dict(headers or {})
+        self.body = body
+
+    def _make_head(self, body_headers):
+        # Encode each piece once and join them, no string concatenation.
+        parts = [b'%s %s HTTP/1.1\r\n' % (self.method.encode('ascii'),
+                                         self.url.encode('ascii')),
+                 b'Host: %s\r\n' % self.host.encode('idna'),
+                 b'Connection: keep-alive\r\n']
+        for headers in (self.headers, body_headers):
+            for name, value in headers.items():
+                parts.append(b'%s: %s\r\n' % (name.encode('latin-1'),
+                                              str(value).encode('latin-1')))
+        parts.append(b'\r\n')  # End of Headers
+        return b''.join(parts)
+
+    async def send(self, writer, loop):
+        body = self.body
+
+        if body is None:
+            writer.write(self._make_head({}))
+            await writer.drain()
+
+        elif isinstance(body, (bytes, bytearray, memoryview)):
+            head = self._make_head({'Content-Length': len(body)})
+            writer.writelines([head, body])
+            await writer.drain()
+
+        elif hasattr(body, '__aiter__'):
+            writer.write(self._make_head({'Transfer-Encoding': 'chunked'}))
+            async for chunk in body:
+                if chunk:
+                    writer.writelines([b'%x\r\n' % len(chunk), chunk, b'\r\n'])
+                    await writer.drain()
+            writer.write(b'0\r\n\r\n')  # Last chunk
+            await writer.drain()
+
+        elif hasattr(body, 'fileno'):
+            offset = body.tell()
+            count = os.fstat(body.fileno()).st_size - offset
+            writer.write(self._make_head({'Content-Length': count}))
+            await writer.drain()
+            # The file is sent by the kernel, without being read into user
+            # space. It falls back to read and write if not supported.
+            await loop.sendfile(writer.transport, body, offset, count)
+
+        else:
+            raise TypeError('Unsupported body type: {}'.format(type(body)))
+
+
+class ClientResponse:
+    """HTTP response, the body is streamed from the connection.
+
+    The connection is put back to the pool once the body is completely
+    read. Call release() or use `async with` to give it up earlier, the
+    connection is closed then.
+    """
+
+    def __init__(self, message, content, release_cb=None):
+        self.version = message.version
+        self.status = message.status
+        self.reason = message.reason
+        self.headers = message.headers
+        self.content = content  # Reader of the body.
+        self.content_decoded = message.content_decoded
+        self._keep_alive = message.keep_alive
+        self._release_cb = release_cb  # Called with keep_alive or not.
+        self._body = None
+
+    async def read(self):
+        # Read the whole body into memory.
+        if self._body is None:
+            self._body = await self._guard(self.content.read())
+        return self._body
+
+    async def iter_chunked(self, size=65536):
+        # Yield the body in chunks of at most size bytes.
+        while True:
+            chunk = await self._guard(self.content.read(size))
+            if not chunk:
+                break
+            yield chunk
+
+    async def save(self, path, chunk_size=2 ** 20, loop=None):
+        """Write the body to a file, return the number of bytes written.
+
+        Only one chunk is held in memory. The disk space is preallocated if
+        Content-Length is known, the writes run in the default executor,
+        while the next chunk is received.
+        """
+
+        loop = loop or asyncio.get_running_loop()
+        length = None
+        if not self.content_decoded:
+            length = self.headers.get('content-length')
+        written = 0
+
+        with open(path, 'wb') as f:
+            if length and hasattr(os, 'posix_fallocate'):
+                await loop.run_in_executor(
+                    None, os.posix_fallocate, f.fileno(), 0, int(length))
+
+            writing = None  # Future of the write in progress.
+            try:
+                async for chunk in self.iter_chunked(chunk_size):
+                    if writing is not None:
+                        await writing
+                    writing = loop.run_in_executor(None, f.write, chunk)
+                    written += len(chunk)
+                if writing is not None:
+                    await writing
+            except BaseException:
+                if writing is not None:
+                    # Don't close the file under the write.
+                    await asyncio.wait([writing])
+                raise
+
+        return written
+
+    def release(self):
+        # Give the connection back. It can be reused only if the body has
+        # been completely read.
+        if self._release_cb is not None:
+            release_cb = self._release_cb
+            self._release_cb = None
+            release_cb(self._keep_alive and self.content.at_eof())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    async def _guard(self, coro):
+        # Release the connection when the body ends or reading it fails.
+        try:
+            data = await coro
+        except BaseException:
+            self._keep_alive = False
+            self.release()
+            raise
+        if self.content.at_eof():
+            self.release()
+        return data
+
+
+class ClientSession:
+    """HTTP client session.
+
+    read_high_water, read_low_water: Water marks of the response body
+    buffer of each connection, see Reader.
+    write_high_water, write_low_water: Water marks of the write buffer of
+    each connection, Writer.drain() waits while it's above the high mark.
+    auto_decompress: Ask for gzip or deflate compressed responses and
+    decompress them. The body is decompressed up to max_decompressed_size
+    bytes, at most max_decompression_ratio times its compressed size.
+    """
+
+    def __init__(self, loop, connector=None, read_high_water=2 ** 18,
+                 read_low_water=None, write_high_water=2 ** 16,
+                 write_low_water=None, auto_decompress=True,
+                 max_decompressed_size=2 ** 30, max_decompression_ratio=1000):
+        self._loop = loop
+        self._connector = connector or Connector(loop)
+        self._read_high_water = read_high_water
+        self._read_low_water = read_low_water
+        self._write_high_water = write_high_water
+        self._write_low_water = write_low_water
+        self._decompress = None
+        if auto_decompress:
+            self._decompress = (max_decompressed_size,
+                                max_decompression_ratio)
+
+        self._pipelines = 0
+        self._pipelined_requests = 0
+        self._max_depth = 0
+        self._last_depth = 0
+        self._fallbacks = 0
+
+    @property
+    def connector(self):
+        return self._connector
+
+    async def request(self, method, url, host, port, headers=None,
+                      body=None):
+        # Return the response once the headers are received, the body is
+        # read from the response.
+        conn = await self._connector.acquire(host, port)
+
+        try:
+            headers = dict(headers or {})
+            if (self._decompress and not any(
+                    name.lower() == 'accept-encoding' for name in headers)):
+                headers['Accept-Encoding'] = 'gzip, deflate'
+
+            req = ClientRequest(method, url, host, headers, body)
+            waiter = conn.protocol.start_response(
+                req.method, self._read_high_water, self._read_low_water,
+                self._decompress)
+            conn.writer.set_write_buffer_limits(self._write_high_water,
+                                                self._write_low_water)
+            await req.send(conn.writer, self._loop)
+
+            message, content = await waiter
+        except BaseException:
+            self._connector.release(conn, False)
+            raise
+
+        # Put the connection back to the pool only if the response has been
+        # completely read.
+        resp = ClientResponse(message, content, functools.partial(
+            self._connector.release, conn))
+        if content.at_eof():
+            # No body.
+            resp.release()
+        return resp
+
+    async def get(self, url, host, port, headers=None):
+        return await self.request('GET', url, host, port, headers)
+
+    async def post(self, url, host, port, headers=None, body=None):
+        return await self.request('POST', url, host, port, headers, body)
+
+    async def put(self, url, host, port, headers=None, body=None):
+        return await self.request('PUT', url, host, port, headers, body)
+
+    async def fetch_many(self, requests, concurrency=100, limit_per_host=0,
+                         fail_fast=True):
+        """Run the requests concurrently, yield the results as they complete.
+
+        requests: An iterable of (method, url, host, port) tuples, optionally
+        followed by headers and body, the arguments of request(). It's
+        consumed lazily, so it could be a generator of any size.
+        concurrency: Max number of requests in flight.
+        limit_per_host: Max number of requests in flight per (host, port),
+        0 for no limit.
+        fail_fast: If true, the first error cancels the requests in flight
+        and is raised. Otherwise the errors are yielded with the requests.
+
+        Yield (request, response, error) tuples, in the order of completion.
+        Stop iterating early, or close the generator, to cancel the requests
+        in flight.
+
+            async for req, resp, error in session.fetch_many(reqs, 50):
+                ...
+        """
+
+        requests = iter(requests)
+        exhausted = False
+        running = {}  # Task -> request
+        in_flight = collections.Counter()  # (host, port) -> count
+        # Requests waiting for their host to be under limit_per_host. It
+        # holds at most `concurrency` requests so the iterable isn't read
+        # too far ahead.
+        backlog = collections.deque()
+
+        def can_start(req):
+            return (not limit_per_host or
+                    in_flight[req[2], req[3]] < limit_per_host)
+
+        def start(req):
+            in_flight[req[2], req[3]] += 1
+            task = self._loop.create_task(self._fetch(req))
+            running[task] = req
+
+        def fill():
+            for _ in range(len(backlog)):
+                if len(running) >= concurrency:
+                    return
+                req = backlog.popleft()
+                if can_start(req):
+                    start(req)
+                else:
+                    backlog.append(req)
+
+            nonlocal exhausted
+            while (len(running) < concurrency and not exhausted and
+                   len(backlog) < concurrency):
+                try:
+                    req = next(requests)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if can_start(req):
+                    start(req)
+                else:
+                    backlog.append(req)
+
+        try:
+            fill()
+            while running:
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED)
+
+                results = []
+                for task in done:
+                    req = running.pop(task)
+                    key = req[2], req[3]
+                    in_flight[key] -= 1
+                    if not in_flight[key]:
+                        del in_flight[key]
+
+                    error = task.exception()
+                    if error is not None and fail_fast:
+                        raise error
+                    results.append((req, None if error else task.result(),
+                                    error))
+
+                # Keep the pipe full before handing out the results.
+                fill()
+
+                for result in results:
+                    yield result
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(running)
+            # Retrieve the exceptions, e.g. of the tasks done at the same
+            # time as the one raised, to keep the loop from logging them.
+            for task in running:
+                if not task.cancelled():
+                    task.exception()
+
+    async def _fetch(self, req):
+        # Request and read the body.
+        resp = await self.request(*req)
+        await resp.read()
+        return resp
+
+    async def pipeline(self, requests, host, port):
+        """Send the requests back to back on one connection.
+
+        requests: ClientRequest objects to the same host.
+        Return the responses in the order of the requests, the bodies are
+        read. If the server closes the connection in the middle, the
+        requests not answered are sent again on another connection, this
+        requires them to be idempotent (RFC 7230 6.3.1) with a body None or
+        bytes. Otherwise PipelineError is raised, with the responses
+        received and the requests not answered.
+        """
+
+        self._pipelines += 1
+        self._pipelined_requests += len(requests)
+
+        responses = []
+        pending = list(requests)
+        window = len(pending)  # Max requests in flight on a connection.
+        failures = 0  # Attempts in a row without any response.
+        while pending:
+            batch = pending[:window]
+            try:
+                depth = await self._pipeline_once(batch, host, port,
+                                                  responses)
+                failures = 0
+            except (ConnectionError, HttpParserError,
+                    asyncio.IncompleteReadError):
+                # Not even one response. Try again, not pipelined, in case
+                # the server doesn't support it or a pooled connection was
+                # closed by the server just before it's reused.
+                failures += 1
+                if failures > 2:
+                    raise
+                depth = 0
+
+            self._last_depth = depth
+            self._max_depth = max(self._max_depth, depth)
+
+            pending = pending[depth:]
+            if depth < len(batch):
+                for req in pending:
+                    if not _is_replayable(req):
+                        raise PipelineError(
+                            'Connection closed in the middle of a pipeline, '
+                            '{} {} could not be sent again.'.format(
+                                req.method, req.url),
+                            responses, pending)
+                self._fallbacks += 1
+                # Don't pipeline deeper than the server has gone.
+                window = max(depth, 1)
+
+        return responses
+
+    async def _pipeline_once(self, requests, host, port, responses):
+        # Pipeline the requests on one connection, append the responses
+        # received and return the number of them, i.e., the depth reached.
+        conn = await self._connector.acquire(host, port)
+        conn.writer.set_write_buffer_limits(self._write_high_water,
+                                            self._write_low_water)
+
+        waiters = []
+        depth = 0
+        keep_alive = False
+        try:
+            try:
+                for req in requests:
+                    waiters.append(conn.protocol.start_response(
+                        req.method, self._read_high_water,
+                        self._read_low_water, self._decompress))
+                    await req.send(conn.writer, self._loop)
+            except ConnectionError:
+                # The server has closed the connection, read the responses
+                # it has sent anyway.
+                pass
+
+            try:
+                for waiter in waiters:
+                    message, content = await waiter
+                    resp = ClientResponse(message, content)
+                    await resp.read()
+                    responses.append(resp)
+                    depth += 1
+                    if not message.keep_alive:
+                        # The server closes the connection after this one.
+                        break
+            except (ConnectionError, HttpParserError,
+                    asyncio.IncompleteReadError):
+                # Fall back to another connection for the rest, unless no
+                # response is received at all.
+                if not depth:
+                    raise
+
+            keep_alive = depth == len(requests) and message.keep_alive
+        finally:
+            self._connector.release(conn, keep_alive)
+            # The responses not received fail with the connection, retrieve
+            # the exceptions to keep the loop from logging them.
+            for waiter in waiters[depth:]:
+                if waiter.done() and not waiter.cancelled():
+                    waiter.exception()
+                else:
+                    waiter.cancel()
+
+        return depth
+
+    def pipeline_stats(self):
+        return {
+            'pipelines': self._pipelines,
+            'requests': self._pipelined_requests,
+            'last_depth': self._last_depth,
+            'max_depth': self._max_depth,
+            'fallbacks': self._fallbacks,
+        }
+
+    def close(self):
+        self._connector.close()
+
+
+# Methods a client may retry automatically, RFC 7230 6.3.1.
+IDEMPOTENT_METHODS = frozenset(
+    ['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'])
+
+
+def _is_replayable(req):
+    return (req.method in IDEMPOTENT_METHODS and
+            (req.body is None or
+             isinstance(req.body, (bytes, bytearray, memoryview))))
+
+
+async def main(loop):
+    connector = Connector(loop, limit=10, limit_per_host=4)
+    session = ClientSession(loop, connector)
+
+    async def fetch():
+        resp = await session.get('/', 'localhost', 8000)
+        await resp.read()
+        return resp
+
+    # The first requests open connections, the rest reuse them.
+    for _ in range(3):
+        responses = await asyncio.gather(*[fetch() for _ in range(8)])
+
+    resp = responses[0]
+    print(resp.status, resp.reason)
+    # Pipeline requests on one connection.
+    requests = [ClientRequest('GET', '/', 'localhost') for _ in range(10)]
+    responses = await session.pipeline(requests, 'localhost', 8000)
+    print([resp.status for resp in responses])
+    print(session.pipeline_stats())
+
+    print(resp.headers)
+    print((await resp.read()).decode())
+    print(connector.stats())
+
+    # Stream the body in chunks.
+    resp = await session.get('/', 'localhost', 8000)
+    async for chunk in resp.iter_chunked(4):
+        print(chunk)
+
+    # Download to a file.
+    resp = await session.get('/', 'localhost', 8000)
+    size = await resp.save('index.html.download')
+    print('{} bytes saved'.format(size))
+    os.remove('index.html.download')
+
+    # Run many requests, at most 20 in flight, 8 per host.
+    requests = (('GET', '/?n={}'.format(i), 'localhost', 8000)
+                for i in range(1000))
+    statuses = collections.Counter()
+    async for req, resp, error in session.fetch_many(
+            requests, concurrency=20, limit_per_host=8, fail_fast=False):
+        statuses[resp.status if error is None else type(error).__name__] += 1
+    print(statuses)
+    print(connector.stats())
+    print(connector.resolver.stats())
+
+    session.close()
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(loop))
@@ -0,0 +1,463 @@
+import asyncio
+import collections
+
+# HTTP client sending GET requests over keep-alive connections.
+# Add class Connector to pool idle connections per (host, port).
+# Based on http_client_v5_writer.py and http_client_v7_request.py.
+
+
+class Writer:
+    def __init__(self, transport):
+        self._transport = transport
+
+    def write(self, data):
+        self._transport.write(data)
+
+    def close(self):
+        self._transport.close()
+
+    def is_closing(self):
+        return self._transport.is_closing()
+
+
+class Reader:
+    def __init__(self, loop):
+        self._loop = loop
+        self._buffer = bytearray()
+        self._eof = False  # EOF received or not.
+        self._waiter = None  # A future used to wait for data.
+
+    def feed(self, data):
+        self._buffer.extend(data)
+        self._wakeup_waiter()
+
+    def feed_eof(self):
+        self._eof = True
+        self._wakeup_waiter()
+
+    def at_eof(self):
+        return self._eof and not self._buffer
+
+    def pending(self):
+        return len(self._buffer)
+
+    async def read(self):
+        blocks = []
+        while True:
+            block = await self._read()
+            if not block:
+                break
+            blocks.append(block)
+        data = b''.join(blocks)
+        return data
+
+    async def readuntil(self, separator):
+        # Read until the separator is found, the separator is included.
+        start = 0
+        while True:
+            index = self._buffer.find(separator, start)
+            if index != -1:
+                end = index + len(separator)
+                data = bytes(self._buffer[:end])
+                del self._buffer[:end]
+                return data
+
+            if self._eof:
+                raise asyncio.IncompleteReadError(bytes(self._buffer), None)
+
+            # Don't search the bytes already checked again.
+            start = max(0, len(self._buffer) - len(separator) + 1)
+            await self._wait_for_data()
+
+    async def readexactly(self, n):
+        while len(self._buffer) < n:
+            if self._eof:
+                raise asyncio.IncompleteReadError(bytes(self._buffer), n)
+            await self._wait_for_data()
+
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    async def _read(self):
+        # Wait for more data if buffer is empty and EOF hasn't been received.
+        if not self._buffer and not self._eof:
+            await self._wait_for_data()
+
+        data = bytes(self._buffer)
+        del self._buffer[:]
+
+        return data
+
+    async def _wait_for_data(self):
+        assert not self._eof
+        assert not self._waiter
+
+        self._waiter = self._loop.create_future()
+        await self._waiter
+        self._waiter = None
+
+    def _wakeup_waiter(self):
+        waiter = self._waiter
+        if waiter:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class ClientProtocol(asyncio.Protocol):
+    def __init__(self, loop, reader):
+        self.loop = loop
+        self.transport = None
+        self.closed = False
+        self._reader = reader
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self._reader.feed(data)
+
+    def eof_received(self):
+        self._reader.feed_eof()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        # Wake up the reader in case the connection is lost without EOF.
+        self._reader.feed_eof()
+
+
+class Connection:
+    def __init__(self, key, reader, writer, protocol):
+        self.key = key  # (host, port)
+        self.reader = reader
+        self.writer = writer
+        self.protocol = protocol
+        self.last_used = None  # Loop time when released to the pool.
+
+    def is_stale(self):
+        # The server may close an idle connection at any time. A closed
+        # transport, an EOF or any unexpected data received while idle
+        # means the connection can't be used for another request.
+        return (self.protocol.closed or
+                self.writer.is_closing() or
+                self.reader.at_eof() or
+                self.reader.pending() > 0)
+
+    def close(self):
+        self.writer.close()
+
+
+class Connector:
+    """Pool of idle HTTP/1.1 keep-alive connections per (host, port).
+
+    limit: Max number of open connections, in use and idle. 0 for no limit.
+    limit_per_host: Max number of open connections per (host, port).
+    keepalive_timeout: Seconds an idle connection is kept in the pool.
+    """
+
+    def __init__(self, loop, limit=100, limit_per_host=0,
+                 keepalive_timeout=15.0):
+        self._loop = loop
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+
+        # Idle connections per key, the most recently used one at the right.
+        self._idle = collections.defaultdict(collections.deque)
+        self._idle_count = 0
+        # Open connections (in use or idle, or being connected) per key.
+        self._opened = collections.Counter()
+        self._opened_count = 0
+        self._in_use = 0
+
+        # Futures of the coroutines waiting for a free slot.
+        self._waiters = collections.deque()
+        self._cleanup_handle = None
+        self._closed = False
+
+        self._hits = 0
+        self._misses = 0
+
+    async def acquire(self, host, port):
+        if self._closed:
+            raise RuntimeError('Connector is closed.')
+
+        key = (host, port)
+
+        while True:
+            conn = self._get_idle(key)
+            if conn is not None:
+                self._hits += 1
+                self._in_use += 1
+                return conn
+
+            if self._has_capacity(key):
+                break
+
+            # Make room by closing an idle connection of another host.
+            if self._has_host_capacity(key) and self._close_oldest_idle():
+                break
+
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # Woken but cancelled, pass the wakeup on.
+                    self._wakeup_waiter()
+                raise
+
+        self._misses += 1
+
+        # Reserve the slot before connecting so that concurrent acquires
+        # don't exceed the limits.
+        self._opened[key] += 1
+        self._opened_count += 1
+        try:
+            conn = await self._create_connection(key)
+        except BaseException:
+            self._forget(key)
+            raise
+
+        self._in_use += 1
+        return conn
+
+    def release(self, conn, keep_alive=True):
+        self._in_use -= 1
+
+        if keep_alive and not self._closed and not conn.is_stale():
+            conn.last_used = self._loop.time()
+            self._idle[conn.key].append(conn)
+            self._idle_count += 1
+            self._schedule_cleanup()
+            self._wakeup_waiter()
+        else:
+            conn.close()
+            self._forget(conn.key)
+
+    def stats(self):
+        total = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'in_use': self._in_use,
+            'idle': self._idle_count,
+            'reuse_rate': self._hits / total if total else 0.0,
+        }
+
+    def close(self):
+        self._closed = True
+
+        if self._cleanup_handle:
+            self._cleanup_handle.cancel()
+            self._cleanup_handle = None
+
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.close()
+        self._idle.clear()
+        self._idle_count = 0
+
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_exception(RuntimeError('Connector is closed.'))
+        self._waiters.clear()
+
+    async def _create_connection(self, key):
+        host, port = key
+        reader = Reader(self._loop)
+        protocol = ClientProtocol(self._loop, reader)
+        transport, _ = await self._loop.create_connection(
+            lambda: protocol, host, port)
+        writer = Writer(transport)
+        return Connection(key, reader, writer, protocol)
+
+    def _get_idle(self, key):
+        conns = self._idle.get(key)
+        if not conns:
+            return None
+
+        now = self._loop.time()
+        while conns:
+            conn = conns.pop()
+            self._idle_count -= 1
+            if (now - conn.last_used < self._keepalive_timeout and
+                    not conn.is_stale()):
+                return conn
+            conn.close()
+            self._forget(key)
+
+        return None
+
+    def _has_host_capacity(self, key):
+        return (not self._limit_per_host or
+                self._opened[key] < self._limit_per_host)
+
+    def _has_capacity(self, key):
+        if self._limit and self._opened_count >= self._limit:
+            return False
+        return self._has_host_capacity(key)
+
+    def _close_oldest_idle(self):
+        oldest = None
+        for conns in self._idle.values():
+            if conns and (oldest is None or
+                          conns[0].last_used < oldest.last_used):
+                oldest = conns[0]
+
+        if oldest is None:
+            return False
+
+        self._idle[oldest.key].popleft()
+        self._idle_count -= 1
+        oldest.close()
+        self._forget(oldest.key)
+        return True
+
+    def _forget(self, key):
+        self._opened[key] -= 1
+        if not self._opened[key]:
+            del self._opened[key]
+        self._opened_count -= 1
+        self._wakeup_waiter()
+
+    def _wakeup_waiter(self):
+        # The woken coroutine checks the limits again by itself.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def _schedule_cleanup(self):
+        if self._cleanup_handle is None and self._keepalive_timeout:
+            self._cleanup_handle = self._loop.call_later(
+                self._keepalive_timeout, self._cleanup)
+
+    def _cleanup(self):
+        # Close the connections which have been idle for too long.
+        self._cleanup_handle = None
+
+        deadline = self._loop.time() - self._keepalive_timeout
+        for key, conns in list(self._idle.items()):
+            while conns and (conns[0].last_used <= deadline or
+                             conns[0].is_stale()):
+                conn = conns.popleft()
+                self._idle_count -= 1
+                conn.close()
+                self._forget(key)
+            if not conns:
+                del self._idle[key]
+
+        if self._idle_count:
+            self._schedule_cleanup()
+
+
+class ClientRequest:
+    def __init__(self, method, url, host):
+        self.method = method.upper()
+        self.url = url
+        self.host = host
+
+    def send(self, writer):
+        crlf = '\r\n'
+
+        # Start line
+        request = '{} {} HTTP/1.1'.format(self.method, self.url)
+        request += crlf
+
+        # Header fields
+        request += 'Host: {}'.format(self.host)
+        request += crlf
+        request += 'Connection: keep-alive'
+        request += crlf
+
+        request += crlf  # End of Headers
+
+        writer.write(request.encode())
+
+
+async def read_response(reader):
+    """Read a response, return (status, headers, body, keep_alive)."""
+
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+
+    version, status, _ = (lines[0].split(' ', 2) + [''])[:3]
+    status = int(status)
+
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        keep_alive = connection == 'keep-alive'
+    else:
+        keep_alive = connection != 'close'
+
+    if 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    elif status in (204, 304) or 100 <= status < 200:
+        body = b''
+    else:
+        # No framing (or chunked, not supported yet), read until EOF.
+        body = await reader.read()
+        keep_alive = False
+
+    return status, headers, body, keep_alive
+
+
+class ClientSession:
+    def __init__(self, loop, connector=None):
+        self._loop = loop
+        self._connector = connector or Connector(loop)
+
+    @property
+    def connector(self):
+        return self._connector
+
+    async def get(self, url, host, port):
+        conn = await self._connector.acquire(host, port)
+
+        keep_alive = False
+        try:
+            req = ClientRequest('GET', url, host)
+            req.send(conn.writer)
+
+            status, headers, body, keep_alive = await read_response(
+                conn.reader)
+        finally:
+            # Put the connection back to the pool only if the response has
+            # been completely read.
+            self._connector.release(conn, keep_alive)
+
+        return body
+
+    def close(self):
+        self._connector.close()
+
+
+async def main(loop):
+    connector = Connector(loop, limit=10, limit_per_host=4)
+    session = ClientSession(loop, connector)
+
+    # The first requests open connections, the rest reuse them.
+    for _ in range(3):
+        bodies = await asyncio.gather(
+            *[session.get('/', 'localhost', 8000) for _ in range(8)])
+    print(bodies[0].decode())
+    print(connector.stats())
+
+    session.close()
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(loop))
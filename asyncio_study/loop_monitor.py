@@ -0,0 +1,267 @@
+import asyncio
+import bisect
+import logging
+import sys
+import threading
+import time
+import traceback
+
+# Detect the event loop being blocked, e.g. by time.sleep() in more_work()
+# of async3.py and async4.py.
+# A heartbeat callback on the loop measures how late it runs (the loop lag),
+# a watchdog thread samples the stack of the loop thread when the heartbeat
+# is later than a threshold, which is the stack of the blocking callback or
+# task step. The lag and the stall durations are kept in histograms.
+#
+#   monitor = loop_monitor.attach(loop, threshold=0.1)
+#   ...
+#   print(monitor.stats())
+
+logger = logging.getLogger(__name__)
+
+_HANDLE_RUN_CODE = asyncio.Handle._run.__code__
+
+
+class LatencyHistogram:
+    """Histogram of durations in fixed buckets, in seconds.
+
+    Exported as cumulative counts per upper bound, like a Prometheus
+    histogram.
+    """
+
+    BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0,
+              2.0, 5.0, 10.0)
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BOUNDS) + 1)  # The last one is +Inf.
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self._counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def export(self):
+        buckets = {}
+        total = 0
+        for bound, count in zip(self.BOUNDS + ('+Inf',), self._counts):
+            total += count
+            buckets[str(bound)] = total
+        return {
+            'buckets': buckets,
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+        }
+
+
+class StallReport:
+    def __init__(self, start, stack, origin):
+        self.start = start  # time.monotonic() when the loop stopped running.
+        self.duration = None  # Set once the loop runs again.
+        self.stack = stack  # Formatted stack of the loop thread.
+        self.origin = origin  # The callback or task running, if found.
+
+    def to_dict(self):
+        return {
+            'duration': self.duration,
+            'origin': self.origin,
+            'stack': self.stack,
+        }
+
+    def format(self):
+        lines = ['Event loop blocked for {:.3f} s'.format(self.duration)]
+        if self.origin:
+            lines.append('Running: {}'.format(self.origin))
+        if self.stack:
+            lines.append('Stack (most recent call last):')
+            lines.append(self.stack.rstrip())
+        return '\n'.join(lines)
+
+
+class LoopMonitor:
+    """Monitor of the lag of an event loop.
+
+    interval: Seconds between two heartbeats, the lag is sampled each time.
+    threshold: A heartbeat later than this is a stall. The stack of the loop
+    thread is captured while it's stalled.
+    on_stall: Called with a StallReport on the loop thread once the stall is
+    over. The report is logged as a warning by default.
+    max_reports: Number of the most recent reports kept.
+
+    Call start() and stop(), from any thread. The origin of a stall
+    includes where the callback or task was created if the loop is in debug
+    mode.
+    """
+
+    def __init__(self, loop, interval=0.05, threshold=0.1, on_stall=None,
+                 max_reports=100):
+        self._loop = loop
+        self._interval = interval
+        self._threshold = threshold
+        self._on_stall = on_stall or _log_stall
+        self._max_reports = max_reports
+
+        self._lag = LatencyHistogram()
+        self._stalls = LatencyHistogram()
+        self._reports = []
+
+        self._thread_id = None  # Of the loop thread.
+        self._expected = None  # time.monotonic() of the next heartbeat.
+        self._beats = 0
+        # (beat number, StallReport) captured by the watchdog.
+        self._pending = None
+        self._handle = None
+        self._watchdog = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._stopping.clear()
+        self._loop.call_soon_threadsafe(self._start)
+
+    def stop(self):
+        self._stopping.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+        self._loop.call_soon_threadsafe(self._stop)
+
+    def stats(self):
+        return {
+            'lag': self._lag.export(),
+            'stalls': self._stalls.export(),
+            'reports': [report.to_dict() for report in self._reports],
+        }
+
+    def _start(self):
+        self._thread_id = threading.get_ident()
+        self._expected = time.monotonic()
+        self._beat()
+        self._watchdog = threading.Thread(
+            target=self._watch, name='loop-monitor', daemon=True)
+        self._watchdog.start()
+
+    def _stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _beat(self):
+        # On the loop thread.
+        now = time.monotonic()
+        lag = max(0.0, now - self._expected)
+        self._lag.record(lag)
+
+        pending = self._pending
+        self._pending = None
+        if lag >= self._threshold:
+            self._stalls.record(lag)
+            if pending is not None and pending[0] == self._beats:
+                report = pending[1]
+            else:
+                # Too short for the watchdog to see it.
+                report = StallReport(self._expected, None, None)
+            report.duration = lag
+            self._reports.append(report)
+            del self._reports[:-self._max_reports]
+            try:
+                self._on_stall(report)
+            except Exception:
+                logger.exception('Error in the stall callback.')
+
+        self._beats += 1
+        self._expected = now + self._interval
+        if not self._stopping.is_set():
+            self._handle = self._loop.call_later(self._interval, self._beat)
+
+    def _watch(self):
+        # On the watchdog thread.
+        period = min(self._interval, self._threshold) / 2
+        while not self._stopping.wait(period):
+            beat = self._beats
+            late = time.monotonic() - self._expected
+            if late < self._threshold:
+                continue
+            pending = self._pending
+            if pending is not None and pending[0] == beat:
+                # Already captured.
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self._pending = (beat, StallReport(
+                self._expected, ''.join(traceback.format_stack(frame)),
+                _find_origin(frame)))
+
+
+def _find_origin(frame):
+    # Describe the handle run by the loop in the stack, if any.
+    while frame is not None:
+        if frame.f_code is _HANDLE_RUN_CODE:
+            handle = frame.f_locals.get('self')
+            if handle is None:
+                return None
+            callback = handle._callback
+            task = getattr(callback, '__self__', None)
+            if isinstance(task, asyncio.Task):
+                return 'step of {!r}'.format(task)
+            return repr(handle)
+        frame = frame.f_back
+    return None
+
+
+def _log_stall(report):
+    logger.warning('%s', report.format())
+
+
+def attach(loop=None, **kwargs):
+    """Start monitoring loop, the current event loop by default."""
+
+    monitor = LoopMonitor(loop or asyncio.get_event_loop(), **kwargs)
+    monitor.start()
+    return monitor
+
+
+def main():
+    # Block the loop the way async4.py does, and see the report.
+    logging.basicConfig(format='%(message)s')
+
+    def more_work(x):
+        print("More work %s" % x)
+        time.sleep(x)
+        print("Finished more work %s" % x)
+
+    async def do_some_work(x):
+        print("Waiting %s" % x)
+        await asyncio.sleep(x)
+        print("Finished work %s" % x)
+
+    async def blocking_task(x):
+        await asyncio.sleep(0.1)
+        time.sleep(x)
+
+    async def work():
+        await asyncio.gather(do_some_work(1), blocking_task(0.3))
+
+    loop = asyncio.new_event_loop()
+    loop.set_debug(True)
+    monitor = attach(loop, threshold=0.1)
+
+    loop.call_soon(more_work, 0.5)
+    loop.run_until_complete(work())
+
+    monitor.stop()
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+
+    stats = monitor.stats()
+    print('lag:', stats['lag'])
+    print('stalls:', stats['stalls'])
+
+
+if __name__ == '__main__':
+    main()
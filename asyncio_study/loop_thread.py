@@ -0,0 +1,251 @@
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+import os
+import threading
+import time
+
+# Run an event loop in a background thread, the start_loop() and Thread of
+# async3.py and async4.py, with a clean start and stop. Blocking functions
+# run in a thread pool instead of blocking the loop. ShardedLoopThread runs
+# one loop per core and spreads the coroutines over them.
+#
+#   with LoopThread() as runner:
+#       future = runner.submit(do_some_work(3))
+#       runner.run_blocking(more_work, 3)
+#       future.result()
+
+
+class LoopThread:
+    """Event loop running in a background thread.
+
+    name: Name of the thread, the threads of the pool are named after it.
+    max_workers: Size of the thread pool of run_blocking(), the default of
+    ThreadPoolExecutor if None.
+    executor: Executor to use instead of a new thread pool, it's not shut
+    down by stop().
+    """
+
+    def __init__(self, name='loop', max_workers=None, executor=None):
+        self._name = name
+        self._max_workers = max_workers
+        self._executor = executor
+        self._own_executor = executor is None
+        self._loop = None
+        self._thread = None
+        self._stopping = None  # Future of _cancel_tasks() once stopping.
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError('The loop thread is already started.')
+
+        if self._own_executor:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                self._max_workers, thread_name_prefix=self._name + '-blocking')
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,),
+                                        name=self._name, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self, timeout=None):
+        # Cancel the tasks left, stop the loop and wait for the thread. The
+        # blocking functions running are waited for too. Raise TimeoutError
+        # if the thread doesn't exit within timeout, the loop is left
+        # running then and stop() can be called again.
+        if self._thread is None:
+            return
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('Cannot stop the loop from its own thread.')
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self._loop.is_running():
+            # Cancel the tasks once, a second stop() waits for the same.
+            if self._stopping is None:
+                self._stopping = asyncio.run_coroutine_threadsafe(
+                    self._cancel_tasks(), self._loop)
+            try:
+                self._stopping.result(timeout)
+            except concurrent.futures.TimeoutError:
+                raise TimeoutError('The tasks did not stop in {} '
+                                   'seconds.'.format(timeout)) from None
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(None if deadline is None else
+                          max(0.0, deadline - time.monotonic()))
+        if self._thread.is_alive():
+            # A callback blocks the loop, it can't be closed while running.
+            raise TimeoutError(
+                'The loop thread did not stop in {} seconds.'.format(timeout))
+        self._loop.close()
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._thread = None
+        self._stopping = None
+
+    def submit(self, coro):
+        """Run the coroutine on the loop, return a concurrent.futures.Future.
+
+        Can be called from any thread but the loop thread.
+        """
+
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def call_soon(self, callback, *args):
+        # Thread-safe, the callback must not block.
+        return self._loop.call_soon_threadsafe(callback, *args)
+
+    def run_blocking(self, func, *args, **kwargs):
+        """Run a blocking function in the thread pool.
+
+        Return an asyncio future to await when called on the loop thread, a
+        concurrent.futures.Future otherwise.
+        """
+
+        if kwargs:
+            # run_in_executor() doesn't pass keyword arguments.
+            func = functools.partial(func, *args, **kwargs)
+            args = ()
+        if threading.current_thread() is self._thread:
+            return self._loop.run_in_executor(self._executor, func, *args)
+        return self._executor.submit(func, *args)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            asyncio.set_event_loop(None)
+
+    async def _cancel_tasks(self):
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class ShardedLoopThread:
+    """Loop threads, one per core by default, sharing a thread pool.
+
+    Coroutines are spread over the loops in turn, or by key to run the ones
+    with the same key on the same loop, e.g. the requests of a connection.
+    Objects bound to a loop, like a connection or a lock, must be used only
+    by coroutines of that loop.
+    """
+
+    def __init__(self, shards=None, name='loop', max_workers=None):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix=name + '-blocking')
+        self._shards = [
+            LoopThread('{}-{}'.format(name, i), executor=self._executor)
+            for i in range(shards or os.cpu_count() or 1)]
+        self._next = itertools.cycle(self._shards)
+
+    @property
+    def shards(self):
+        return list(self._shards)
+
+    def start(self):
+        for shard in self._shards:
+            shard.start()
+        return self
+
+    def stop(self, timeout=None):
+        # Stop all the shards even if one times out, the thread pool is shut
+        # down only once they are all stopped.
+        errors = []
+        for shard in self._shards:
+            try:
+                shard.stop(timeout)
+            except TimeoutError as exc:
+                errors.append(exc)
+        if errors:
+            raise errors[0]
+        self._executor.shutdown(wait=True)
+
+    def shard(self, key=None):
+        # The LoopThread for key, the next one in turn if None.
+        if key is None:
+            return next(self._next)
+        return self._shards[hash(key) % len(self._shards)]
+
+    def submit(self, coro, key=None):
+        return self.shard(key).submit(coro)
+
+    def run_blocking(self, func, *args, **kwargs):
+        if kwargs:
+            func = functools.partial(func, *args, **kwargs)
+            args = ()
+        for shard in self._shards:
+            if threading.current_thread() is shard._thread:
+                return shard.run_blocking(func, *args)
+        return self._executor.submit(func, *args)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+async def do_some_work(x):
+    print("Waiting %s" % x)
+    await asyncio.sleep(x)
+    print("Finished work %s" % x)
+
+
+def more_work(x):
+    print("More work %s" % x)
+    time.sleep(x)
+    print("Finished more work %s" % x)
+
+
+async def mixed_work(runner, x):
+    # Blocking work awaited from a coroutine, the loop keeps running.
+    await runner.run_blocking(more_work, x)
+    await do_some_work(x)
+
+
+def main():
+    # The scenario of async4.py: more_work() doesn't hold the coroutines
+    # back any more, everything finishes in about 3 seconds.
+    start = time.monotonic()
+    with LoopThread(max_workers=4) as runner:
+        blocking = runner.run_blocking(more_work, 3)
+        futures = [runner.submit(do_some_work(3)),
+                   runner.submit(do_some_work(2)),
+                   runner.submit(mixed_work(runner, 1))]
+        for future in futures:
+            future.result()
+        blocking.result()
+    print('Done in {:.1f} s'.format(time.monotonic() - start))
+
+    with ShardedLoopThread(shards=2) as runner:
+        futures = [runner.submit(do_some_work(1), key=i) for i in range(4)]
+        for future in futures:
+            future.result()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1624 @@
+import argparse
+import asyncio
+import collections
+import collections.abc
+import contextlib
+import datetime
+import decimal
+import hashlib
+import re
+import struct
+
+# MySQL client for coroutines, speaking the client/server protocol over the
+# Writer and Reader of the HTTP client. Unlike a MySQLdb call, a query
+# doesn't block the loop while waiting for the server.
+# Based on the Writer and Reader of http_client_v20_trace.py.
+#
+#   conn = await connect(loop, 'localhost', user='root', password='chopin',
+#                        db='test')
+#   await conn.execute('insert into writers(name) values(%s)',
+#                      ('Jack London',))
+#   rows = await conn.fetch('select * from writers')
+#   async with conn.stream('select * from writers') as rows:
+#       async for row in rows:
+#           print(row)
+#   conn.close()
+#
+#   statement = await conn.prepare('select name from writers where id = %s')
+#   row = await statement.fetchone((4,))
+#
+#   pool = Pool(loop, functools.partial(connect, loop, 'localhost', ...))
+#   async with pool.connection() as conn:
+#       async with conn.transaction():
+#           await conn.execute(...)
+#
+# execute() escapes the args into the query on the client, like
+# cur.execute() of MySQLdb, and the values of the rows are converted from
+# text. prepare() prepares a query on the server once per connection
+# (COM_STMT_PREPARE), its args and rows are then sent in the binary protocol,
+# one COM_STMT_EXECUTE round trip per execution, without parsing the query
+# again.
+# Authentication with mysql_native_password, or caching_sha2_password once
+# the server has cached the password (full authentication without TLS only
+# over a unix socket).
+
+# Capability flags.
+CLIENT_LONG_PASSWORD = 0x1
+CLIENT_LONG_FLAG = 0x4
+CLIENT_CONNECT_WITH_DB = 0x8
+CLIENT_PROTOCOL_41 = 0x200
+CLIENT_TRANSACTIONS = 0x2000
+CLIENT_SECURE_CONNECTION = 0x8000
+CLIENT_MULTI_RESULTS = 0x20000
+CLIENT_PLUGIN_AUTH = 0x80000
+CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA = 0x200000
+
+CLIENT_FLAGS = (CLIENT_LONG_PASSWORD | CLIENT_LONG_FLAG | CLIENT_PROTOCOL_41 |
+                CLIENT_TRANSACTIONS | CLIENT_SECURE_CONNECTION |
+                CLIENT_MULTI_RESULTS | CLIENT_PLUGIN_AUTH |
+                CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA)
+
+# Server status flags.
+SERVER_STATUS_IN_TRANS = 0x1
+SERVER_MORE_RESULTS_EXISTS = 0x8
+
+# Commands.
+COM_QUIT = 0x01
+COM_QUERY = 0x03
+COM_PING = 0x0e
+COM_STMT_PREPARE = 0x16
+COM_STMT_EXECUTE = 0x17
+COM_STMT_CLOSE = 0x19
+
+# Column types.
+TYPE_DECIMAL = 0
+TYPE_TINY = 1
+TYPE_SHORT = 2
+TYPE_LONG = 3
+TYPE_FLOAT = 4
+TYPE_DOUBLE = 5
+TYPE_NULL = 6
+TYPE_TIMESTAMP = 7
+TYPE_LONGLONG = 8
+TYPE_INT24 = 9
+TYPE_DATE = 10
+TYPE_TIME = 11
+TYPE_DATETIME = 12
+TYPE_YEAR = 13
+TYPE_VARCHAR = 15
+TYPE_BIT = 16
+TYPE_NEWDECIMAL = 246
+TYPE_BLOB = 252
+TYPE_VAR_STRING = 253
+TYPE_STRING = 254
+
+UNSIGNED_FLAG = 0x20  # Flag of a column.
+PARAM_UNSIGNED = 0x80  # Flag of the type of an arg of a statement.
+
+CHARSET_UTF8MB4 = 45  # utf8mb4_general_ci
+CHARSET_BINARY = 63
+
+MAX_PACKET_SIZE = 2 ** 24 - 1  # Larger payloads are split.
+
+
+class Writer:
+    def __init__(self, transport, protocol):
+        self._transport = transport
+        self._protocol = protocol
+
+    @property
+    def transport(self):
+        return self._transport
+
+    def write(self, data):
+        self._transport.write(data)
+
+    def writelines(self, data):
+        self._transport.writelines(data)
+
+    async def drain(self):
+        # Wait until the write buffer of the transport is drained to the low
+        # water mark. Call it after each big write.
+        await self._protocol.drain()
+
+    def close(self):
+        self._transport.close()
+
+    def is_closing(self):
+        return self._transport.is_closing()
+
+
+class Reader:
+    """Buffer of the received data.
+
+    The data is kept as a deque of chunks, as it's fed, and handed out with
+    memoryview slicing, so each byte is copied at most once.
+
+    If a protocol is given, reading is paused once more than high_water
+    bytes are buffered, and resumed once they are drained to low_water.
+    """
+
+    def __init__(self, loop, protocol=None, high_water=2 ** 18,
+                 low_water=None):
+        if low_water is None:
+            low_water = high_water // 4
+        if not 0 <= low_water <= high_water:
+            raise ValueError('high_water ({}) must be >= low_water ({}) '
+                             '>= 0'.format(high_water, low_water))
+
+        self._loop = loop
+        self._protocol = protocol
+        self._high_water = high_water
+        self._low_water = low_water
+        self._paused = False
+        self._chunks = collections.deque()  # bytes or memoryview
+        self._size = 0  # Total bytes in the chunks.
+        self._need = 0  # Bytes readexactly() is waiting for.
+        self._eof = False  # EOF received or not.
+        self._exception = None
+        self._waiter = None  # A future used to wait for data.
+
+    def set_exception(self, exc):
+        self._exception = exc
+        waiter = self._waiter
+        if waiter:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_exception(exc)
+
+    def feed(self, data):
+        if not data:
+            return
+        self._chunks.append(data)
+        self._size += len(data)
+        self._wakeup_waiter()
+
+        if (self._protocol is not None and not self._paused and
+                self._size > max(self._high_water, self._need)):
+            self._paused = True
+            self._protocol.pause_reading()
+
+    def feed_eof(self):
+        self._eof = True
+        self._wakeup_waiter()
+
+    def at_eof(self):
+        return self._eof and not self._size
+
+    async def readexactly(self, n):
+        if self._size < n:
+            # n may be above high_water, e.g. a packet of a large row. Keep
+            # reading until the n bytes are buffered, or it would stay
+            # paused forever.
+            self._need = n
+            if self._paused:
+                self._paused = False
+                self._protocol.resume_reading()
+            try:
+                while self._size < n:
+                    if self._eof:
+                        raise asyncio.IncompleteReadError(
+                            self._take(self._size), n)
+                    await self._wait_for_data()
+            finally:
+                self._need = 0
+
+        return self._take(n)
+
+    def _take(self, n):
+        # Remove n bytes from the chunks and return them as bytes.
+        chunks = self._chunks
+        if not n:
+            return b''
+
+        first = chunks[0]
+        if len(first) == n and isinstance(first, bytes):
+            # No copy at all.
+            self._consume(n)
+            return first
+        if len(first) >= n:
+            data = bytes(memoryview(first)[:n])
+            self._consume(n)
+            return data
+
+        parts = []
+        left = n
+        while left:
+            chunk = chunks[0]
+            size = min(len(chunk), left)
+            parts.append(memoryview(chunk)[:size])
+            self._consume(size)
+            left -= size
+        return b''.join(parts)
+
+    def _consume(self, n):
+        # Remove n bytes from the first chunk, n <= length of the chunk.
+        chunk = self._chunks[0]
+        if n == len(chunk):
+            self._chunks.popleft()
+        else:
+            self._chunks[0] = memoryview(chunk)[n:]
+        self._size -= n
+        self._maybe_resume()
+
+    def _maybe_resume(self):
+        if self._paused and self._size <= self._low_water:
+            self._paused = False
+            self._protocol.resume_reading()
+
+    async def _wait_for_data(self):
+        if self._exception is not None:
+            raise self._exception
+
+        assert not self._eof
+        assert not self._waiter
+
+        self._waiter = self._loop.create_future()
+        await self._waiter
+        self._waiter = None
+
+    def _wakeup_waiter(self):
+        waiter = self._waiter
+        if waiter:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class Error(Exception):
+    pass
+
+
+class MySQLError(Error):
+    """Error returned by the server, the connection can still be used."""
+
+    def __init__(self, errno, sqlstate, message):
+        super().__init__(errno, message)
+        self.errno = errno
+        self.sqlstate = sqlstate
+        self.message = message
+
+    def __str__(self):
+        return '({}) {}'.format(self.errno, self.message)
+
+
+class ProtocolError(Error):
+    pass
+
+
+class ClientProtocol(asyncio.Protocol):
+    def __init__(self, loop, high_water=2 ** 18):
+        self.loop = loop
+        self.transport = None
+        self.closed = False
+        self.reader = Reader(loop, self, high_water)
+        self._reading_paused = False
+        self._writing_paused = False
+        self._drain_waiters = collections.deque()
+
+    def pause_reading(self):
+        if not self._reading_paused and not self.closed:
+            self._reading_paused = True
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        if self._reading_paused and not self.closed:
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.reader.feed(data)
+
+    def eof_received(self):
+        self.reader.feed_eof()
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        self._wakeup_drain_waiters(None)
+
+    async def drain(self):
+        if self.closed:
+            raise ConnectionResetError('Connection lost.')
+        if not self._writing_paused:
+            return
+
+        waiter = self.loop.create_future()
+        self._drain_waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            if waiter in self._drain_waiters:
+                self._drain_waiters.remove(waiter)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        exc = exc or ConnectionResetError('Connection lost.')
+        self._wakeup_drain_waiters(exc)
+        self.reader.set_exception(exc)
+        self.reader.feed_eof()
+
+    def _wakeup_drain_waiters(self, exc):
+        while self._drain_waiters:
+            waiter = self._drain_waiters.popleft()
+            if waiter.done():
+                continue
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+
+Column = collections.namedtuple(
+    'Column', 'name table type_code charset length flags decimals')
+
+
+class Result:
+    """Result of a query.
+
+    columns and rows are None if the query returns no result set, e.g. an
+    insert.
+    """
+
+    def __init__(self, columns=None, rows=None, affected_rows=0,
+                 insert_id=0, warnings=0, info=''):
+        self.columns = columns
+        self.rows = rows
+        self.affected_rows = affected_rows
+        self.insert_id = insert_id
+        self.warnings = warnings
+        self.info = info
+
+    def __repr__(self):
+        if self.rows is not None:
+            return '<Result rows={}>'.format(len(self.rows))
+        return '<Result affected_rows={} insert_id={}>'.format(
+            self.affected_rows, self.insert_id)
+
+
+class ResultStream:
+    """Rows of a query read as they come.
+
+    The connection is held until all the rows are read or the stream is
+    closed, the rows left are read and dropped then. At most high_water
+    bytes of the result are buffered, the server waits meanwhile (up to its
+    net_write_timeout).
+    """
+
+    def __init__(self, conn, query):
+        self._conn = conn
+        self._query = query
+        self._started = False
+        self._done = False
+        self._converters = None
+        self.columns = None
+
+    async def start(self):
+        if self._started:
+            return
+        self._started = True
+        await self._conn._lock.acquire()
+        try:
+            self._conn._send_command(COM_QUERY, self._query)
+            await self._conn._writer.drain()
+            result = await self._conn._read_result_head()
+        except BaseException as exc:
+            self._done = True
+            self._conn._fail(exc)
+            self._conn._lock.release()
+            raise
+
+        if isinstance(result, Result):
+            # No result set.
+            self._done = True
+            self._conn._lock.release()
+        else:
+            self.columns = result
+            self._converters = [_converter(column) for column in result]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._started:
+            await self.start()
+        if self._done:
+            raise StopAsyncIteration
+
+        try:
+            row = await self._conn._read_row(self._converters)
+            if row is None:
+                await self._conn._read_more_results()
+        except BaseException as exc:
+            self._finish(exc)
+            raise
+        if row is None:
+            self._finish()
+            raise StopAsyncIteration
+        return row
+
+    async def close(self):
+        if not self._started or self._done:
+            self._done = True
+            return
+        try:
+            while await self._conn._read_row(self._converters) is not None:
+                pass
+            await self._conn._read_more_results()
+        except BaseException as exc:
+            self._finish(exc)
+            raise
+        self._finish()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _finish(self, exc=None):
+        self._done = True
+        if exc is not None:
+            self._conn._fail(exc)
+        self._conn._lock.release()
+
+
+class PreparedStatement:
+    """Statement prepared on the server, see Connection.prepare().
+
+    The args are sent in the binary protocol instead of being escaped into
+    the query, and so are the values of the rows.
+    """
+
+    def __init__(self, conn, query):
+        self._conn = conn
+        self.query = query
+        self.statement_id = None  # None until prepared, or once closed.
+        self.param_count = 0
+        self.columns = None  # Columns of the result, None if none.
+
+    async def execute(self, args=()):
+        # Return a Result, like Connection.execute().
+        return await self._conn._execute_statement(self, args)
+
+    async def executemany(self, seq_args):
+        # Execute once per args, return the number of rows affected.
+        affected_rows = 0
+        for args in seq_args:
+            affected_rows += (await self.execute(args)).affected_rows
+        return affected_rows
+
+    async def fetch(self, args=()):
+        return (await self.execute(args)).rows
+
+    async def fetchone(self, args=()):
+        rows = await self.fetch(args)
+        return rows[0] if rows else None
+
+    def close(self):
+        # Deallocate it on the server, it's prepared again if executed after.
+        self._conn._close_statement(self)
+
+
+class Connection:
+    def __init__(self, loop, protocol, writer, unix_socket=False):
+        self._loop = loop
+        self._protocol = protocol
+        self._reader = protocol.reader
+        self._writer = writer
+        self._unix_socket = unix_socket
+        self._lock = asyncio.Lock()  # Held during a command.
+        self._seq = 0  # Sequence id of the next packet.
+        self._status = 0  # Server status flags.
+        # Query -> PreparedStatement, the most recently used last.
+        self._statements = collections.OrderedDict()
+        # Ids of the statements to close with the next command.
+        self._closed_statements = []
+        self._statement_stats = collections.Counter()
+        self.max_statements = 64
+        self.server_version = None
+        self.thread_id = None
+        self.created = loop.time()
+        self.last_used = self.created  # Loop time of the last command.
+
+    @property
+    def in_transaction(self):
+        return bool(self._status & SERVER_STATUS_IN_TRANS)
+
+    def is_closed(self):
+        return self._protocol.closed or self._writer.is_closing()
+
+    def is_busy(self):
+        return self._lock.locked()
+
+    async def execute(self, query, args=None):
+        """Execute a query, return a Result.
+
+        args: A sequence for %s placeholders, or a mapping for %(name)s, the
+        values are escaped into the query.
+        """
+
+        query = format_query(query, args)
+        async with self._lock:
+            try:
+                self._send_command(COM_QUERY, query)
+                await self._writer.drain()
+                return await self._read_result()
+            except BaseException as exc:
+                self._fail(exc)
+                raise
+
+    async def fetch(self, query, args=None):
+        # Return the rows as a list of tuples.
+        return (await self.execute(query, args)).rows
+
+    async def fetchone(self, query, args=None):
+        # Return the first row, or None.
+        rows = await self.fetch(query, args)
+        return rows[0] if rows else None
+
+    def stream(self, query, args=None):
+        """Execute a query, return a ResultStream of its rows.
+
+        Use it with `async with`, or close() it if the rows are not all read,
+        the connection can't run another command before.
+        """
+
+        return ResultStream(self, format_query(query, args))
+
+    async def prepare(self, query):
+        """Prepare a query on the server, return a PreparedStatement.
+
+        query: With %s placeholders, like execute(), not %(name)s ones.
+
+        The statements are cached by query: at most max_statements stay
+        prepared, the least recently used one is closed to prepare a new
+        one.
+        """
+
+        statement = self._statements.get(query)
+        if statement is None:
+            async with self._lock:
+                # Maybe prepared by another coroutine meanwhile.
+                statement = self._statements.get(query)
+                if statement is None:
+                    statement = PreparedStatement(self, query)
+                    await self._prepare(statement)
+                    return statement
+        self._statements.move_to_end(query)
+        self._statement_stats['hits'] += 1
+        return statement
+
+    def statement_stats(self):
+        stats = {'statements': len(self._statements)}
+        for name in ('hits', 'prepares', 'reprepares', 'evictions'):
+            stats[name] = self._statement_stats[name]
+        return stats
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        # Committed at the end of the block, or rolled back on exception.
+        await self.execute('begin')
+        try:
+            yield self
+        except BaseException:
+            if not self.is_closed():
+                await self.execute('rollback')
+            raise
+        await self.execute('commit')
+
+    async def ping(self):
+        async with self._lock:
+            try:
+                self._send_command(COM_PING)
+                self._read_ok(await self._read_packet())
+            except BaseException as exc:
+                self._fail(exc)
+                raise
+
+    def close(self):
+        if self.is_closed():
+            return
+        if not self._lock.locked():
+            self._seq = 0
+            self._write_packet(bytes([COM_QUIT]))
+        self._writer.close()
+
+    async def _handshake(self, user, password, db):
+        self._seq = 0
+        packet = await self._read_packet()
+        if packet[0] == 0xff:
+            raise _parse_error(packet)
+        buf = _Buffer(packet)
+        if buf.read_uint(1) != 10:
+            raise ProtocolError('Unsupported protocol version.')
+        self.server_version = buf.read_nul().decode()
+        self.thread_id = buf.read_uint(4)
+        nonce = buf.read(8)
+        buf.skip(1)
+        capabilities = buf.read_uint(2)
+        plugin = 'mysql_native_password'
+        if buf.remaining():
+            buf.skip(1)  # Character set.
+            self._status = buf.read_uint(2)
+            capabilities |= buf.read_uint(2) << 16
+            nonce_size = buf.read_uint(1)
+            buf.skip(10)
+            if capabilities & CLIENT_SECURE_CONNECTION:
+                nonce += buf.read(max(13, nonce_size - 8))[:12]
+            if capabilities & CLIENT_PLUGIN_AUTH:
+                plugin = buf.read_nul().decode()
+
+        if not capabilities & CLIENT_PROTOCOL_41:
+            raise ProtocolError('Server too old, protocol 4.1 required.')
+        flags = CLIENT_FLAGS & capabilities
+        if db:
+            flags |= CLIENT_CONNECT_WITH_DB
+        password = (password or '').encode()
+        auth = _scramble(plugin, password, nonce)
+
+        payload = [struct.pack('<IIB23x', flags, MAX_PACKET_SIZE,
+                               CHARSET_UTF8MB4),
+                   user.encode(), b'\0']
+        if flags & CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA:
+            payload.append(_lenenc_int(len(auth)))
+        else:
+            payload.append(bytes([len(auth)]))
+        payload.append(auth)
+        if db:
+            payload += [db.encode(), b'\0']
+        if flags & CLIENT_PLUGIN_AUTH:
+            payload += [plugin.encode(), b'\0']
+        self._write_packet(b''.join(payload))
+
+        while True:
+            packet = await self._read_packet()
+            status = packet[0]
+            if status == 0x00:
+                self._read_ok(packet)
+                return
+            if status == 0xff:
+                raise _parse_error(packet)
+            if status == 0xfe:
+                # Switch to another authentication method.
+                buf = _Buffer(packet)
+                buf.skip(1)
+                plugin = buf.read_nul().decode()
+                nonce = buf.read(buf.remaining()).rstrip(b'\0')
+                self._write_packet(_scramble(plugin, password, nonce))
+            elif status == 0x01 and plugin == 'caching_sha2_password':
+                if packet[1:2] == b'\x03':
+                    # Fast authentication succeeded, the OK packet follows.
+                    continue
+                if not self._unix_socket:
+                    raise ProtocolError(
+                        'caching_sha2_password full authentication needs '
+                        'TLS or a unix socket.')
+                self._write_packet(password + b'\0')
+            else:
+                raise ProtocolError('Unexpected packet in authentication.')
+
+    async def _prepare(self, statement):
+        # Called with the lock held.
+        query = _PLACEHOLDER_RE.sub(
+            lambda match: '%' if match.group() == '%%' else '?',
+            statement.query)
+        try:
+            self._send_command(COM_STMT_PREPARE, query)
+            await self._writer.drain()
+            packet = await self._read_packet()
+            if packet[0] == 0xff:
+                raise _parse_error(packet)
+            statement_id, column_count, param_count = struct.unpack_from(
+                '<IHH', packet, 1)
+            if param_count:
+                for _ in range(param_count):
+                    await self._read_packet()
+                self._read_eof(await self._read_packet())
+            columns = None
+            if column_count:
+                columns = []
+                for _ in range(column_count):
+                    columns.append(_parse_column(await self._read_packet()))
+                self._read_eof(await self._read_packet())
+        except BaseException as exc:
+            self._fail(exc)
+            raise
+
+        statement.statement_id = statement_id
+        statement.param_count = param_count
+        statement.columns = columns
+        self._statement_stats['prepares'] += 1
+        other = self._statements.pop(statement.query, None)
+        if other is not None and other is not statement:
+            self._close_statement(other)
+        self._statements[statement.query] = statement
+        if len(self._statements) > self.max_statements:
+            _, old = self._statements.popitem(last=False)
+            self._statement_stats['evictions'] += 1
+            self._close_statement(old)
+
+    async def _execute_statement(self, statement, args):
+        args = tuple(args)
+        async with self._lock:
+            if statement.statement_id is None:
+                # Closed, or evicted from the cache.
+                await self._prepare(statement)
+                self._statement_stats['reprepares'] += 1
+            payload = _execute_payload(statement, args)
+            try:
+                self._send_command(COM_STMT_EXECUTE, payload)
+                await self._writer.drain()
+                return await self._read_result(binary=True)
+            except BaseException as exc:
+                self._fail(exc)
+                raise
+
+    def _close_statement(self, statement):
+        if statement.statement_id is None:
+            return
+        # COM_STMT_CLOSE has no response, it's sent before the next command,
+        # not in the middle of the result of another one.
+        self._closed_statements.append(statement.statement_id)
+        statement.statement_id = None
+        if self._statements.get(statement.query) is statement:
+            del self._statements[statement.query]
+
+    def _send_command(self, command, data=''):
+        for statement_id in self._closed_statements:
+            self._seq = 0
+            self._write_packet(bytes([COM_STMT_CLOSE]) +
+                               struct.pack('<I', statement_id))
+        self._closed_statements.clear()
+        self._seq = 0
+        if isinstance(data, str):
+            data = data.encode()
+        self._write_packet(bytes([command]) + data)
+
+    def _write_packet(self, payload):
+        view = memoryview(payload)
+        while True:
+            chunk = view[:MAX_PACKET_SIZE]
+            view = view[MAX_PACKET_SIZE:]
+            header = struct.pack('<I', len(chunk))[:3] + bytes([self._seq])
+            self._seq = (self._seq + 1) & 0xff
+            self._writer.writelines([header, chunk])
+            # A payload of exactly a multiple of the max size ends with an
+            # empty packet.
+            if len(chunk) < MAX_PACKET_SIZE:
+                break
+
+    async def _read_packet(self):
+        parts = []
+        while True:
+            header = await self._reader.readexactly(4)
+            size = header[0] | header[1] << 8 | header[2] << 16
+            if header[3] != self._seq:
+                raise ProtocolError('Packet out of order.')
+            self._seq = (self._seq + 1) & 0xff
+            parts.append(await self._reader.readexactly(size))
+            if size < MAX_PACKET_SIZE:
+                break
+        self.last_used = self._loop.time()
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    async def _read_result_head(self):
+        # Return a Result if there's no result set, else the columns.
+        packet = await self._read_packet()
+        status = packet[0]
+        if status == 0x00:
+            return self._read_ok(packet)
+        if status == 0xff:
+            raise _parse_error(packet)
+        if status == 0xfb:
+            raise ProtocolError('LOAD DATA LOCAL is not supported.')
+
+        count = _Buffer(packet).read_lenenc_int()
+        columns = []
+        for _ in range(count):
+            columns.append(_parse_column(await self._read_packet()))
+        self._read_eof(await self._read_packet())
+        return columns
+
+    async def _read_result(self, binary=False):
+        # Return a Result, with all the rows of a result set. binary: The
+        # rows of a prepared statement, in the binary protocol.
+        result = await self._read_result_head()
+        if not isinstance(result, Result):
+            if binary:
+                converters = [_binary_reader(column) for column in result]
+            else:
+                converters = [_converter(column) for column in result]
+            rows = []
+            while True:
+                row = await self._read_row(converters, binary)
+                if row is None:
+                    break
+                rows.append(row)
+            result = Result(result, rows)
+        await self._read_more_results()
+        return result
+
+    async def _read_row(self, converters, binary=False):
+        # Return the next row, or None after the last one.
+        packet = await self._read_packet()
+        first = packet[0]
+        if first == 0xfe and len(packet) < 9:
+            self._read_eof(packet)
+            return None
+        if first == 0xff:
+            raise _parse_error(packet)
+        if binary:
+            return _parse_binary_row(packet, converters)
+        return _parse_row(packet, converters)
+
+    async def _read_more_results(self):
+        # Drop the other results of a stored procedure.
+        while self._status & SERVER_MORE_RESULTS_EXISTS:
+            result = await self._read_result_head()
+            if not isinstance(result, Result):
+                while await self._read_row(()) is not None:
+                    pass
+
+    def _read_ok(self, packet):
+        if packet[0] == 0xff:
+            raise _parse_error(packet)
+        buf = _Buffer(packet)
+        buf.skip(1)
+        affected_rows = buf.read_lenenc_int()
+        insert_id = buf.read_lenenc_int()
+        self._status = buf.read_uint(2)
+        warnings = buf.read_uint(2)
+        info = buf.read(buf.remaining()).decode('utf-8', 'replace')
+        return Result(affected_rows=affected_rows, insert_id=insert_id,
+                      warnings=warnings, info=info)
+
+    def _read_eof(self, packet):
+        if packet[0] != 0xfe:
+            raise ProtocolError('EOF packet expected.')
+        _, self._status = struct.unpack_from('<HH', packet, 1)
+
+    def _fail(self, exc):
+        # An error returned by the server leaves the connection usable.
+        # Otherwise, e.g. cancelled in the middle of a result, the state of
+        # the protocol is unknown.
+        if not isinstance(exc, MySQLError):
+            self._writer.close()
+
+
+async def connect(loop, host='localhost', port=3306, user='root',
+                  password='', db=None, unix_socket=None,
+                  connect_timeout=10.0, high_water=2 ** 18):
+    """Open a connection, return a Connection.
+
+    unix_socket: Path of the unix socket, instead of host and port.
+    high_water: Max bytes of a result buffered before pausing reading.
+    """
+
+    protocol = ClientProtocol(loop, high_water)
+    if unix_socket:
+        coro = loop.create_unix_connection(lambda: protocol, unix_socket)
+    else:
+        coro = loop.create_connection(lambda: protocol, host, port)
+    transport, _ = await asyncio.wait_for(coro, connect_timeout)
+
+    conn = Connection(loop, protocol, Writer(transport, protocol),
+                      unix_socket=bool(unix_socket))
+    try:
+        await asyncio.wait_for(conn._handshake(user, password, db),
+                               connect_timeout)
+    except BaseException:
+        transport.close()
+        raise
+    return conn
+
+
+class PoolError(Error):
+    pass
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class Pool:
+    """Pool of connections for coroutines.
+
+    connect: Coroutine function returning a new Connection, e.g. a partial
+    of connect().
+    min_size: Connections opened by start() and kept open. One closed
+    because it failed a ping or reached max_lifetime is replaced in the
+    background.
+    max_size: Max number of connections, in use and idle.
+    timeout: Seconds acquire() waits for a connection when max_size are in
+    use, PoolTimeout is raised then. None to wait forever.
+    max_lifetime: Seconds after which a connection is closed and replaced.
+    None for no limit.
+    ping_interval: A connection idle for longer than this is checked with a
+    ping before being handed out.
+
+    A connection given back in a transaction is rolled back.
+    """
+
+    def __init__(self, loop, connect, min_size=1, max_size=10, timeout=30.0,
+                 max_lifetime=3600.0, ping_interval=1.0):
+        if min_size > max_size:
+            raise ValueError('min_size is larger than max_size.')
+
+        self._loop = loop
+        self._connect = connect
+        self._min_size = min_size
+        self._max_size = max_size
+        self._timeout = timeout
+        self._max_lifetime = max_lifetime
+        self._ping_interval = ping_interval
+
+        # Idle connections, the most recently used one at the right.
+        self._idle = collections.deque()
+        self._size = 0  # Connections open or being opened.
+        # Futures of the coroutines waiting for a connection.
+        self._waiters = collections.deque()
+        self._closed = False
+        self._filling = None  # Task replacing the connections closed.
+
+        self._stats = collections.Counter()
+        self._wait_time = 0.0
+
+    async def start(self):
+        # Open min_size connections.
+        while self._size < self._min_size:
+            self._size += 1
+            try:
+                conn = await self._open()
+            except BaseException:
+                self._forget()
+                raise
+            self._idle.append(conn)
+            self._wakeup_waiter()
+
+    async def acquire(self, timeout=-1):
+        """Borrow a connection, give it back with release().
+
+        timeout: Overrides the timeout of the pool if not -1.
+        """
+
+        if timeout == -1:
+            timeout = self._timeout
+        deadline = None
+
+        while True:
+            if self._closed:
+                raise PoolError('The pool is closed.')
+
+            if self._idle:
+                conn = self._idle.pop()
+                if not await self._validate(conn):
+                    self._discard(conn)
+                    continue
+                self._stats['borrowed'] += 1
+                return conn
+
+            if self._size < self._max_size:
+                # Reserve the slot before connecting.
+                self._size += 1
+                try:
+                    conn = await self._open()
+                except BaseException:
+                    self._forget()
+                    raise
+                self._stats['borrowed'] += 1
+                return conn
+
+            if deadline is None:
+                self._stats['waits'] += 1
+                if timeout is not None:
+                    deadline = self._loop.time() + timeout
+            remaining = None
+            if timeout is not None:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        'No connection available in {} seconds.'.format(
+                            timeout))
+
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            start = self._loop.time()
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # Woken but cancelled, pass the wakeup on.
+                    self._wakeup_waiter()
+                raise
+            finally:
+                self._wait_time += self._loop.time() - start
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    async def release(self, conn):
+        try:
+            if conn.is_closed() or conn.is_busy():
+                # Closed, or a stream not read to the end.
+                self._discard(conn)
+                return
+            if conn.in_transaction:
+                try:
+                    await conn.execute('rollback')
+                except (Error, OSError):
+                    self._stats['rollback_failures'] += 1
+                    self._discard(conn)
+                    return
+        except BaseException:
+            self._discard(conn)
+            raise
+
+        if self._closed:
+            self._discard(conn)
+            return
+        self._idle.append(conn)
+        self._wakeup_waiter()
+
+    @contextlib.asynccontextmanager
+    async def connection(self, timeout=-1):
+        conn = await self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    def stats(self):
+        stats = {
+            'size': self._size,
+            'idle': len(self._idle),
+            'in_use': self._size - len(self._idle),
+            'waiting': len(self._waiters),
+            'wait_time': self._wait_time,
+        }
+        for name in ('created', 'closed', 'borrowed', 'waits', 'timeouts',
+                     'ping_failures', 'recycled', 'rollback_failures'):
+            stats[name] = self._stats[name]
+        return stats
+
+    def close(self):
+        # Close the idle connections, the ones in use are closed when they
+        # are given back.
+        self._closed = True
+        if self._filling is not None:
+            self._filling.cancel()
+        while self._idle:
+            self._discard(self._idle.pop())
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_exception(PoolError('The pool is closed.'))
+        self._waiters.clear()
+
+    async def _open(self):
+        conn = await self._connect()
+        self._stats['created'] += 1
+        return conn
+
+    async def _validate(self, conn):
+        if conn.is_closed():
+            return False
+        now = self._loop.time()
+        if (self._max_lifetime is not None and
+                now - conn.created > self._max_lifetime):
+            self._stats['recycled'] += 1
+            return False
+        if now - conn.last_used >= self._ping_interval:
+            try:
+                await conn.ping()
+            except (Error, OSError):
+                self._stats['ping_failures'] += 1
+                return False
+        return True
+
+    def _discard(self, conn):
+        conn.close()
+        self._stats['closed'] += 1
+        self._forget()
+        if (not self._closed and self._size < self._min_size and
+                self._filling is None):
+            self._filling = self._loop.create_task(self._fill())
+
+    async def _fill(self):
+        # Open connections up to min_size again.
+        try:
+            while not self._closed and self._size < self._min_size:
+                self._size += 1
+                try:
+                    conn = await self._open()
+                except (Error, OSError, asyncio.TimeoutError):
+                    # Opened on demand by acquire() then.
+                    self._forget()
+                    break
+                except BaseException:
+                    self._forget()
+                    raise
+                if self._closed:
+                    self._discard(conn)
+                    break
+                # Left of the idle ones, used last.
+                self._idle.appendleft(conn)
+                self._wakeup_waiter()
+        finally:
+            self._filling = None
+
+    def _forget(self):
+        self._size -= 1
+        self._wakeup_waiter()
+
+    def _wakeup_waiter(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+
+class _Buffer:
+    # Read the fields of a packet.
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    def remaining(self):
+        return len(self._data) - self._pos
+
+    def skip(self, n):
+        self._pos += n
+
+    def read(self, n):
+        data = self._data[self._pos:self._pos + n]
+        self._pos += n
+        return data
+
+    def read_uint(self, n):
+        return int.from_bytes(self.read(n), 'little')
+
+    def read_nul(self):
+        # A string ending with NUL, or with the packet.
+        end = self._data.find(b'\0', self._pos)
+        if end == -1:
+            end = len(self._data)
+        data = self._data[self._pos:end]
+        self._pos = end + 1
+        return data
+
+    def read_lenenc_int(self):
+        first = self.read_uint(1)
+        if first < 0xfb:
+            return first
+        if first == 0xfc:
+            return self.read_uint(2)
+        if first == 0xfd:
+            return self.read_uint(3)
+        if first == 0xfe:
+            return self.read_uint(8)
+        raise ProtocolError('Invalid length encoded integer.')
+
+    def read_lenenc_bytes(self):
+        return self.read(self.read_lenenc_int())
+
+
+def _lenenc_int(n):
+    if n < 0xfb:
+        return bytes([n])
+    if n < 1 << 16:
+        return b'\xfc' + n.to_bytes(2, 'little')
+    if n < 1 << 24:
+        return b'\xfd' + n.to_bytes(3, 'little')
+    return b'\xfe' + n.to_bytes(8, 'little')
+
+
+def _parse_error(packet):
+    errno = int.from_bytes(packet[1:3], 'little')
+    if packet[3:4] == b'#':
+        sqlstate = packet[4:9].decode()
+        message = packet[9:]
+    else:
+        sqlstate = None
+        message = packet[3:]
+    return MySQLError(errno, sqlstate, message.decode('utf-8', 'replace'))
+
+
+def _parse_column(packet):
+    buf = _Buffer(packet)
+    for _ in range(2):
+        buf.read_lenenc_bytes()  # Catalog, schema.
+    table = buf.read_lenenc_bytes().decode()
+    buf.read_lenenc_bytes()  # Original table.
+    name = buf.read_lenenc_bytes().decode()
+    buf.read_lenenc_bytes()  # Original name.
+    buf.read_lenenc_int()  # Length of the fields below.
+    charset, length, type_code, flags, decimals = struct.unpack_from(
+        '<HIBHB', packet, buf._pos)
+    return Column(name, table, type_code, charset, length, flags, decimals)
+
+
+def _parse_row(packet, converters):
+    row = []
+    pos = 0
+    for convert in converters:
+        first = packet[pos]
+        if first == 0xfb:
+            row.append(None)
+            pos += 1
+            continue
+        if first < 0xfb:
+            size = first
+            pos += 1
+        elif first == 0xfc:
+            size = packet[pos + 1] | packet[pos + 2] << 8
+            pos += 3
+        elif first == 0xfd:
+            size = int.from_bytes(packet[pos + 1:pos + 4], 'little')
+            pos += 4
+        else:
+            size = int.from_bytes(packet[pos + 1:pos + 9], 'little')
+            pos += 9
+        value = packet[pos:pos + size]
+        pos += size
+        row.append(value if convert is None else convert(value))
+    return tuple(row)
+
+
+def _parse_binary_row(packet, readers):
+    # 0x00, a bitmap of the NULL values from its third bit, then the values.
+    buf = _Buffer(packet)
+    buf.skip(1 + (len(readers) + 9) // 8)
+    row = []
+    for i, read in enumerate(readers, 2):
+        if packet[1 + i // 8] & 1 << i % 8:
+            row.append(None)
+        else:
+            row.append(read(buf))
+    return tuple(row)
+
+
+def _execute_payload(statement, args):
+    # Return the COM_STMT_EXECUTE packet of a statement, without the command.
+    if len(args) != statement.param_count:
+        raise TypeError('The statement takes {} args, {} given.'.format(
+            statement.param_count, len(args)))
+    payload = [struct.pack('<IBI', statement.statement_id, 0, 1)]
+    if args:
+        null_bitmap = bytearray((len(args) + 7) // 8)
+        types = []
+        values = []
+        for i, value in enumerate(args):
+            if value is None:
+                null_bitmap[i // 8] |= 1 << i % 8
+                types.append(bytes([TYPE_NULL, 0]))
+                continue
+            type_code, unsigned, data = _encode_param(value)
+            types.append(bytes([type_code, PARAM_UNSIGNED if unsigned else 0]))
+            values.append(data)
+        # 1: the types of the args follow.
+        payload += [null_bitmap, b'\x01'] + types + values
+    return b''.join(payload)
+
+
+def _scramble(plugin, password, nonce):
+    if not password:
+        return b''
+    if plugin == 'mysql_native_password':
+        # SHA1(password) XOR SHA1(nonce + SHA1(SHA1(password)))
+        stage1 = hashlib.sha1(password).digest()
+        stage2 = hashlib.sha1(stage1).digest()
+        mask = hashlib.sha1(nonce[:20] + stage2).digest()
+    elif plugin == 'caching_sha2_password':
+        # SHA256(password) XOR SHA256(SHA256(SHA256(password)) + nonce)
+        stage1 = hashlib.sha256(password).digest()
+        stage2 = hashlib.sha256(stage1).digest()
+        mask = hashlib.sha256(stage2 + nonce[:20]).digest()
+    else:
+        raise ProtocolError('Authentication method {} is not '
+                            'supported.'.format(plugin))
+    return bytes(a ^ b for a, b in zip(stage1, mask))
+
+
+# Conversion of the values of the rows, from text.
+
+def _to_decimal(value):
+    return decimal.Decimal(value.decode())
+
+
+def _to_datetime(value):
+    text = value.decode()
+    try:
+        if '.' in text:
+            return datetime.datetime.strptime(text, '%Y-%m-%d %H:%M:%S.%f')
+        return datetime.datetime.strptime(text, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        # E.g. 0000-00-00 00:00:00.
+        return None
+
+
+def _to_date(value):
+    try:
+        return datetime.datetime.strptime(value.decode(), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _to_timedelta(value):
+    # [-]HHH:MM:SS[.ffffff], a duration up to 838 hours.
+    text = value.decode()
+    sign = -1 if text.startswith('-') else 1
+    hours, minutes, seconds = text.lstrip('-').split(':')
+    return sign * datetime.timedelta(hours=int(hours), minutes=int(minutes),
+                                     seconds=float(seconds))
+
+
+def _to_str(value):
+    return value.decode('utf-8')
+
+
+_CONVERTERS = {
+    TYPE_TINY: int,
+    TYPE_SHORT: int,
+    TYPE_LONG: int,
+    TYPE_LONGLONG: int,
+    TYPE_INT24: int,
+    TYPE_YEAR: int,
+    TYPE_FLOAT: float,
+    TYPE_DOUBLE: float,
+    TYPE_DECIMAL: _to_decimal,
+    TYPE_NEWDECIMAL: _to_decimal,
+    TYPE_DATETIME: _to_datetime,
+    TYPE_TIMESTAMP: _to_datetime,
+    TYPE_DATE: _to_date,
+    TYPE_TIME: _to_timedelta,
+    TYPE_BIT: None,
+}
+
+
+def _converter(column):
+    # Return the function converting the values of a column, None to keep
+    # the bytes.
+    if column.type_code in _CONVERTERS:
+        return _CONVERTERS[column.type_code]
+    if column.charset == CHARSET_BINARY:
+        return None
+    return _to_str
+
+
+# Reading of the values of the rows of a prepared statement, in the binary
+# protocol.
+
+# Size of the integer types.
+_BINARY_INTS = {
+    TYPE_TINY: 1,
+    TYPE_SHORT: 2,
+    TYPE_YEAR: 2,
+    TYPE_INT24: 4,
+    TYPE_LONG: 4,
+    TYPE_LONGLONG: 8,
+}
+
+
+def _read_datetime(buf):
+    # Length 0, 4, 7 or 11: the date, the time, the microseconds.
+    size = buf.read_uint(1)
+    try:
+        return datetime.datetime(*struct.unpack(
+            '<HBBBBBI', buf.read(size) + bytes(11 - size)))
+    except ValueError:
+        # E.g. 0000-00-00 00:00:00.
+        return None
+
+
+def _read_date(buf):
+    value = _read_datetime(buf)
+    return value.date() if value is not None else None
+
+
+def _read_timedelta(buf):
+    # Length 0, 8 or 12: the sign, the days, the time, the microseconds.
+    size = buf.read_uint(1)
+    negative, days, hours, minutes, seconds, microseconds = struct.unpack(
+        '<BIBBBI', buf.read(size) + bytes(12 - size))
+    value = datetime.timedelta(days=days, hours=hours, minutes=minutes,
+                               seconds=seconds, microseconds=microseconds)
+    return -value if negative else value
+
+
+def _binary_reader(column):
+    # Return the function reading a value of a column from a _Buffer.
+    type_code = column.type_code
+    if type_code in _BINARY_INTS:
+        size = _BINARY_INTS[type_code]
+        signed = not column.flags & UNSIGNED_FLAG
+        return lambda buf: int.from_bytes(buf.read(size), 'little',
+                                          signed=signed)
+    if type_code == TYPE_FLOAT:
+        return lambda buf: struct.unpack('<f', buf.read(4))[0]
+    if type_code == TYPE_DOUBLE:
+        return lambda buf: struct.unpack('<d', buf.read(8))[0]
+    if type_code in (TYPE_DATETIME, TYPE_TIMESTAMP):
+        return _read_datetime
+    if type_code == TYPE_DATE:
+        return _read_date
+    if type_code == TYPE_TIME:
+        return _read_timedelta
+    # Decimals, strings and bits, as in the text protocol.
+    convert = _converter(column)
+    if convert is None:
+        return _Buffer.read_lenenc_bytes
+    return lambda buf: convert(buf.read_lenenc_bytes())
+
+
+# Encoding of the args of a prepared statement.
+
+def _encode_param(value):
+    # Return the type, unsigned or not, and the binary value.
+    if isinstance(value, bool):
+        return TYPE_TINY, False, bytes([value])
+    if isinstance(value, int):
+        if value >= 1 << 63:
+            return TYPE_LONGLONG, True, struct.pack('<Q', value)
+        return TYPE_LONGLONG, False, struct.pack('<q', value)
+    if isinstance(value, float):
+        return TYPE_DOUBLE, False, struct.pack('<d', value)
+    if isinstance(value, decimal.Decimal):
+        data = str(value).encode()
+        return TYPE_NEWDECIMAL, False, _lenenc_int(len(data)) + data
+    if isinstance(value, str):
+        data = value.encode()
+        return TYPE_VAR_STRING, False, _lenenc_int(len(data)) + data
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        return TYPE_BLOB, False, _lenenc_int(len(data)) + data
+    if isinstance(value, datetime.datetime):
+        return TYPE_DATETIME, False, struct.pack(
+            '<BHBBBBBI', 11, value.year, value.month, value.day, value.hour,
+            value.minute, value.second, value.microsecond)
+    if isinstance(value, datetime.date):
+        return TYPE_DATE, False, struct.pack(
+            '<BHBB', 4, value.year, value.month, value.day)
+    if isinstance(value, datetime.timedelta):
+        span = abs(value)
+        hours, rest = divmod(span.seconds, 3600)
+        minutes, seconds = divmod(rest, 60)
+        return TYPE_TIME, False, struct.pack(
+            '<BBIBBBI', 12, value < datetime.timedelta(0), span.days, hours,
+            minutes, seconds, span.microseconds)
+    if isinstance(value, datetime.time):
+        return TYPE_TIME, False, struct.pack(
+            '<BBIBBBI', 12, 0, 0, value.hour, value.minute, value.second,
+            value.microsecond)
+    raise TypeError('Can not send {!r}.'.format(type(value)))
+
+
+# Escaping of the args, as with NO_BACKSLASH_ESCAPES off.
+
+_ESCAPE_TABLE = {
+    0: '\\0',
+    ord('\n'): '\\n',
+    ord('\r'): '\\r',
+    ord('\\'): '\\\\',
+    ord("'"): "\\'",
+    ord('"'): '\\"',
+    0x1a: '\\Z',
+}
+
+
+def escape(value):
+    """Return the SQL literal of a value."""
+
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, decimal.Decimal)):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.translate(_ESCAPE_TABLE) + "'"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "X'" + bytes(value).hex() + "'"
+    if isinstance(value, datetime.datetime):
+        return "'" + value.isoformat(' ') + "'"
+    if isinstance(value, (datetime.date, datetime.time)):
+        return "'" + value.isoformat() + "'"
+    if isinstance(value, datetime.timedelta):
+        seconds = abs(value)
+        hours, rest = divmod(seconds, datetime.timedelta(hours=1))
+        minutes, rest = divmod(rest, datetime.timedelta(minutes=1))
+        return "'{}{}:{:02}:{:02}.{:06}'".format(
+            '-' if value < datetime.timedelta(0) else '', hours, minutes,
+            rest.seconds, rest.microseconds)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return '(' + ','.join(escape(item) for item in value) + ')'
+    raise TypeError('Can not escape {!r}.'.format(type(value)))
+
+
+# %s, or %% for a literal %, in the query of a prepared statement.
+_PLACEHOLDER_RE = re.compile(r'%[s%]')
+
+
+def format_query(query, args=None):
+    # Put the escaped args into the query, like cur.execute() of MySQLdb.
+    if args is None:
+        return query
+    if isinstance(args, collections.abc.Mapping):
+        return query % {key: escape(value) for key, value in args.items()}
+    return query % tuple(escape(value) for value in args)
+
+
+async def main(loop, host, port, user, password, db):
+    conn = await connect(loop, host, port, user, password, db)
+    print('MySQL version: {}'.format(conn.server_version))
+
+    await conn.execute('drop table if exists writers')
+    await conn.execute('create table writers(id int primary key '
+                       'auto_increment, name varchar(25)) engine=innodb '
+                       'default charset utf8mb4')
+    # Prepared once on the server, executed once per name.
+    insert = await conn.prepare('insert into writers(name) values(%s)')
+    async with conn.transaction():
+        await insert.executemany(
+            (name,) for name in ('Jack London', 'Honore de Balzac',
+                                 'Lion Feuchtwanger', 'Emile Zola',
+                                 'Truman Capote', '曹雪芹'))
+
+    for row in await conn.fetch('select * from writers'):
+        print(*row)
+
+    select = await conn.prepare('select name from writers where id = %s')
+    for i in (4, 6):
+        print(*await select.fetchone((i,)))
+    print(conn.statement_stats())
+
+    # A row larger than the high water mark of the Reader.
+    row = await conn.fetchone("select repeat('x', 1000000)")
+    print('Large row: {} bytes'.format(len(row[0])))
+
+    async with conn.stream('select * from writers') as rows:
+        async for row in rows:
+            print(*row)
+            if row[0] == 3:
+                # Leave early, the rest is read when the stream is closed.
+                break
+
+    # Queries running concurrently, each on its own connection.
+    pool = Pool(loop, lambda: connect(loop, host, port, user, password, db),
+                max_size=4)
+
+    async def count(i):
+        async with pool.connection() as conn:
+            row = await conn.fetchone(
+                'select count(*) from writers where id <= %s', (i,))
+            return row[0]
+
+    print(await asyncio.gather(*[count(i) for i in range(10)]))
+    print(pool.stats())
+    pool.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='asyncio MySQL client.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='chopin')
+    parser.add_argument('--db', default='test')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(loop, args.host, args.port, args.user,
+                                 args.password, args.db))
@@ -0,0 +1,434 @@
+import argparse
+import asyncio
+import decimal
+import os
+import re
+import struct
+
+from mysql_client import (
+    CHARSET_UTF8MB4, CLIENT_CONNECT_WITH_DB, CLIENT_FLAGS,
+    CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA, COM_PING, COM_QUERY, COM_QUIT,
+    COM_STMT_CLOSE, COM_STMT_EXECUTE, COM_STMT_PREPARE, MAX_PACKET_SIZE,
+    PARAM_UNSIGNED, SERVER_STATUS_IN_TRANS, TYPE_BLOB, TYPE_DOUBLE,
+    TYPE_LONG, TYPE_LONGLONG, TYPE_NEWDECIMAL, TYPE_TINY, TYPE_VAR_STRING,
+    ClientProtocol, Writer, _Buffer, _lenenc_int, _scramble, escape)
+
+# Scripted stand-in of a MySQL server, to try mysql_client.py without one.
+# It speaks the same protocol, with the Reader and Writer of the client, and
+# knows a few queries only:
+#   select version()
+#   drop table if exists writers
+#   create table writers(...)
+#   insert into writers(name) values('...'), ...
+#   select * | name | count(*) from writers [where id = | <= n] [limit n]
+#   select seq from numbers limit n   Rows 1..n, sent with backpressure.
+#   select sleep(n)
+#   select repeat('x', n)              One row of n bytes, in several
+#                                      packets from 16 MB.
+#   begin, start transaction, commit, rollback
+# The same queries can be prepared, with ? placeholders: the args of an
+# execution are escaped into the query, which is run as above, and the rows
+# are sent in the binary protocol. Args of date and time types are not
+# supported.
+# The table is shared by the connections, without any isolation.
+#
+# Usage:
+#   python mysql_fake_server.py --port 3307
+#   python mysql_client.py --port 3307
+
+SERVER_VERSION = '5.7.99-fake'
+
+_REPEAT_RE = re.compile(r"select\s+repeat\('(.)',\s*(\d+)\)$", re.I | re.S)
+_SELECT_RE = re.compile(
+    r'select\s+(\*|name|count\(\*\))\s+from\s+writers'
+    r'(?:\s+where\s+id\s*(=|<=)\s*(\d+))?(?:\s+limit\s+(\d+))?$', re.I)
+_INSERT_RE = re.compile(
+    r'insert\s+into\s+writers\s*\(\s*name\s*\)\s*values\s*(.*)$',
+    re.I | re.S)
+_VALUE_RE = re.compile(r"\s*\(\s*'((?:[^'\\]|\\.)*)'\s*\)\s*(,|$)", re.S)
+_UNESCAPE_RE = re.compile(r'\\(.)', re.S)
+_UNESCAPE = {'0': '\0', 'n': '\n', 'r': '\r', 'Z': '\x1a'}
+
+
+class Database:
+    def __init__(self, users):
+        self.users = users  # User -> password.
+        self.writers = None  # [(id, name)], None if no table.
+        self.next_id = 1
+        self.connections = 0
+
+
+class ServerProtocol(ClientProtocol):
+    def __init__(self, loop, database):
+        super().__init__(loop)
+        self._database = database
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        session = Session(self.loop, self._database, self,
+                          Writer(transport, self))
+        self.loop.create_task(session.run())
+
+
+class Session:
+    def __init__(self, loop, database, protocol, writer):
+        self._loop = loop
+        self._database = database
+        self._reader = protocol.reader
+        self._writer = writer
+        self._seq = 0
+        self._status = 0
+        self._snapshot = None  # Table at the start of the transaction.
+        # Id -> [query, types of the args of the last execution].
+        self._statements = {}
+        self._next_statement_id = 1
+        self._binary = False  # Rows in the binary protocol.
+        self._types = None  # Types of the columns of the rows written.
+
+    async def run(self):
+        try:
+            if await self._handshake():
+                while await self._command():
+                    pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writer.close()
+
+    async def _handshake(self):
+        database = self._database
+        database.connections += 1
+        nonce = bytes(b % 94 + 33 for b in os.urandom(20))
+        self._write_packet(b''.join([
+            b'\x0a', SERVER_VERSION.encode(), b'\0',
+            struct.pack('<I', database.connections), nonce[:8], b'\0',
+            struct.pack('<HBHHB', CLIENT_FLAGS & 0xffff, CHARSET_UTF8MB4,
+                        self._status, CLIENT_FLAGS >> 16, 21),
+            bytes(10), nonce[8:], b'\0', b'mysql_native_password\0']))
+
+        buf = _Buffer(await self._read_packet())
+        flags = buf.read_uint(4)
+        buf.skip(4 + 1 + 23)
+        user = buf.read_nul().decode()
+        if flags & CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA:
+            auth = buf.read_lenenc_bytes()
+        else:
+            auth = buf.read(buf.read_uint(1))
+        if flags & CLIENT_CONNECT_WITH_DB:
+            buf.read_nul()
+
+        password = database.users.get(user)
+        if password is None or auth != _scramble(
+                'mysql_native_password', password.encode(), nonce):
+            self._write_error(1045, '28000',
+                              "Access denied for user '{}'".format(user))
+            return False
+        self._write_ok()
+        return True
+
+    async def _command(self):
+        self._seq = 0
+        packet = await self._read_packet()
+        command = packet[0]
+        if command == COM_QUIT:
+            return False
+        if command == COM_PING:
+            self._write_ok()
+        elif command == COM_QUERY:
+            await self._query(packet[1:].decode().strip())
+        elif command == COM_STMT_PREPARE:
+            self._prepare(packet[1:].decode().strip())
+        elif command == COM_STMT_EXECUTE:
+            await self._execute(packet)
+        elif command == COM_STMT_CLOSE:
+            # No response.
+            self._statements.pop(struct.unpack_from('<I', packet, 1)[0],
+                                 None)
+        else:
+            self._write_error(1047, '08S01', 'Unknown command')
+        await self._writer.drain()
+        return True
+
+    async def _query(self, query):
+        database = self._database
+        lower = query.lower()
+
+        if lower == 'select version()':
+            self._write_result([('version()', TYPE_VAR_STRING)],
+                               [(SERVER_VERSION,)])
+        elif lower in ('begin', 'start transaction'):
+            self._status |= SERVER_STATUS_IN_TRANS
+            self._snapshot = (list(database.writers or []),
+                              database.next_id)
+            self._write_ok()
+        elif lower in ('commit', 'rollback'):
+            if lower == 'rollback' and self._snapshot is not None:
+                database.writers, database.next_id = self._snapshot
+            self._status &= ~SERVER_STATUS_IN_TRANS
+            self._snapshot = None
+            self._write_ok()
+        elif lower == 'drop table if exists writers':
+            database.writers = None
+            self._write_ok()
+        elif lower.startswith('create table writers'):
+            database.writers = []
+            database.next_id = 1
+            self._write_ok()
+        elif lower.startswith('select seq from numbers limit '):
+            await self._numbers(int(lower.rsplit(' ', 1)[1]))
+        elif lower.startswith('select sleep('):
+            await asyncio.sleep(float(lower[len('select sleep('):-1]))
+            self._write_result([(query[len('select '):], TYPE_LONGLONG)],
+                               [(0,)])
+        elif _REPEAT_RE.match(query):
+            char, count = _REPEAT_RE.match(query).groups()
+            self._write_result([(query[len('select '):], TYPE_VAR_STRING)],
+                               [(char * int(count),)])
+        elif _INSERT_RE.match(query):
+            self._insert(_INSERT_RE.match(query).group(1))
+        elif _SELECT_RE.match(query):
+            self._select(*_SELECT_RE.match(query).groups())
+        else:
+            self._write_error(1064, '42000',
+                              'You have an error in your SQL syntax near '
+                              "'{}'".format(query[:80]))
+
+    def _prepare(self, query):
+        statement_id = self._next_statement_id
+        self._next_statement_id += 1
+        self._statements[statement_id] = [query, None]
+        count = query.count('?')
+        # The columns are only sent with the result.
+        self._write_packet(b'\0' + struct.pack('<IHHxH', statement_id, 0,
+                                                count, 0))
+        if count:
+            for _ in range(count):
+                self._write_column('?', TYPE_VAR_STRING)
+            self._write_eof()
+
+    async def _execute(self, packet):
+        buf = _Buffer(packet)
+        buf.skip(1)
+        statement = self._statements.get(buf.read_uint(4))
+        if statement is None:
+            self._write_error(1243, 'HY000',
+                              'Unknown prepared statement handler')
+            return
+        buf.skip(5)  # Flags, iteration count.
+        query = statement[0]
+        count = query.count('?')
+        literals = []
+        if count:
+            null_bitmap = buf.read((count + 7) // 8)
+            if buf.read_uint(1):
+                statement[1] = [buf.read_uint(2) for _ in range(count)]
+            for i, type_code in enumerate(statement[1]):
+                if null_bitmap[i // 8] & 1 << i % 8:
+                    literals.append('NULL')
+                    continue
+                value = _read_param(buf, type_code)
+                if value is None:
+                    self._write_error(1210, 'HY000',
+                                      'Incorrect arguments to '
+                                      'mysqld_stmt_execute')
+                    return
+                literals.append(escape(value))
+
+        literals = iter(literals)
+        self._binary = True
+        try:
+            await self._query(re.sub(r'\?', lambda _: next(literals), query))
+        finally:
+            self._binary = False
+
+    def _insert(self, values):
+        database = self._database
+        if database.writers is None:
+            self._write_no_table()
+            return
+        names = []
+        pos = 0
+        while pos < len(values):
+            match = _VALUE_RE.match(values, pos)
+            if match is None:
+                self._write_error(1064, '42000', 'Syntax error in values')
+                return
+            names.append(_UNESCAPE_RE.sub(
+                lambda m: _UNESCAPE.get(m.group(1), m.group(1)),
+                match.group(1)))
+            pos = match.end()
+
+        first_id = database.next_id
+        for name in names:
+            database.writers.append((database.next_id, name))
+            database.next_id += 1
+        self._write_ok(len(names), first_id)
+
+    def _select(self, what, op, value, limit):
+        rows = self._database.writers
+        if rows is None:
+            self._write_no_table()
+            return
+        if op == '=':
+            rows = [row for row in rows if row[0] == int(value)]
+        elif op == '<=':
+            rows = [row for row in rows if row[0] <= int(value)]
+
+        if what == '*':
+            columns = [('id', TYPE_LONG), ('name', TYPE_VAR_STRING)]
+        elif what == 'name':
+            columns = [('name', TYPE_VAR_STRING)]
+            rows = [(name,) for _, name in rows]
+        else:
+            columns = [('count(*)', TYPE_LONGLONG)]
+            rows = [(len(rows),)]
+        if limit is not None:
+            rows = rows[:int(limit)]
+        self._write_result(columns, rows)
+
+    async def _numbers(self, count):
+        self._write_head([('seq', TYPE_LONGLONG)])
+        for i in range(1, count + 1):
+            self._write_row((i,))
+            if i % 256 == 0:
+                # Wait while the client doesn't read.
+                await self._writer.drain()
+        self._write_eof()
+
+    def _write_result(self, columns, rows):
+        self._write_head(columns)
+        for row in rows:
+            self._write_row(row)
+        self._write_eof()
+
+    def _write_head(self, columns):
+        self._write_packet(_lenenc_int(len(columns)))
+        for name, type_code in columns:
+            self._write_column(name, type_code)
+        self._write_eof()
+        self._types = [type_code for _, type_code in columns]
+
+    def _write_column(self, name, type_code):
+        fields = [b'def', b'test', b'writers', b'writers', name.encode(),
+                  name.encode()]
+        self._write_packet(
+            b''.join(_lenenc_int(len(field)) + field for field in fields) +
+            b'\x0c' + struct.pack('<HIBHBxx', CHARSET_UTF8MB4, 255,
+                                  type_code, 0, 0))
+
+    def _write_row(self, row):
+        if self._binary:
+            self._write_binary_row(row)
+            return
+        fields = []
+        for value in row:
+            if value is None:
+                fields.append(b'\xfb')
+            else:
+                value = str(value).encode()
+                fields.append(_lenenc_int(len(value)) + value)
+        self._write_packet(b''.join(fields))
+
+    def _write_binary_row(self, row):
+        null_bitmap = bytearray((len(row) + 9) // 8)
+        fields = []
+        for i, (value, type_code) in enumerate(zip(row, self._types), 2):
+            if value is None:
+                null_bitmap[i // 8] |= 1 << i % 8
+            elif type_code == TYPE_LONG:
+                fields.append(struct.pack('<i', value))
+            elif type_code == TYPE_LONGLONG:
+                fields.append(struct.pack('<q', value))
+            else:
+                value = str(value).encode()
+                fields.append(_lenenc_int(len(value)) + value)
+        self._write_packet(b'\0' + null_bitmap + b''.join(fields))
+
+    def _write_ok(self, affected_rows=0, insert_id=0):
+        self._write_packet(b'\0' + _lenenc_int(affected_rows) +
+                           _lenenc_int(insert_id) +
+                           struct.pack('<HH', self._status, 0))
+
+    def _write_eof(self):
+        self._write_packet(b'\xfe' + struct.pack('<HH', 0, self._status))
+
+    def _write_error(self, errno, sqlstate, message):
+        self._write_packet(b'\xff' + struct.pack('<H', errno) + b'#' +
+                           sqlstate.encode() + message.encode())
+
+    def _write_no_table(self):
+        self._write_error(1146, '42S02', "Table 'test.writers' doesn't exist")
+
+    def _write_packet(self, payload):
+        # Split like Connection._write_packet() of the client.
+        view = memoryview(payload)
+        while True:
+            chunk = view[:MAX_PACKET_SIZE]
+            view = view[MAX_PACKET_SIZE:]
+            header = struct.pack('<I', len(chunk))[:3] + bytes([self._seq])
+            self._seq = (self._seq + 1) & 0xff
+            self._writer.writelines([header, chunk])
+            if len(chunk) < MAX_PACKET_SIZE:
+                break
+
+    async def _read_packet(self):
+        parts = []
+        while True:
+            header = await self._reader.readexactly(4)
+            size = header[0] | header[1] << 8 | header[2] << 16
+            self._seq = (header[3] + 1) & 0xff
+            parts.append(await self._reader.readexactly(size))
+            if size < MAX_PACKET_SIZE:
+                break
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+
+def _read_param(buf, type_code):
+    # Return the value of an arg, None if its type is not supported.
+    signed = not type_code >> 8 & PARAM_UNSIGNED
+    type_code &= 0xff
+    if type_code == TYPE_TINY:
+        return int.from_bytes(buf.read(1), 'little', signed=signed)
+    if type_code == TYPE_LONGLONG:
+        return int.from_bytes(buf.read(8), 'little', signed=signed)
+    if type_code == TYPE_DOUBLE:
+        return struct.unpack('<d', buf.read(8))[0]
+    if type_code == TYPE_NEWDECIMAL:
+        return decimal.Decimal(buf.read_lenenc_bytes().decode())
+    if type_code == TYPE_VAR_STRING:
+        return buf.read_lenenc_bytes().decode()
+    if type_code == TYPE_BLOB:
+        return buf.read_lenenc_bytes()
+    return None
+
+
+async def serve(loop, host, port, users):
+    database = Database(users)
+    server = await loop.create_server(
+        lambda: ServerProtocol(loop, database), host, port)
+    print('Serving on {}:{}'.format(host, port))
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Scripted stand-in of a MySQL server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3307)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='chopin')
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(serve(loop, args.host, args.port,
+                                      {args.user: args.password}))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+import asyncio
+import collections
+import concurrent.futures
+import os
+import pickle
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+# Run CPU-bound functions in a process pool from coroutines, so parsing and
+# transforming payloads doesn't hold the loop thread and uses all the cores.
+# The calls made within batch_delay are sent to a worker together, in one
+# round trip. Large buffers go through shared memory instead of being
+# pickled.
+#
+#   offload = ProcessOffload(loop)
+#   result = await offload.run(parse, payload, timeout=1.0)
+#   offload.close()
+#
+# The functions and their arguments must be picklable, e.g. functions
+# defined at the top level of a module.
+
+
+class ShmRef:
+    """Reference to a buffer in a shared memory block."""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+
+class ProcessOffload:
+    """Pool of worker processes running functions for coroutines.
+
+    max_workers: Number of processes, the number of cores by default.
+    batch_size: Max number of calls sent to a worker at once.
+    batch_delay: Seconds to wait for more calls before sending a batch, 0
+    to batch only the calls made in the same loop iteration.
+    shm_threshold: Buffers (bytes, bytearray, memoryview) of this size or
+    larger, as arguments or results, are passed in shared memory. The
+    function gets a memoryview of a shared buffer, valid during the call
+    only.
+    mp_context: multiprocessing context of the pool.
+    """
+
+    def __init__(self, loop, max_workers=None, batch_size=64,
+                 batch_delay=0.0, shm_threshold=2 ** 20, mp_context=None):
+        self._loop = loop
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._batch_size = batch_size
+        self._batch_delay = batch_delay
+        self._shm_threshold = shm_threshold
+        if os.name == 'posix':
+            # Share the tracker of the shared memory blocks with the workers,
+            # otherwise each one would unlink the blocks it has seen when it
+            # exits.
+            resource_tracker.ensure_running()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            self._max_workers, mp_context=mp_context)
+
+        self._pending = []  # [(future, func, args, kwargs, deadline)]
+        # Shared memory blocks free to reuse, per size. A new block costs a
+        # page fault per page on its first write.
+        self._free_blocks = collections.defaultdict(list)
+        self._flush_handle = None
+        self._closed = False
+
+        self._calls = 0
+        self._batches = 0
+        self._shm_bytes = 0
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """Call func(*args, **kwargs) in a worker process, return its result.
+
+        timeout: Seconds to wait for the result. A call not started by then
+        is skipped by the worker, a call already running can't be stopped
+        but its result is dropped. The same goes for a cancelled call.
+        """
+
+        if self._closed:
+            raise RuntimeError('ProcessOffload is closed.')
+
+        future = self._loop.create_future()
+        deadline = None
+        if timeout is not None:
+            # Compared by the worker, time.time() is the same in all the
+            # processes.
+            deadline = time.time() + timeout
+        self._pending.append((future, func, args, kwargs, deadline))
+        self._calls += 1
+
+        if len(self._pending) >= self._batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            if self._batch_delay:
+                self._flush_handle = self._loop.call_later(
+                    self._batch_delay, self._flush)
+            else:
+                self._flush_handle = self._loop.call_soon(self._flush)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except BaseException:
+            # Timed out or cancelled, not sent yet if it's still pending.
+            self._pending = [call for call in self._pending
+                             if call[0] is not future]
+            raise
+
+    async def map(self, func, iterable, timeout=None):
+        # Run func on each item, return the results in order.
+        return await asyncio.gather(*[self.run(func, item, timeout=timeout)
+                                      for item in iterable])
+
+    def stats(self):
+        return {
+            'calls': self._calls,
+            'batches': self._batches,
+            'calls_per_batch': (self._calls / self._batches
+                                if self._batches else 0.0),
+            'shm_bytes': self._shm_bytes,
+        }
+
+    def close(self, wait=True):
+        self._closed = True
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for future, *_ in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError('ProcessOffload is closed.'))
+        self._pending = []
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        for blocks in self._free_blocks.values():
+            for block in blocks:
+                block.close()
+                block.unlink()
+        self._free_blocks.clear()
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        while self._pending:
+            batch = self._pending[:self._batch_size]
+            del self._pending[:self._batch_size]
+            self._loop.create_task(self._send(batch))
+
+    async def _send(self, batch):
+        self._batches += 1
+        futures = []
+        calls = []
+        blocks = []  # Shared memory of the arguments, freed at the end.
+        try:
+            for future, func, args, kwargs, deadline in batch:
+                if future.done():
+                    # Cancelled since.
+                    continue
+                # Pickle each call on its own, one that can't be, e.g. a
+                # lambda, fails alone instead of the whole batch.
+                try:
+                    args = tuple(self._share(arg, blocks) for arg in args)
+                    call = pickle.dumps((func, args, kwargs),
+                                        pickle.HIGHEST_PROTOCOL)
+                except Exception as exc:
+                    future.set_exception(exc)
+                    continue
+                futures.append(future)
+                calls.append((call, deadline))
+
+            if not calls:
+                return
+            results = await self._loop.run_in_executor(
+                self._executor, _run_batch, calls, self._shm_threshold)
+        except BaseException as exc:
+            # The pool is broken or shut down, or the task is cancelled.
+            # The callers must not wait forever.
+            for future, *_ in batch:
+                if future.done():
+                    continue
+                if isinstance(exc, Exception):
+                    future.set_exception(exc)
+                else:
+                    future.cancel()
+            if not isinstance(exc, Exception):
+                raise
+            return
+        finally:
+            for block in blocks:
+                self._free_block(block)
+
+        for future, (ok, value) in zip(futures, results):
+            if ok:
+                try:
+                    value = pickle.loads(value)
+                    if isinstance(value, ShmRef):
+                        value = _take_shared(value)
+                except Exception as exc:
+                    ok, value = False, exc
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            elif value is None:
+                future.set_exception(asyncio.TimeoutError())
+            else:
+                future.set_exception(value)
+
+    def _share(self, arg, blocks):
+        # Copy a large buffer to shared memory, return a ShmRef to it.
+        if (not isinstance(arg, (bytes, bytearray, memoryview)) or
+                len(arg) < self._shm_threshold):
+            return arg
+        size = memoryview(arg).nbytes
+        # Round up to a power of 2 so the blocks can be reused.
+        block_size = 1 << (size - 1).bit_length()
+        free = self._free_blocks[block_size]
+        if free:
+            block = free.pop()
+        else:
+            block = shared_memory.SharedMemory(create=True, size=block_size)
+        blocks.append(block)
+        block.buf[:size] = memoryview(arg).cast('B')
+        self._shm_bytes += size
+        return ShmRef(block.name, size)
+
+    def _free_block(self, block):
+        free = self._free_blocks[block.size]
+        if self._closed or len(free) >= self._max_workers * 2:
+            block.close()
+            block.unlink()
+        else:
+            free.append(block)
+
+
+def _take_shared(ref):
+    # Copy a result out of shared memory and free the block.
+    block = shared_memory.SharedMemory(name=ref.name)
+    try:
+        return bytes(block.buf[:ref.size])
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _run_batch(calls, shm_threshold):
+    # In a worker process. calls: [(pickled (func, args, kwargs), deadline)].
+    # Return (True, pickled result), (False, exception) or (False, None) if
+    # the call was skipped for its timeout. The results are pickled one by
+    # one too, so that one that can't be fails alone.
+    results = []
+    for call, deadline in calls:
+        if deadline is not None and time.time() >= deadline:
+            results.append((False, None))
+            continue
+
+        blocks = []
+        views = []
+        try:
+            func, args, kwargs = pickle.loads(call)
+            shared_args = []
+            for arg in args:
+                if isinstance(arg, ShmRef):
+                    block = shared_memory.SharedMemory(name=arg.name)
+                    blocks.append(block)
+                    view = block.buf[:arg.size]
+                    views.append(view)
+                    arg = view
+                shared_args.append(arg)
+
+            result = func(*shared_args, **kwargs)
+            if (isinstance(result, (bytes, bytearray)) and
+                    len(result) >= shm_threshold):
+                block = shared_memory.SharedMemory(create=True,
+                                                   size=len(result))
+                block.buf[:len(result)] = result
+                block.close()
+                result = ShmRef(block.name, len(result))
+            results.append((True, pickle.dumps(result,
+                                               pickle.HIGHEST_PROTOCOL)))
+        except Exception as exc:
+            try:
+                pickle.dumps(exc)
+            except Exception:
+                exc = RuntimeError(repr(exc))
+            results.append((False, exc))
+        finally:
+            try:
+                for view in views:
+                    view.release()
+                for block in blocks:
+                    block.close()
+            except BufferError:
+                # The function kept a view of the buffer, leave it mapped.
+                pass
+    return results
@@ -0,0 +1,231 @@
+import asyncio
+import math
+
+# Hierarchical timing wheel running on top of an event loop, for a large
+# number of timers created and cancelled all the time, e.g. the idle and
+# request timeouts of many connections.
+# loop.call_later() keeps the timers in a heap, O(log n) to schedule, and a
+# cancelled timer stays in the heap until it expires or the heap is cleaned.
+# A timing wheel schedules and cancels in O(1), at the cost of a coarse
+# resolution: a timer fires up to `resolution` seconds late, never early.
+#
+#   wheel = TimingWheel(loop, resolution=0.01)
+#   handle = wheel.call_later(30, on_idle_timeout, conn)
+#   handle.cancel()
+#   await wheel.timer(3, lambda futu: print('Done'))  # Like async2.py
+
+
+class TimerHandle:
+    __slots__ = ('_wheel', '_callback', '_args', '_when', '_tick', '_slot',
+                 '_cancelled')
+
+    def __init__(self, wheel, when, tick, callback, args):
+        self._wheel = wheel
+        self._callback = callback
+        self._args = args
+        self._when = when  # Loop time the timer is due.
+        self._tick = tick  # Tick the timer fires at.
+        self._slot = None  # Dict of the wheel slot holding it.
+        self._cancelled = False
+
+    def when(self):
+        return self._when
+
+    def cancel(self):
+        if self._cancelled:
+            return
+        self._cancelled = True
+        if self._slot is not None:
+            del self._slot[self]
+            self._slot = None
+            self._wheel._count -= 1
+        self._callback = None
+        self._args = None
+
+    def cancelled(self):
+        return self._cancelled
+
+    def __repr__(self):
+        state = ' cancelled' if self._cancelled else ''
+        return '<TimerHandle when={:.3f} {!r}{}>'.format(
+            self._when, self._callback, state)
+
+
+class TimingWheel:
+    """Hierarchical timing wheel.
+
+    resolution: Seconds per tick.
+    bits: A wheel has 2 ** bits slots.
+    levels: Number of wheels. Each slot of a wheel covers a whole turn of the
+    wheel below. With the defaults a timer can be 2 ** 32 ticks (about 497
+    days) ahead, later ones are kept in the last wheel until they're close.
+
+    A tick callback runs on the loop every `resolution` seconds while there
+    are timers, and runs the callbacks of the timers due.
+    """
+
+    def __init__(self, loop, resolution=0.01, bits=8, levels=4):
+        self._loop = loop
+        self._resolution = resolution
+        self._bits = bits
+        self._mask = (1 << bits) - 1
+        self._levels = levels
+        self._max_ticks = (1 << (bits * levels)) - 1
+        # Slots of each wheel, a dict of TimerHandle -> None.
+        self._wheels = [[{} for _ in range(1 << bits)]
+                        for _ in range(levels)]
+        self._origin = loop.time()
+        self._tick = 0  # Last tick processed.
+        self._count = 0  # Timers scheduled.
+        self._ticker = None  # Handle of the tick callback.
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    def __len__(self):
+        return self._count
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self._loop.time() + delay, callback, *args)
+
+    def call_at(self, when, callback, *args):
+        if self._ticker is None:
+            # Idle, no timers to keep in place.
+            self._tick = self._current_tick()
+            self._ticker = self._loop.call_at(
+                self._tick_time(self._tick + 1), self._on_tick)
+
+        tick = math.ceil((when - self._origin) / self._resolution)
+        handle = TimerHandle(self, when, max(tick, self._tick + 1), callback,
+                             args)
+        self._insert(handle)
+        self._count += 1
+        return handle
+
+    async def sleep(self, delay, result=None):
+        future = self._loop.create_future()
+        handle = self.call_later(delay, _set_result_unless_cancelled, future,
+                                 result)
+        try:
+            return await future
+        finally:
+            handle.cancel()
+
+    async def timer(self, x, cb):
+        # Same as timer() of async2.py: cb is called with the future done
+        # after x seconds.
+        future = self._loop.create_future()
+        future.add_done_callback(cb)
+        handle = self.call_later(x, _set_result_unless_cancelled, future,
+                                 None)
+        try:
+            await future
+        finally:
+            handle.cancel()
+
+    def close(self):
+        # Cancel all the timers.
+        for wheel in self._wheels:
+            for slot in wheel:
+                for handle in list(slot):
+                    handle.cancel()
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+
+    def _current_tick(self):
+        return int((self._loop.time() - self._origin) / self._resolution)
+
+    def _tick_time(self, tick):
+        return self._origin + tick * self._resolution
+
+    def _insert(self, handle):
+        ticks = handle._tick - self._tick
+        if ticks > self._max_ticks:
+            # Too far, keep it in the last wheel and insert it again once
+            # it's cascaded.
+            ticks = self._max_ticks
+            target = self._tick + ticks
+        else:
+            target = handle._tick
+
+        level = 0
+        while level < self._levels - 1 and ticks >> (self._bits *
+                                                     (level + 1)):
+            level += 1
+        slot = self._wheels[level][
+            (target >> (self._bits * level)) & self._mask]
+        slot[handle] = None
+        handle._slot = slot
+
+    def _on_tick(self):
+        self._ticker = None
+        target = self._current_tick()
+        while self._tick < target and self._count:
+            self._advance()
+
+        if self._count:
+            self._ticker = self._loop.call_at(
+                self._tick_time(self._tick + 1), self._on_tick)
+
+    def _advance(self):
+        self._tick += 1
+        tick = self._tick
+
+        # When a wheel completes a turn, move the timers of the next slot of
+        # the wheel above down to the lower wheels.
+        index = tick & self._mask
+        level = 1
+        while index == 0 and level < self._levels:
+            index = (tick >> (self._bits * level)) & self._mask
+            wheel = self._wheels[level]
+            slot = wheel[index]
+            if slot:
+                wheel[index] = {}
+                for handle in slot:
+                    self._insert(handle)
+            level += 1
+
+        wheel = self._wheels[0]
+        index = tick & self._mask
+        slot = wheel[index]
+        if not slot:
+            return
+        wheel[index] = {}
+        for handle in list(slot):
+            # A callback may cancel the timers after it.
+            if handle._cancelled:
+                continue
+            handle._slot = None
+            self._count -= 1
+            callback, args = handle._callback, handle._args
+            handle._callback = handle._args = None
+            try:
+                callback(*args)
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except BaseException as exc:
+                self._loop.call_exception_handler({
+                    'message': 'Exception in timer callback {!r}'.format(
+                        callback),
+                    'exception': exc,
+                })
+
+
+def _set_result_unless_cancelled(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+async def main(loop):
+    wheel = TimingWheel(loop, resolution=0.01)
+    wheel.call_later(1, print, 'Fired after 1 s')
+    cancelled = wheel.call_later(1, print, 'Never')
+    cancelled.cancel()
+    await wheel.timer(2, lambda futu: print('Done'))
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(loop))